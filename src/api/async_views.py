@@ -0,0 +1,116 @@
+from django.http import HttpResponse, HttpRequest, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+import json
+from .decorators import authentication_required, require_http_methods
+from .timing import phase
+from .interfaces import cases, stats, cache
+from .views import period_parameters, pop_stream, post_case, time_range
+
+# Async versions of the views in views.py that read cases and statistics. They are used instead
+# of those when ASYNC_VIEWS is set, see api/urls.py.
+
+
+@authentication_required
+@require_http_methods({"GET", "POST"})
+async def case(request: HttpRequest) -> HttpResponse:
+    """
+    GET: Returns all cases that match the query parameters. With stream=true the response is
+    streamed while the cases are read from the database.
+    POST: Creates a new case based on data passed in the request body.
+    """
+    if request.method == "GET":
+        params = request.GET.dict()
+        try:
+            if pop_stream(params):
+                # An async iterator is read to the end before anything is sent unless the
+                # response is sent asynchronously, which is only the case under ASGI
+                if isinstance(request, ASGIRequest):
+                    cases_json_chunks = await cases.astream_cases(params)
+                else:
+                    cases_json_chunks = await sync_to_async(cases.stream_cases)(params)
+                return StreamingHttpResponse(cases_json_chunks, content_type="application/json",
+                                             status=200)
+
+            cases_json = await cases.aget_cases_json(params)
+        except ValueError as error:
+            return HttpResponse(status=400, content=str(error))
+
+        return HttpResponse(cases_json, content_type="application/json", status=200)
+
+    elif request.method == "POST":
+        return await sync_to_async(post_case)(request)
+
+
+@require_http_methods({"GET"})
+async def stats_per_medium(request: HttpRequest) -> HttpResponse:
+    """
+    Returns the number of cases per medium for a given time range as a JSON array.
+    """
+    params = request.GET.dict()
+    try:
+        start_time, end_time = time_range(params)
+
+    except KeyError as error:
+        return HttpResponse(status=400, content="Key does not exist: " + str(error))
+
+    except ValueError as error:
+        return HttpResponse(status=400, content=str(error))
+
+    parameters = {"start_time": start_time, "end_time": end_time}
+    with phase("query"):
+        medium_count = await cache.acached_stats(
+            "medium", parameters, lambda: stats.aget_medium_count(start_time, end_time))
+    with phase("serialize"):
+        medium_stats = json.dumps(medium_count)
+    return HttpResponse(medium_stats, content_type="application/json", status=200)
+
+
+@require_http_methods({"GET"})
+async def stats_per_category(request: HttpRequest) -> HttpResponse:
+    """
+    Returns the statistics for cases per category and subcategory for a given time range a JSON
+    array.
+    """
+    params = request.GET.dict()
+    try:
+        start_time, end_time = time_range(params)
+
+    except KeyError as error:
+        return HttpResponse(status=400, content="Key does not exist: " + str(error))
+
+    except ValueError as error:
+        return HttpResponse(status=400, content=str(error))
+
+    parameters = {"start_time": start_time, "end_time": end_time}
+    with phase("query"):
+        category_stats = await cache.acached_stats(
+            "category", parameters, lambda: stats.aget_stats_per_category(start_time, end_time))
+    with phase("serialize"):
+        stats_per_category = json.dumps(category_stats)
+    return HttpResponse(stats_per_category, content_type="application/json", status=200)
+
+
+@require_http_methods({"GET"})
+async def stats_per_period(request: HttpRequest) -> HttpResponse:
+    """
+    Returns the number of cases per time period for a given interval as a JSON array.
+    """
+    params = request.GET.dict()
+    try:
+        start_time, delta, time_periods = period_parameters(params)
+        parameters = {"start_time": start_time, "delta": delta, "time_periods": time_periods}
+        with phase("query"):
+            periods = await cache.acached_stats(
+                "periods", parameters,
+                lambda: stats.aget_stats_per_period(start_time, delta, time_periods))
+
+    except KeyError as error:
+        return HttpResponse(status=400, content="Key does not exist: " + str(error))
+
+    except ValueError as error:
+        return HttpResponse(status=400, content=str(error))
+
+    with phase("serialize"):
+        stats_per_day = json.dumps(periods)
+    return HttpResponse(stats_per_day, content_type="application/json", status=200)
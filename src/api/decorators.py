@@ -1,6 +1,8 @@
 from datetime import datetime, timedelta
 from functools import wraps
-from django.http import HttpResponse
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.utils.log import log_response
 
 from api.interfaces import cases
 
@@ -10,9 +12,48 @@ def user_is_authenticated(user):
 
 
 def authentication_required(view_func):
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            # The user is loaded from the database the first time it is used, which can not be
+            # done directly in async code
+            if not await sync_to_async(user_is_authenticated)(request.user):
+                return HttpResponse(status=401)
+            return await view_func(request, *args, **kwargs)
+        return async_wrapper
+
     @wraps(view_func)
     def wrapper(request, *args, **kwargs):
         if not user_is_authenticated(request.user):
             return HttpResponse(status=401)
         return view_func(request, *args, **kwargs)
     return wrapper
+
+
+def require_http_methods(request_method_list):
+    """
+    Same as django.views.decorators.http.require_http_methods, but also for async views, which
+    Django's decorator does not support before Django 5.0.
+    """
+    def decorator(view_func):
+        def not_allowed(request):
+            response = HttpResponseNotAllowed(request_method_list)
+            log_response(f"Method Not Allowed ({request.method}): {request.path}",
+                         response=response, request=request)
+            return response
+
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method not in request_method_list:
+                    return not_allowed(request)
+                return await view_func(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in request_method_list:
+                return not_allowed(request)
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
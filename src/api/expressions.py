@@ -0,0 +1,97 @@
+from django.db import NotSupportedError
+from django.db.models import BigIntegerField, FloatField, Func, TextField
+from django.db.models.functions import Cast, JSONObject
+
+
+class EpochMicroseconds(Func):
+    """
+    The number of microseconds since the Unix epoch of a datetime expression, as an integer.
+    Supported on SQLite and PostgreSQL.
+    """
+    arity = 1
+    output_field = BigIntegerField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f"EpochMicroseconds is not supported on {connection.vendor}.")
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # SQLite stores datetimes as "YYYY-MM-DD HH:MM:SS[.ffffff]" text in UTC. strftime('%s')
+        # gives whole seconds and the microseconds are read from the text, if there are any.
+        # Each "%" is doubled twice, once for the template and once for the query parameters.
+        template = ("(CAST(strftime('%%%%s', %(expressions)s) AS INTEGER) * 1000000"
+                    " + CAST(substr(%(expressions)s, 21, 6) AS INTEGER))")
+        sql, params = super().as_sql(compiler, connection, template=template, **extra_context)
+        return sql, params * 2
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        template = "CAST(ROUND(EXTRACT(EPOCH FROM %(expressions)s) * 1000000) AS BIGINT)"
+        return super().as_sql(compiler, connection, template=template, **extra_context)
+
+
+class DurationSeconds(Func):
+    """
+    The number of seconds in a duration expression, as a float like timedelta.total_seconds().
+    Supported on SQLite and PostgreSQL.
+    """
+    arity = 1
+    output_field = FloatField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f"DurationSeconds is not supported on {connection.vendor}.")
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # SQLite stores durations as integer microseconds
+        template = "(%(expressions)s / 1000000.0)"
+        return super().as_sql(compiler, connection, template=template, **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        template = "CAST(EXTRACT(EPOCH FROM %(expressions)s) AS DOUBLE PRECISION)"
+        return super().as_sql(compiler, connection, template=template, **extra_context)
+
+
+class IsoTimestamp(Func):
+    """
+    A datetime expression as an ISO 8601 string in UTC, formatted like DjangoJSONEncoder does:
+    with milliseconds only if there is a fraction of a second, and "Z" as the time zone.
+    Supported on SQLite and PostgreSQL.
+    """
+    arity = 1
+    output_field = TextField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f"IsoTimestamp is not supported on {connection.vendor}.")
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # SQLite stores datetimes as "YYYY-MM-DD HH:MM:SS[.ffffff]" text in UTC, so the date, the
+        # time and the first three digits of the microseconds are cut out of the text.
+        template = ("(substr(%(expressions)s, 1, 10) || 'T' || substr(%(expressions)s, 12,"
+                    " CASE WHEN length(%(expressions)s) > 19 THEN 12 ELSE 8 END) || 'Z')")
+        sql, params = super().as_sql(compiler, connection, template=template, **extra_context)
+        return sql, params * 3
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        template = ("(TO_CHAR(%(expressions)s AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS')"
+                    " || CASE WHEN TO_CHAR(%(expressions)s, 'US') = '000000'"
+                    " THEN '' ELSE TO_CHAR(%(expressions)s AT TIME ZONE 'UTC', '.MS') END"
+                    " || 'Z')")
+        sql, params = super().as_sql(compiler, connection, template=template, **extra_context)
+        return sql, params * 3
+
+
+class JSONText(JSONObject):
+    """
+    Same as JSONObject, but the object is returned as JSON text instead of being decoded, with its
+    keys in the given order. Supported on SQLite and PostgreSQL.
+    """
+    output_field = TextField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        # JSONObject uses JSONB_BUILD_OBJECT, which orders the keys by length
+        copy = self.copy()
+        copy.set_source_expressions([
+            Cast(expression, TextField()) if index % 2 == 0 else expression
+            for index, expression in enumerate(copy.get_source_expressions())
+        ])
+        template = "CAST(%(function)s(%(expressions)s) AS TEXT)"
+        return Func.as_sql(copy, compiler, connection, function="JSON_BUILD_OBJECT",
+                           template=template, **extra_context)
@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict
+import hashlib
+import json
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from api.metrics import record_stats_cache
+
+DATA_VERSION_KEY = "case-data-version"
+CATEGORY_VERSION_KEY = "category-version"
+HITS_KEY = "stats-cache-hits"
+MISSES_KEY = "stats-cache-misses"
+
+
+def get_data_version() -> int:
+    """
+    Returns the current case data version, which changes every time cases or categories change.
+    """
+    return get_version(DATA_VERSION_KEY)
+
+
+def bump_data_version() -> None:
+    """
+    Changes the case data version, so results cached for earlier versions are no longer used.
+    The version is changed both right away and when the current transaction is committed, since
+    results computed from the old data may be cached in between.
+    """
+    bump_version(DATA_VERSION_KEY)
+
+
+def get_category_version() -> int:
+    """
+    Returns the current category version, which changes every time categories change.
+    """
+    return get_version(CATEGORY_VERSION_KEY)
+
+
+def bump_category_version() -> None:
+    """
+    Changes the category version, in the same way as bump_data_version().
+    """
+    bump_version(CATEGORY_VERSION_KEY)
+
+
+def get_version(key: str) -> int:
+    """
+    Returns the version stored under the given key.
+    """
+    version = cache.get(key)
+    if version is None:
+        # The version is started from the current time, so a version that has been evicted from
+        # the cache is not reused.
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key: str) -> None:
+    """
+    Changes the version stored under the given key right away and when the current transaction
+    is committed.
+    """
+    increment_version(key)
+    transaction.on_commit(lambda: increment_version(key))
+
+
+def increment_version(key: str) -> None:
+    """
+    Increments the version stored under the given key.
+    """
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The version is not in the cache, either it was never set or it has been evicted
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def cached_stats(name: str, parameters: Dict[str, Any], compute: Callable[[], Any]) -> Any:
+    """
+    Returns the cached result for the statistics with the given name and parameters, or computes
+    it with compute() and caches it if there is none for the current case data version. With
+    STATS_CACHE_TIMEOUT=0 the result is always computed.
+    """
+    if settings.STATS_CACHE_TIMEOUT <= 0:
+        count(MISSES_KEY)
+        return compute()
+
+    key = stats_key(name, parameters)
+    result = cache.get(key)
+    if result is None:
+        count(MISSES_KEY)
+        result = compute()
+        cache.set(key, result, timeout=settings.STATS_CACHE_TIMEOUT)
+    else:
+        count(HITS_KEY)
+
+    return result
+
+
+async def acached_stats(name: str, parameters: Dict[str, Any],
+                        compute: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Async version of cached_stats(), where compute() returns an awaitable.
+    """
+    if settings.STATS_CACHE_TIMEOUT <= 0:
+        await sync_to_async(count)(MISSES_KEY)
+        return await compute()
+
+    key = await sync_to_async(stats_key)(name, parameters)
+    result = await cache.aget(key)
+    if result is None:
+        await sync_to_async(count)(MISSES_KEY)
+        result = await compute()
+        await cache.aset(key, result, timeout=settings.STATS_CACHE_TIMEOUT)
+    else:
+        await sync_to_async(count)(HITS_KEY)
+
+    return result
+
+
+def stats_key(name: str, parameters: Dict[str, Any]) -> str:
+    """
+    Returns the cache key of the statistics with the given name and parameters for the current
+    case data version.
+    """
+    return f"stats:{name}:{get_data_version()}:{normalize(parameters)}"
+
+
+def normalize(parameters: Dict[str, Any]) -> str:
+    """
+    Returns a hash that is the same for equal parameters, regardless of the order of the keys.
+    Datetimes are kept in the time zone they were given in, since responses such as the periods
+    repeat them as given.
+    """
+    normalized = {}
+    for key, value in parameters.items():
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, timedelta):
+            value = value.total_seconds()
+        normalized[key] = value
+
+    parameters_json = json.dumps(normalized, sort_keys=True)
+    return hashlib.sha256(parameters_json.encode()).hexdigest()
+
+
+def count(key: str) -> None:
+    """
+    Increments one of the hit and miss counters.
+    """
+    record_stats_cache(key == HITS_KEY)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_cache_status() -> Dict[str, int]:
+    """
+    Returns the number of cache hits and misses for statistics, and the current data version.
+    """
+    return {
+        "hits": cache.get(HITS_KEY, 0),
+        "misses": cache.get(MISSES_KEY, 0),
+        "data_version": get_data_version(),
+    }
@@ -1,16 +1,269 @@
-from datetime import timedelta, datetime, timezone
-from typing import Any, Dict, List
-from django.db.models import Q
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import timedelta, datetime
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+import csv
+import hashlib
+import json
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q, QuerySet, Value
+from django.utils.timezone import now
+from api.expressions import DurationSeconds, IsoTimestamp, JSONText
 from api.models import Category, Case
+from api.timing import phase
+from . import rollup
+from .cache import bump_category_version, bump_data_version, get_category_version
+
+
+CASES_CHUNK_SIZE = 2000
+
+MAX_BULK_CASES = 1000
+BULK_CREATE_BATCH_SIZE = 500
+# Number of cases each statement of a bulk update or delete acts on, so their ids stay within the
+# 999 query parameters that older SQLite versions allow
+BULK_CHANGE_BATCH_SIZE = 500
+
+# The fields needed to update the daily totals when cases are changed or deleted in bulk
+ROLLUP_FIELDS = ["id", "created_at", "category_id", "medium", "customer_time", "additional_time",
+                 "form_fill_time"]
+
+FILTER_PARAMS = {"id", "case-id", "time-start", "time-end", "category-id", "medium"}
+
+EXPORT_FORMATS = {"ndjson", "csv"}
+
+EXPORT_COLUMNS = ["id", "case_id", "notes", "medium", "customer_time", "additional_time",
+                  "form_fill_time", "created_at", "edited_at", "category_id", "category_name",
+                  "parent_category_name"]
+
+# How the database computes each key of a case in responses, with durations in seconds and
+# timestamps formatted like DjangoJSONEncoder does
+CASE_JSON_FIELDS = {
+    "id": F("id"),
+    "case_id": F("case_id"),
+    "notes": F("notes"),
+    "medium": F("medium"),
+    "customer_time": DurationSeconds("customer_time"),
+    "additional_time": DurationSeconds("additional_time"),
+    "form_fill_time": DurationSeconds("form_fill_time"),
+    "created_at": IsoTimestamp("created_at"),
+    "edited_at": IsoTimestamp("edited_at"),
+    "category_id": F("category_id"),
+    "created_by_id": F("created_by_id"),
+    "category_name": F("category__name"),
+    "parent_category_name": F("category__parent__name"),
+}
+
+CASE_COLUMNS = ["id", "notes", "medium", "customer_time", "additional_time", "form_fill_time",
+                "created_at", "edited_at", "case_id", "category_id", "created_by_id",
+                "category_name", "parent_category_name"]
+
+
+def get_cases_json(parameters: Dict[str, Any]) -> str:
+    """
+    Returns all cases that match the given parameters as a JSON object.
+    """
+    cases_query, per_page = query_cases(parameters)
+    with phase("query"):
+        rows = list(cases_query)
+    with phase("serialize"):
+        return cases_page(rows, per_page)
+
+
+async def aget_cases_json(parameters: Dict[str, Any]) -> str:
+    """
+    Async version of get_cases_json().
+    """
+    # Checking the parameters may look up categories
+    cases_query, per_page = await sync_to_async(query_cases)(parameters)
+    with phase("query"):
+        rows = await alist(cases_query)
+    with phase("serialize"):
+        return cases_page(rows, per_page)
+
+
+def cases_page(rows: List[Dict[str, Any]], per_page: int) -> str:
+    """
+    Returns the response of get_cases_json() for the rows read from the query of query_cases().
+    The cases are already JSON, so they are joined into the response as they are.
+    """
+    has_more = per_page != 0 and len(rows) == per_page + 1
+
+    if has_more:
+        rows = rows[:-1]
+        next_cursor = encode_cursor(rows[-1])
+    else:
+        next_cursor = None
+
+    page = json.dumps({
+        "result_count": len(rows),
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+    })
+    return page[:-1] + ', "cases": [' + ", ".join(row["case"] for row in rows) + "]}"
+
+
+async def alist(query: QuerySet) -> List:
+    """
+    Returns the results of the given query as a list, read without blocking the event loop.
+    """
+    return [row async for row in query]
+
+
+def stream_cases(parameters: Dict[str, Any], chunk_size: int = CASES_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Returns the same JSON document as get_cases_json() for the given parameters, but as an
+    iterator of string chunks. Cases are read from the database chunk_size at a time, so memory
+    use does not grow with the number of cases. Raises ValueError right away if the parameters
+    are invalid.
+    """
+    cases_query, per_page = query_cases(parameters)
+    return stream_cases_json(cases_query, per_page, chunk_size)
+
+
+async def astream_cases(parameters: Dict[str, Any],
+                        chunk_size: int = CASES_CHUNK_SIZE) -> AsyncIterator[str]:
+    """
+    Async version of stream_cases(), which returns an async iterator.
+    """
+    cases_query, per_page = await sync_to_async(query_cases)(parameters)
+    return astream_cases_json(cases_query, per_page, chunk_size)
+
+
+def stream_cases_json(cases_query: QuerySet, per_page: int, chunk_size: int) -> Iterator[str]:
+    """
+    Writes the cases in the given query as a JSON object one chunk at a time. The "cases" list is
+    written first since "result_count" and "has_more" are not known until all cases are read.
+    """
+    writer = CasesJsonWriter(per_page, chunk_size)
+    yield writer.start()
+    for row in cases_query.iterator(chunk_size=chunk_size):
+        if not writer.add(row):
+            break
+        if writer.is_chunk_full():
+            yield writer.take_chunk()
+    yield writer.end()
+
+
+async def astream_cases_json(cases_query: QuerySet, per_page: int,
+                             chunk_size: int) -> AsyncIterator[str]:
+    """
+    Async version of stream_cases_json().
+    """
+    writer = CasesJsonWriter(per_page, chunk_size)
+    yield writer.start()
+    async for row in cases_query.aiterator(chunk_size=chunk_size):
+        if not writer.add(row):
+            break
+        if writer.is_chunk_full():
+            yield writer.take_chunk()
+    yield writer.end()
+
+
+class CasesJsonWriter:
+    """
+    Writes cases as the JSON object returned by get_cases_json(), a chunk of cases at a time.
+    """
+    def __init__(self, per_page: int, chunk_size: int) -> None:
+        self.per_page = per_page
+        self.chunk_size = chunk_size
+        self.result_count = 0
+        self.has_more = False
+        self.last_row = None
+        self.chunk = []
+
+    def start(self) -> str:
+        return '{"cases": ['
+
+    def add(self, row: Dict[str, Any]) -> bool:
+        """
+        Adds a case, read as a row from the query of query_cases(), to the current chunk. Returns
+        False if the page is already full, in which case no more cases should be added.
+        """
+        if self.per_page != 0 and self.result_count == self.per_page:
+            self.has_more = True
+            return False
+
+        separator = ", " if self.result_count > 0 else ""
+        self.chunk.append(separator + row["case"])
+        self.result_count += 1
+        self.last_row = row
+        return True
+
+    def is_chunk_full(self) -> bool:
+        return len(self.chunk) == self.chunk_size
+
+    def take_chunk(self) -> str:
+        chunk = "".join(self.chunk)
+        self.chunk = []
+        return chunk
+
+    def end(self) -> str:
+        """
+        Returns the rest of the cases and the end of the JSON object.
+        """
+        next_cursor = encode_cursor(self.last_row) if self.has_more else None
+        return self.take_chunk() + "], " + json.dumps({
+            "result_count": self.result_count,
+            "has_more": self.has_more,
+            "next_cursor": next_cursor,
+        })[1:]
+
+
+def query_cases(parameters: Dict[str, Any]) -> Tuple[QuerySet, int]:
+    """
+    Returns a query for the cases that match the given parameters, together with the number of
+    cases per page (0 if pages are disabled). When pages are enabled the query includes one case
+    more than the page size, which tells if there are more cases after the page. Each case is read
+    as a row with the case as JSON ("case"), and its id and creation time for cursors. Raises
+    ValueError if the parameters are invalid.
+    """
+    valid_params = FILTER_PARAMS | {"per-page", "page", "cursor"}
+
+    for param in parameters:
+        if param not in valid_params:
+            raise ValueError(f"Unexpected parameter: {param}={parameters[param]}.")
+
+    query = filter_query(parameters)
+
+    per_page = int(parameters.get("per-page", 100))
+    page = int(parameters.get("page", 1))
+    start = per_page * (page - 1)
+    end = per_page * page
 
+    if "cursor" in parameters:
+        if "page" in parameters:
+            raise ValueError("Parameters cursor and page can not be used together.")
+        # An empty cursor requests the first page
+        if parameters["cursor"]:
+            query &= cursor_query(parameters["cursor"])
 
-def get_cases(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    matching_cases = Case.objects.filter(query)
+
+    if per_page != 0:
+        matching_cases = matching_cases[start:end + 1]
+
+    # values() rather than values_list(), whose aiterator() runs the query synchronously in
+    # Django 4.2
+    return matching_cases.values("id", "created_at", case=case_json(CASE_COLUMNS)), per_page
+
+
+def case_json(columns: List[str]) -> JSONText:
     """
-    Returns all cases that match the given parameters.
+    Returns an expression for the given keys of a case (see CASE_JSON_FIELDS) as a JSON object,
+    so cases can be written to responses without being converted one by one.
     """
-    valid_params = {"id", "case-id", "time-start", "time-end", "category-id", "medium", "per-page",
-                    "page"}
+    return JSONText(**{column: CASE_JSON_FIELDS[column] for column in columns})
+
 
+def filter_query(parameters: Dict[str, Any]) -> Q:
+    """
+    Returns a query matching the cases selected by the filter parameters (see FILTER_PARAMS)
+    among the given parameters. Raises ValueError if the given category does not exist.
+    """
     params = {
         "id": "id",
         "case-id": "case_id",
@@ -19,10 +272,6 @@ def get_cases(parameters: Dict[str, Any]) -> Dict[str, Any]:
         "medium": "medium",
     }
 
-    for param in parameters:
-        if param not in valid_params:
-            raise ValueError(f"Unexpected parameter: {param}={parameters[param]}.")
-
     # Builds a query using dict comprehension, which is basically like a mapping function. It
     # creates a set of queries from the key-value pairs in parameters with the individual queries
     # looking like "params[key]=value". Only the key-value pairs where key is in params are
@@ -30,53 +279,139 @@ def get_cases(parameters: Dict[str, Any]) -> Dict[str, Any]:
     query = Q(**{params[k]: v for k, v in parameters.items() if k in params.keys()})
 
     if "category-id" in parameters:
-        try:
-            category = Category.objects.get(id=parameters["category-id"])
-        except Category.DoesNotExist:
+        if not category_exists(parameters["category-id"]):
             raise ValueError(f"Category id={parameters['category-id']} does not exist")
-        query &= Q(category=category)
+        query &= Q(category_id=int(parameters["category-id"]))
 
-    per_page = int(parameters.get("per-page", 100))
-    page = int(parameters.get("page", 1))
-    start = per_page * (page - 1)
-    end = per_page * page
+    return query
 
-    if per_page != 0:
-        result = list(Case.objects.filter(query)[start:end + 1].values())
-        has_more = len(result) == per_page + 1
+
+def cases_with_category_names(query: Q) -> QuerySet:
+    """
+    Returns the cases that match the given query, annotated with category_name and
+    parent_category_name. The names are joined in by the database, so the number of queries does
+    not depend on the number of cases.
+    """
+    return Case.objects.filter(query).annotate(
+        category_name=F("category__name"),
+        parent_category_name=F("category__parent__name"),
+    )
+
+
+def export_cases(parameters: Dict[str, Any], chunk_size: int = CASES_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Returns all cases that match the filter parameters as an iterator of NDJSON or CSV chunks,
+    depending on the "format" parameter. Cases are read through a server-side cursor (where the
+    database supports it) chunk_size at a time, so memory use does not grow with the number of
+    cases. Raises ValueError right away if the parameters are invalid.
+    """
+    valid_params = FILTER_PARAMS | {"format"}
+
+    for param in parameters:
+        if param not in valid_params:
+            raise ValueError(f"Unexpected parameter: {param}={parameters[param]}.")
+
+    export_format = parameters.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Invalid format: {export_format}.")
+
+    query = filter_query(parameters)
+
+    if export_format == "csv":
+        matching_cases = cases_with_category_names(query).values(*EXPORT_COLUMNS)
+        lines = export_csv_lines(matching_cases, chunk_size)
     else:
-        result = list(Case.objects.filter(query).values())
-        has_more = False
+        matching_cases = Case.objects.filter(query).values_list(case_json(EXPORT_COLUMNS),
+                                                                flat=True)
+        lines = export_ndjson_lines(matching_cases, chunk_size)
 
-    for case in result:
-        # Change all datetimes to seconds and add category name
-        keys = ["additional_time", "form_fill_time", "customer_time"]
-        try:
-            category = Category.objects.get(id=case["category_id"])
-            if category.parent is not None:
-                case["parent_category_name"] = category.parent.name
-            else:
-                case["parent_category_name"] = None
-            case["category_name"] = category.name
-        except Category.DoesNotExist:
-            case["category_name"] = None
-            case["parent_category_name"] = None
-
-        for key in keys:
-            if case[key] is not None:
-                case[key] = case[key].total_seconds()
-
-    result_count = len(result)
+    return join_chunks(lines, chunk_size)
 
-    if has_more:
-        result_count -= 1
-        result = result[:-1]
 
-    return {
-        "result_count": result_count,
-        "has_more": has_more,
-        "cases": result,
-    }
+def export_ndjson_lines(cases_query: QuerySet, chunk_size: int) -> Iterator[str]:
+    """
+    Yields one JSON object per line for each case, read as JSON from the given query.
+    """
+    for case in cases_query.iterator(chunk_size=chunk_size):
+        yield case + "\n"
+
+
+def export_csv_lines(cases_query: QuerySet, chunk_size: int) -> Iterator[str]:
+    """
+    Yields a header line followed by one CSV line for each case in the given query.
+    """
+    # The writer returns each line instead of writing it anywhere
+    writer = csv.writer(LineBuffer())
+
+    yield writer.writerow(EXPORT_COLUMNS)
+    for case in cases_query.iterator(chunk_size=chunk_size):
+        format_case(case)
+        for key in ["created_at", "edited_at"]:
+            case[key] = case[key].isoformat()
+        yield writer.writerow([case[column] for column in EXPORT_COLUMNS])
+
+
+class LineBuffer:
+    """
+    A file-like object that returns what is written to it, used to get lines from csv.writer.
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def join_chunks(lines: Iterator[str], chunk_size: int) -> Iterator[str]:
+    """
+    Joins the given lines into chunks of chunk_size lines, so a streamed response is not written
+    one line at a time.
+    """
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield "".join(chunk)
+            chunk = []
+
+    if chunk:
+        yield "".join(chunk)
+
+
+def format_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Changes all durations of a case read with values() to seconds. Returns the case.
+    """
+    keys = ["additional_time", "form_fill_time", "customer_time"]
+    for key in keys:
+        if case[key] is not None:
+            case[key] = case[key].total_seconds()
+
+    return case
+
+
+def encode_cursor(case: Dict[str, Any]) -> str:
+    """
+    Returns an opaque cursor pointing at the position right after the given case in the
+    (-created_at, -id) ordering used when listing cases.
+    """
+    position = json.dumps([case["created_at"].isoformat(), case["id"]])
+    return urlsafe_b64encode(position.encode()).decode()
+
+
+def cursor_query(cursor: str) -> Q:
+    """
+    Returns a query matching the cases that come after the given cursor in the
+    (-created_at, -id) ordering. Raises ValueError if the cursor is invalid.
+    """
+    try:
+        created_at_iso, id = json.loads(urlsafe_b64decode(cursor.encode()))
+        created_at = datetime.fromisoformat(created_at_iso)
+        id = int(id)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor}.")
+
+    # The created_at__lte condition on its own lets the (created_at, id) index be searched from the
+    # cursor instead of scanned from the newest case.
+    return Q(created_at__lte=created_at) & (Q(created_at__lt=created_at) | Q(id__lt=id))
 
 
 def validate_case(dictionary: Dict) -> None:
@@ -91,40 +426,238 @@ def validate_case(dictionary: Dict) -> None:
             raise ValueError(f"Unexpected key: {key}.")
 
 
-def create_case(dictionary: Dict) -> Case:
+def create_case(dictionary: Dict, user: Optional[User] = None) -> Case:
     """
-    Creates a new case and adds it to the database. Raises ValueError if
-    the data is incorrect. Returns the new case.
+    Creates a new case created by the given user and adds it to the database with a single
+    INSERT. Raises ValueError if the data is incorrect. Returns the new case.
     """
     validate_case(dictionary)
-    case = Case()
+    case = Case(created_by=user)
     fill_case(case, dictionary)
+    with transaction.atomic():
+        case.save()
+        rollup.add_case(case)
+        bump_data_version()
 
     return case
 
 
-def update_case(case_id: int, dictionary: Dict) -> Case:
+def update_case(case_id: int, dictionary: Dict, user: Optional[User] = None) -> Case:
     """
-    Updates a case with a given id. Raises Case.DoesNotExist if wrong case_id,
-    and ValueError if the dictionary contains bad data. Returns the edited case.
+    Updates a case with a given id and records it as edited by the given user. Only the given
+    fields are written. Raises Case.DoesNotExist if wrong case_id, and ValueError if the
+    dictionary contains bad data. Returns the edited case.
     """
     validate_case(dictionary)
-    case = Case.objects.get(id=case_id)
-    fill_case(case, dictionary)
+    with transaction.atomic():
+        case = Case.objects.select_for_update().get(id=case_id)
+        old_key, old_totals = rollup.rollup_key(case), rollup.case_totals(case)
+        fill_case(case, dictionary)
+        case.save(update_fields=[*dictionary, "edited_at"])
+
+        if user is not None:
+            # Unlike edited_by.add(), this does not first check if the user is already recorded
+            EditedBy = Case.edited_by.through
+            EditedBy.objects.bulk_create([EditedBy(case_id=case.id, user_id=user.id)],
+                                         ignore_conflicts=True)
+
+        rollup.change_case(old_key, old_totals, case)
+        bump_data_version()
 
     return case
 
 
-def fill_case(case: Case, dictionary: Dict) -> None:
+def create_cases(dictionaries: Any, user: Optional[User] = None) -> List[Case]:
+    """
+    Creates a case for each dictionary in the given list and adds them all to the database in
+    one transaction, created by the given user. Nothing is created if any dictionary is invalid,
+    instead BulkCaseError is raised with the errors of every invalid dictionary. Raises ValueError
+    if the given value is not a list of at most MAX_BULK_CASES items. Returns the new cases.
+    """
+    if not isinstance(dictionaries, list):
+        raise ValueError("Expected a list of cases.")
+    if len(dictionaries) > MAX_BULK_CASES:
+        raise ValueError(f"At most {MAX_BULK_CASES} cases can be created at once.")
+
+    # All categories are looked up at once instead of once per case
+    category_ids = set()
+    for dictionary in dictionaries:
+        if isinstance(dictionary, dict) and dictionary.get("category_id") is not None:
+            try:
+                category_ids.add(parse_category_id(dictionary["category_id"]))
+            except ValueError:
+                # Reported when the case is filled in below
+                pass
+    existing_category_ids = find_categories(category_ids)
+
+    new_cases = []
+    errors = {}
+    for index, dictionary in enumerate(dictionaries):
+        case = Case(created_by=user)
+        try:
+            if not isinstance(dictionary, dict):
+                raise ValueError("Expected a case object.")
+            validate_case(dictionary)
+            fill_case(case, dictionary, existing_category_ids)
+        except (ValueError, TypeError) as error:
+            errors[index] = str(error)
+        new_cases.append(case)
+
+    if errors:
+        raise BulkCaseError(errors)
+
+    with transaction.atomic():
+        Case.objects.bulk_create(new_cases, batch_size=BULK_CREATE_BATCH_SIZE)
+        rollup.add_cases(new_cases)
+        bump_data_version()
+
+    return new_cases
+
+
+class BulkCaseError(ValueError):
+    """
+    Raised when some of the cases given to a bulk operation are invalid. errors maps the index of
+    each invalid case to what is wrong with it.
+    """
+    def __init__(self, errors: Dict[int, str]) -> None:
+        super().__init__(f"{len(errors)} of the cases are invalid.")
+        self.errors = errors
+
+
+def update_cases(dictionary: Any, user: Optional[User] = None) -> int:
+    """
+    Makes the changes in dictionary["changes"] to every case selected by the dictionary (see
+    select_cases()) with one UPDATE per BULK_CHANGE_BATCH_SIZE cases, and records them as edited
+    by the given user. Only the ids of the cases are read. Raises ValueError if the dictionary is
+    invalid. Returns the number of updated cases.
+    """
+    validate_bulk_request(dictionary, {"changes"})
+    changes = dictionary.get("changes")
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError("Expected the changes to make.")
+    validate_case(changes)
+    changed_case = Case()
+    fill_case(changed_case, changes)
+    values = {key: getattr(changed_case, key) for key in changes}
+
+    with transaction.atomic():
+        batches = locked_batches(dictionary)
+        rollup.change_selected(batches, values)
+        edited_at = now()
+        updated_count = 0
+        for cases in batches:
+            if user is not None:
+                add_edited_by(cases, user)
+            updated_count += cases.update(edited_at=edited_at, **values)
+        bump_data_version()
+
+    return updated_count
+
+
+def delete_cases(dictionary: Any) -> int:
+    """
+    Deletes every case selected by the given dictionary (see select_cases()),
+    BULK_CHANGE_BATCH_SIZE cases at a time. Raises ValueError if the dictionary is invalid.
+    Returns the number of deleted cases.
+    """
+    validate_bulk_request(dictionary)
+    with transaction.atomic():
+        batches = locked_batches(dictionary)
+        rollup.add_selected(batches, sign=-1)
+        deleted_count = 0
+        for cases in batches:
+            # Also deletes or updates what refers to the cases, such as edited_by
+            deleted_count += cases.delete()[1].get(Case._meta.label, 0)
+        bump_data_version()
+
+    return deleted_count
+
+
+def locked_batches(dictionary: Dict) -> List[QuerySet]:
+    """
+    Locks the cases selected by the dictionary (see select_cases()) until the end of the
+    transaction and returns them as queries of at most BULK_CHANGE_BATCH_SIZE cases each, by id.
+    Every statement of a bulk update or delete then acts on exactly the locked cases, also when
+    cases that match the selection are added in the meantime. They are locked in order of id, so
+    that bulk operations on overlapping cases do not deadlock.
+    """
+    ids = list(select_cases(dictionary).select_for_update().values_list("id", flat=True))
+    return [Case.objects.filter(id__in=ids[start:start + BULK_CHANGE_BATCH_SIZE])
+            for start in range(0, len(ids), BULK_CHANGE_BATCH_SIZE)]
+
+
+def add_edited_by(cases: QuerySet, user: User) -> None:
+    """
+    Records the cases of the given query as edited by the given user with a single
+    INSERT ... SELECT, leaving out the cases that already are.
+    """
+    EditedBy = Case.edited_by.through
+    rows = cases.exclude(edited_by=user).order_by().annotate(
+        user_id=Value(user.id)).values_list("id", "user_id")
+    select_sql, params = rows.query.sql_with_params()
+    table = connection.ops.quote_name(EditedBy._meta.db_table)
+    columns = ", ".join(connection.ops.quote_name(EditedBy._meta.get_field(name).column)
+                        for name in ["case", "user"])
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {table} ({columns}) {select_sql}", params)
+
+
+def validate_bulk_request(dictionary: Any, extra_keys: Optional[Set[str]] = None) -> None:
+    """
+    Raises ValueError if the given request for a bulk update or delete is not a dictionary
+    with either ids or filter and the given extra keys.
+    """
+    if not isinstance(dictionary, dict):
+        raise ValueError("Expected an object with ids or filter.")
+    for key in dictionary:
+        if key not in {"ids", "filter"} | (extra_keys or set()):
+            raise ValueError(f"Unexpected key: {key}.")
+    if ("ids" in dictionary) == ("filter" in dictionary):
+        raise ValueError("Expected either ids or filter.")
+
+
+def select_cases(dictionary: Dict) -> QuerySet:
     """
-    Updates a given case with properties from a given dictionary.
-    Raises ValueError if dictionary values are not valid.
+    Returns the cases selected either by the list of at most MAX_BULK_CASES case ids in
+    dictionary["ids"], or by the filter parameters (see FILTER_PARAMS) in dictionary["filter"],
+    in order of id. At least one filter parameter is required, so all cases are never selected by
+    mistake. Raises ValueError if the ids or filter parameters are invalid.
+    """
+    if "ids" in dictionary:
+        ids = dictionary["ids"]
+        if not isinstance(ids, list) or not all(type(id) is int for id in ids):
+            raise ValueError("Expected ids to be a list of case ids.")
+        if len(ids) > MAX_BULK_CASES:
+            raise ValueError(f"At most {MAX_BULK_CASES} ids can be given at once.")
+        query = Q(id__in=ids)
+    else:
+        parameters = dictionary["filter"]
+        if not isinstance(parameters, dict) or not parameters:
+            raise ValueError("Expected at least one filter parameter.")
+        for param in parameters:
+            if param not in FILTER_PARAMS:
+                raise ValueError(f"Unexpected parameter: {param}={parameters[param]}.")
+        query = filter_query(parameters)
+
+    try:
+        return Case.objects.filter(query).order_by("id")
+    except ValidationError as error:
+        raise ValueError(" ".join(error.messages))
+
+
+def fill_case(case: Case, dictionary: Dict,
+              existing_category_ids: Optional[Set[int]] = None) -> None:
+    """
+    Updates a given case with properties from a given dictionary, without saving it.
+    Raises ValueError if dictionary values are not valid. If existing_category_ids is
+    given, the category id is checked against it instead of against all categories.
     """
     if "notes" in dictionary:
         case.notes = dictionary.get("notes")
 
     if "case_id" in dictionary:
-        case.case_id = dictionary.get("case_id")
+        # Checked here, so invalid values are found before any case is saved
+        case.case_id = Case._meta.get_field("case_id").get_prep_value(dictionary.get("case_id"))
 
     add_times(case, dictionary)
 
@@ -136,13 +669,17 @@ def fill_case(case: Case, dictionary: Dict) -> None:
             raise ValueError(f"Invalid medium: {medium}.")
 
     if "category_id" in dictionary:
-        try:
-            category = Category.objects.get(id=dictionary.get("category_id"))
-        except Category.DoesNotExist:
-            raise ValueError(f"Category with id {dictionary.get('category_id')} does not exist.")
+        category_id = dictionary.get("category_id")
+        if category_id is None:
+            exists = False
+        elif existing_category_ids is None:
+            exists = category_exists(category_id)
+        else:
+            exists = parse_category_id(category_id) in existing_category_ids
+        if not exists:
+            raise ValueError(f"Category with id {category_id} does not exist.")
 
-        case.category = category
-    case.save()
+        case.category_id = int(category_id)
 
 
 def add_times(case: Case, dictionary):
@@ -157,15 +694,107 @@ def add_times(case: Case, dictionary):
         case.form_fill_time = timedelta(seconds=dictionary["form_fill_time"] or 0)
 
 
+class CachedCategories(NamedTuple):
+    version: int
+    loaded_at: float
+    tree: List[Dict]
+    names: Dict[int, Tuple[str, Optional[int]]]
+    etag: str
+
+
+cached_categories: Optional[CachedCategories] = None
+
+
 def get_case_categories() -> List[Dict]:
     """
-    Returns all case categories.
+    Returns all case categories. The returned list is shared and must not be modified.
     """
+    return load_categories().tree
+
+
+def get_category_names() -> Dict[int, Tuple[str, Optional[int]]]:
+    """
+    Returns the name and parent id of every category by id. The returned dictionary is shared
+    and must not be modified.
+    """
+    return load_categories().names
+
+
+def get_categories_etag() -> str:
+    """
+    Returns a hash of all case categories, which changes when any category changes.
+    """
+    return load_categories().etag
+
+
+def category_exists(category_id: Any) -> bool:
+    """
+    Returns True if there is a category with the given id. Raises ValueError if the id is not an
+    integer.
+    """
+    category_id = parse_category_id(category_id)
+    if category_id in get_category_names():
+        return True
+
+    # The category may have been created by another process less than
+    # CATEGORY_CACHE_TIMEOUT seconds ago
+    return category_id in load_categories(force=True).names
+
+
+def parse_category_id(category_id: Any) -> int:
+    """
+    Returns the given category id as an integer. Raises ValueError if it is not an integer.
+    """
+    try:
+        return int(category_id)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid category id: {category_id}.")
+
+
+def find_categories(category_ids: Set[int]) -> Set[int]:
+    """
+    Returns the ids of the given category ids that belong to existing categories, with at most
+    one query for ids that are not among the cached categories.
+    """
+    names = get_category_names()
+    found = {category_id for category_id in category_ids if category_id in names}
+    missing = category_ids - found
+    if missing:
+        found.update(Category.objects.filter(id__in=missing).values_list("id", flat=True))
+    return found
+
+
+def load_categories(force: bool = False) -> CachedCategories:
+    """
+    Returns the categories cached by this process, after reading them from the database if they
+    have changed, are older than CATEGORY_CACHE_TIMEOUT seconds or if force is True. Changes are
+    seen right away when they are made in this process (through the Category signals) or when the
+    cache backend is shared between processes.
+    """
+    global cached_categories
+
+    version = get_category_version()
+    categories = cached_categories
+    if (force or categories is None or categories.version != version
+            or time.monotonic() - categories.loaded_at > settings.CATEGORY_CACHE_TIMEOUT):
+        categories = build_categories(version)
+        cached_categories = categories
+
+    return categories
+
+
+def build_categories(version: int) -> CachedCategories:
+    """
+    Reads all categories from the database and builds the category tree.
+    """
+    loaded_at = time.monotonic()
     categories = []
+    names = {}
     indexes = {}
     i = 0
     flat_categories = list(Category.objects.all().values())
     for category in flat_categories:
+        names[category["id"]] = (category["name"], category["parent_id"])
         if not category["parent_id"]:
             categories.append(
                 {"id": category["id"], "name": category["name"], "subcategories": []}
@@ -177,27 +806,26 @@ def get_case_categories() -> List[Dict]:
                 {"id": category["id"], "name": category["name"]}
             )
 
-    return categories
+    etag = hashlib.sha256(json.dumps(categories).encode()).hexdigest()
+    return CachedCategories(version, loaded_at, categories, names, etag)
 
 
-def delete_case(case_id: int) -> None:
+def clear_category_cache() -> None:
     """
-    Deletes a case with the given id.
+    Makes every process read the categories from the database again, after a category has
+    changed.
     """
-    case = Case.objects.get(id=case_id)
-    case.delete()
+    global cached_categories
+    cached_categories = None
+    bump_category_version()
 
 
-def remove_old_notes() -> None:
+def delete_case(case_id: int) -> None:
     """
-    Removes notes from cases older than 90 days.
+    Deletes a case with the given id.
     """
-    before_date = datetime.now(timezone.utc) - timedelta(days=90)
-    Case.objects.filter(
-        edited_at__lt=datetime(
-            year=before_date.year,
-            month=before_date.month,
-            day=before_date.day,
-            tzinfo=timezone.utc
-        )
-    ).update(notes=None)
+    with transaction.atomic():
+        case = Case.objects.select_for_update().get(id=case_id)
+        rollup.remove_case(case)
+        case.delete()
+        bump_data_version()
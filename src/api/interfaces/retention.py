@@ -0,0 +1,157 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Optional
+import os
+import socket
+import time
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from api.models import Case, TaskLease
+from .cache import bump_data_version
+
+NOTES_TASK = "remove-old-notes"
+NOTES_RETENTION_DAYS = 90
+# How long a process may hold the lease before another process may take over, in case the
+# process holding it has died.
+LEASE_DURATION = timedelta(hours=1)
+
+BatchCallback = Callable[[int, int, float], None]
+
+
+class LeaseLostError(Exception):
+    """
+    Raised when a task is stopped because its lease has been taken over by another process.
+    """
+    pass
+
+
+def run_notes_retention(force: bool = False, holder: Optional[str] = None,
+                        batch_size: Optional[int] = None, pause: Optional[float] = None,
+                        on_batch: Optional[BatchCallback] = None) -> Optional[int]:
+    """
+    Removes old notes unless that has already been done today (in UTC) or is being done by
+    another process. With force, it is done even if it has already been done today. If an earlier
+    run was interrupted, it continues after the last batch that run finished. on_batch is called
+    after each batch as in remove_old_notes(). Returns the number of cases whose notes were
+    removed, or None if they were not removed. Raises LeaseLostError if another process took over.
+    """
+    holder = holder or default_holder()
+    today = datetime.now(timezone.utc).date()
+    if not acquire_lease(NOTES_TASK, holder, today, force):
+        return None
+
+    def finish_batch(last_id: int, cleared_count: int, seconds: float) -> None:
+        save_progress(NOTES_TASK, holder, last_id)
+        if on_batch is not None:
+            on_batch(last_id, cleared_count, seconds)
+
+    completed = False
+    try:
+        start_after = TaskLease.objects.get(name=NOTES_TASK).progress or 0
+        cleared_count = remove_old_notes(batch_size, pause, start_after, finish_batch)
+        completed = True
+    finally:
+        release_lease(NOTES_TASK, holder, today if completed else None)
+
+    return cleared_count
+
+
+def remove_old_notes(batch_size: Optional[int] = None, pause: Optional[float] = None,
+                     start_after: int = 0, on_batch: Optional[BatchCallback] = None) -> int:
+    """
+    Removes notes from cases that have not been edited in 90 days, in batches of at most
+    batch_size cases in order of id, starting after the case with id start_after. Each batch is a
+    separate UPDATE with a pause of pause seconds in between, so other writes are not blocked for
+    long. After each batch on_batch is called with the id of the last case in the batch, the
+    number of cases whose notes were removed and the number of seconds the batch took. Returns
+    the number of cases whose notes were removed.
+    """
+    batch_size = batch_size or settings.NOTES_PURGE_BATCH_SIZE
+    pause = settings.NOTES_PURGE_PAUSE if pause is None else pause
+
+    before_date = datetime.now(timezone.utc) - timedelta(days=NOTES_RETENTION_DAYS)
+    old_notes = Case.objects.filter(
+        edited_at__lt=datetime(
+            year=before_date.year,
+            month=before_date.month,
+            day=before_date.day,
+            tzinfo=timezone.utc
+        ),
+        notes__isnull=False,
+    ).order_by("id")
+
+    cleared_count = 0
+    last_id = start_after
+    while True:
+        batch_start = time.perf_counter()
+        ids = list(old_notes.filter(id__gt=last_id).values_list("id", flat=True)[:batch_size])
+        if not ids:
+            break
+
+        # The conditions are checked again, in case a case was edited after it was selected
+        batch_count = old_notes.filter(id__in=ids).update(notes=None)
+        cleared_count += batch_count
+        last_id = ids[-1]
+        if on_batch is not None:
+            on_batch(last_id, batch_count, time.perf_counter() - batch_start)
+
+        if len(ids) < batch_size:
+            break
+        time.sleep(pause)
+
+    if cleared_count > 0:
+        bump_data_version()
+    return cleared_count
+
+
+def acquire_lease(name: str, holder: str, today: date, force: bool = False) -> bool:
+    """
+    Takes the lease of the task with the given name for the given holder, unless another holder
+    has it or (without force) the task has already been run today. Returns whether the lease was
+    taken. The check and the taking are done in a single UPDATE, so only one process can succeed.
+    """
+    try:
+        with transaction.atomic():
+            TaskLease.objects.get_or_create(name=name)
+    except IntegrityError:
+        # Created by another process at the same time
+        pass
+
+    now = datetime.now(timezone.utc)
+    leases = TaskLease.objects.filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+                                      name=name)
+    if not force:
+        leases = leases.filter(Q(last_run__isnull=True) | Q(last_run__lt=today))
+
+    return leases.update(locked_until=now + LEASE_DURATION, holder=holder) == 1
+
+
+def save_progress(name: str, holder: str, progress: int) -> None:
+    """
+    Saves the progress of the task with the given name and extends its lease, so a task that runs
+    for long is not taken over. Raises LeaseLostError if the given holder no longer has the lease.
+    """
+    locked_until = datetime.now(timezone.utc) + LEASE_DURATION
+    updated = TaskLease.objects.filter(name=name, holder=holder).update(
+        progress=progress, locked_until=locked_until)
+    if updated == 0:
+        raise LeaseLostError(f"The lease of {name} has been taken over by another process.")
+
+
+def release_lease(name: str, holder: str, completed_on: Optional[date] = None) -> None:
+    """
+    Gives up the lease of the task with the given name, if the given holder still has it. If
+    completed_on is given, the task is recorded as run on that day and its progress is reset.
+    """
+    changes = {"locked_until": None, "holder": ""}
+    if completed_on is not None:
+        changes["last_run"] = completed_on
+        changes["progress"] = None
+    TaskLease.objects.filter(name=name, holder=holder).update(**changes)
+
+
+def default_holder() -> str:
+    """
+    Returns a name for the current process that is unique across servers.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
@@ -0,0 +1,193 @@
+from datetime import date, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, QuerySet, Sum
+from django.db.models.functions import TruncDate
+from api.models import Case, Category, DailyCaseStats
+from .cache import bump_data_version
+
+TIME_FIELDS = ["customer_time", "additional_time", "form_fill_time"]
+
+RollupKey = Tuple[date, Optional[int], Optional[str]]
+
+
+def rollup_key(case: Case) -> RollupKey:
+    """
+    Returns the (day, category id, medium) that the given case is counted under.
+    """
+    return case.created_at.astimezone(timezone.utc).date(), case.category_id, case.medium
+
+
+def case_totals(case: Case, sign: int = 1) -> Dict:
+    """
+    Returns what the given case adds to the totals of its day, category and medium. A sign of -1
+    gives what is removed from the totals when the case is removed.
+    """
+    totals = {"count": sign}
+    for key in TIME_FIELDS:
+        totals[key] = (getattr(case, key) or timedelta(0)) * sign
+    return totals
+
+
+def add_case(case: Case) -> None:
+    """
+    Adds a newly saved case to the daily totals.
+    """
+    add_totals(rollup_key(case), case_totals(case))
+
+
+def remove_case(case: Case) -> None:
+    """
+    Removes a case from the daily totals, before it is deleted.
+    """
+    add_totals(rollup_key(case), case_totals(case, sign=-1))
+
+
+def change_case(old_key: RollupKey, old_totals: Dict, case: Case) -> None:
+    """
+    Moves a case from the totals it was counted under before it was updated to the totals it
+    belongs to now. old_key and old_totals are what rollup_key() and case_totals() returned for
+    the case before the update.
+    """
+    new_key = rollup_key(case)
+    new_totals = case_totals(case)
+    if new_key == old_key:
+        difference = {key: new_totals[key] - old_totals[key] for key in new_totals}
+        if any(difference.values()):
+            add_totals(new_key, difference)
+    else:
+        add_totals(old_key, {key: -value for key, value in old_totals.items()})
+        add_totals(new_key, new_totals)
+
+
+def add_cases(cases: Iterable[Case], sign: int = 1) -> None:
+    """
+    Adds (or with a sign of -1 removes) several cases to the daily totals, with one update per
+    affected day, category and medium.
+    """
+    totals_per_key = {}
+    sum_totals(totals_per_key, cases, sign)
+    for key, totals in totals_per_key.items():
+        add_totals(key, totals)
+
+
+def add_selected(queries: Iterable[QuerySet], sign: int = 1) -> None:
+    """
+    Adds (or with a sign of -1 removes) the cases of the given queries to the daily totals,
+    without reading them: the database sums them up per day, category and medium.
+    """
+    for key, totals in selected_totals(queries).items():
+        add_totals(key, {field: value * sign for field, value in totals.items()})
+
+
+def change_selected(queries: Iterable[QuerySet], values: Dict) -> None:
+    """
+    Moves the cases of the given queries, before they are updated with the given field values,
+    from the totals they are counted under to the totals they will belong to, without reading
+    them. Every case keeps its day, since created_at is never changed.
+    """
+    totals_per_key: Dict[RollupKey, Dict] = {}
+    for key, totals in selected_totals(queries).items():
+        day, category_id, medium = key
+        new_key = (day, values.get("category_id", category_id), values.get("medium", medium))
+        new_totals = {"count": totals["count"]}
+        for field in TIME_FIELDS:
+            if field in values:
+                new_totals[field] = values[field] * totals["count"]
+            else:
+                new_totals[field] = totals[field]
+        merge_totals(totals_per_key, key, {field: -value for field, value in totals.items()})
+        merge_totals(totals_per_key, new_key, new_totals)
+    for key, totals in totals_per_key.items():
+        if any(totals.values()):
+            add_totals(key, totals)
+
+
+def selected_totals(queries: Iterable[QuerySet]) -> Dict[RollupKey, Dict]:
+    """
+    Returns the count and times that the cases of the given queries, which must not overlap, add
+    to the totals of each day, category and medium, computed by the database with one grouped
+    query per query.
+    """
+    totals_per_key: Dict[RollupKey, Dict] = {}
+    for cases in queries:
+        rows = cases.order_by().values(
+            "category_id", "medium", day=TruncDate("created_at", tzinfo=timezone.utc),
+        ).annotate(
+            total_count=Count("id"),
+            **{key + "_total": Sum(key) for key in TIME_FIELDS},
+        )
+        for row in rows.iterator():
+            totals = {"count": row["total_count"]}
+            for key in TIME_FIELDS:
+                totals[key] = row[key + "_total"] or timedelta(0)
+            merge_totals(totals_per_key, (row["day"], row["category_id"], row["medium"]), totals)
+    return totals_per_key
+
+
+def sum_totals(totals_per_key: Dict[RollupKey, Dict], cases: Iterable[Case], sign: int = 1) -> None:
+    """
+    Adds what the given cases add to (or with a sign of -1 remove from) the totals of each day,
+    category and medium to totals_per_key.
+    """
+    for case in cases:
+        merge_totals(totals_per_key, rollup_key(case), case_totals(case, sign))
+
+
+def merge_totals(totals_per_key: Dict[RollupKey, Dict], key: RollupKey, totals: Dict) -> None:
+    if key in totals_per_key:
+        for field in totals:
+            totals_per_key[key][field] += totals[field]
+    else:
+        totals_per_key[key] = totals
+
+
+def add_totals(key: RollupKey, totals: Dict) -> None:
+    """
+    Adds the given count and times to the totals of a day, category and medium. Must be called in
+    the same transaction as the change to the cases.
+    """
+    day, category_id, medium = key
+    rows = DailyCaseStats.objects.filter(day=day, category_id=category_id, medium=medium)
+    changes = {field: F(field) + value for field, value in totals.items()}
+
+    if rows.update(**changes) == 0:
+        try:
+            # The savepoint lets the update be retried if another transaction created the row
+            # after the update above.
+            with transaction.atomic():
+                DailyCaseStats.objects.create(day=day, category_id=category_id, medium=medium,
+                                              **totals)
+        except IntegrityError:
+            rows.update(**changes)
+
+
+def remove_category(category: Category) -> None:
+    """
+    Moves the totals of a category that is about to be deleted to the totals without category,
+    since its cases will no longer have a category.
+    """
+    with transaction.atomic():
+        for row in DailyCaseStats.objects.filter(category=category):
+            totals = {"count": row.count}
+            for key in TIME_FIELDS:
+                totals[key] = getattr(row, key)
+            row.delete()
+            add_totals((row.day, None, row.medium), totals)
+
+
+def rebuild() -> int:
+    """
+    Recomputes all daily totals from the cases, for example after cases have been added without
+    api.interfaces.cases. Returns the number of rows in the rebuilt table.
+    """
+    daily_stats = [DailyCaseStats(day=day, category_id=category_id, medium=medium, **totals)
+                   for (day, category_id, medium), totals
+                   in selected_totals([Case.objects.all()]).items()]
+
+    with transaction.atomic():
+        DailyCaseStats.objects.all().delete()
+        DailyCaseStats.objects.bulk_create(daily_stats, batch_size=1000)
+        bump_data_version()
+
+    return len(daily_stats)
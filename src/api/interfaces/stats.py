@@ -1,18 +1,45 @@
-from api.models import Category, Case
-from django.db.models import Sum
-from datetime import datetime, timedelta
-from .cases import get_case_categories
-from typing import List, Dict
+import asyncio
+from api.models import Case, DailyCaseStats
+from api.expressions import EpochMicroseconds
+from asgiref.sync import sync_to_async
+from django.db.models import (BigIntegerField, BooleanField, Count, ExpressionWrapper, F, Q,
+                              QuerySet, Sum, Value)
+from django.db.models.functions import Mod
+from django.utils.timezone import is_naive, make_aware
+from datetime import date, datetime, time, timedelta, timezone
+from .cases import alist, get_case_categories
+from typing import Any, List, Dict, Optional, Tuple
+
+TIME_FIELDS = ["customer_time", "additional_time", "form_fill_time"]
+
+MAX_TIME_PERIODS = 10000
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECONDS_PER_DAY = 24 * 3600 * 1000000
 
 
 def get_medium_count(start_time: datetime, end_time: datetime) -> Dict:
     """
     Get the count of cases by medium (phone or email) within a given time range.
     """
-    num_email_cases = Case.objects.filter(
-        created_at__gte=start_time, created_at__lte=end_time, medium="email").count()
-    num_phone_cases = Case.objects.filter(
-        created_at__gte=start_time, created_at__lte=end_time, medium="phone").count()
+    totals = get_totals(start_time, end_time, "medium")
+    return count_per_medium(totals)
+
+
+async def aget_medium_count(start_time: datetime, end_time: datetime) -> Dict:
+    """
+    Async version of get_medium_count().
+    """
+    totals = await aget_totals(start_time, end_time, "medium")
+    return count_per_medium(totals)
+
+
+def count_per_medium(totals: Dict[Any, Dict]) -> Dict:
+    """
+    Picks the count of cases by medium from the totals per medium.
+    """
+    num_email_cases = totals.get("email", {}).get("count", 0)
+    num_phone_cases = totals.get("phone", {}).get("count", 0)
 
     return {"phone": num_phone_cases, "email": num_email_cases}
 
@@ -22,43 +49,138 @@ def get_stats_per_category(start_time: datetime, end_time: datetime) -> Dict:
     Get case-related statistics for each category and its subcategories within a given time range.
     """
     categories = get_case_categories()
-    stats = gather_stats_per_category(categories, start_time, end_time)
+    totals = get_totals(start_time, end_time, "category_id")
+    stats = gather_stats_per_category(categories, totals)
     return stats
 
 
-def gather_stats_per_category(categories: List[Dict], start_time: datetime,
-                              end_time: datetime) -> List[Dict]:
+async def aget_stats_per_category(start_time: datetime, end_time: datetime) -> Dict:
+    """
+    Async version of get_stats_per_category().
+    """
+    categories, totals = await asyncio.gather(
+        sync_to_async(get_case_categories)(),
+        aget_totals(start_time, end_time, "category_id"),
+    )
+    return gather_stats_per_category(categories, totals)
+
+
+def get_totals(start_time: datetime, end_time: datetime, group_by: str) -> Dict[Any, Dict]:
+    """
+    Get the number of cases and the sum of each time field in seconds per value of group_by
+    ("medium" or "category_id") within a given time range. Whole days are read from the daily
+    totals and only the partial days at the edges of the range are read from the cases, with one
+    grouped query each. Values without cases are left out.
+    """
+    queries = totals_queries(start_time, end_time, group_by)
+    return sum_totals([list(rows) for rows in queries], group_by)
+
+
+async def aget_totals(start_time: datetime, end_time: datetime, group_by: str) -> Dict[Any, Dict]:
+    """
+    Async version of get_totals(), which runs its queries concurrently.
+    """
+    queries = totals_queries(start_time, end_time, group_by)
+    return sum_totals(await asyncio.gather(*(alist(rows) for rows in queries)), group_by)
+
+
+def totals_queries(start_time: datetime, end_time: datetime, group_by: str) -> List[QuerySet]:
+    """
+    Returns the queries for get_totals(), one for the partial days at the edges of the time range
+    and one for the whole days if there are any.
+    """
+    whole_days, edges = split_into_days(start_time, end_time)
+    time_sums = {key + "_total": Sum(key) for key in TIME_FIELDS}
+
+    queries = [
+        Case.objects.filter(edges).order_by().values(group_by).annotate(
+            count_total=Count("id"), **time_sums)
+    ]
+    if whole_days is not None:
+        first_day, last_day = whole_days
+        queries.append(
+            DailyCaseStats.objects.filter(day__gte=first_day, day__lte=last_day).order_by()
+            .values(group_by).annotate(count_total=Sum("count"), **time_sums)
+        )
+    return queries
+
+
+def sum_totals(results: List[List[Dict]], group_by: str) -> Dict[Any, Dict]:
+    """
+    Adds up the rows returned by the queries from totals_queries() per value of group_by.
+    """
+    totals = {}
+    for rows in results:
+        for row in rows:
+            if row[group_by] not in totals:
+                totals[row[group_by]] = {"count": 0, **{key: 0 for key in TIME_FIELDS}}
+            total = totals[row[group_by]]
+
+            total["count"] += row["count_total"]
+            for key in TIME_FIELDS:
+                time_sum = row[key + "_total"]
+                if time_sum is not None:
+                    total[key] += time_sum.total_seconds()
+
+    return totals
+
+
+def split_into_days(start_time: datetime, end_time: datetime) -> Tuple[Optional[Tuple], Q]:
+    """
+    Splits a time range into the whole (UTC) days within it and the partial days at its edges.
+    Returns the first and last whole day, or None if there are no whole days, and a query for the
+    cases created within the range but not on any of the whole days.
+    """
+    start_time = as_utc(start_time)
+    end_time = as_utc(end_time)
+
+    first_midnight = datetime.combine(start_time.date(), time(), tzinfo=timezone.utc)
+    if first_midnight < start_time:
+        first_midnight += timedelta(days=1)
+    last_midnight = datetime.combine(end_time.date(), time(), tzinfo=timezone.utc)
+
+    if first_midnight >= last_midnight:
+        return None, Q(created_at__gte=start_time, created_at__lte=end_time)
+
+    whole_days = (first_midnight.date(), last_midnight.date() - timedelta(days=1))
+    edges = Q(created_at__gte=last_midnight, created_at__lte=end_time)
+    if start_time < first_midnight:
+        edges |= Q(created_at__gte=start_time, created_at__lt=first_midnight)
+
+    return whole_days, edges
+
+
+def as_utc(value: datetime) -> datetime:
+    """
+    Returns the given datetime in UTC. Naive datetimes are assumed to be in the default time zone.
+    """
+    if is_naive(value):
+        value = make_aware(value)
+    return value.astimezone(timezone.utc)
+
+
+def gather_stats_per_category(categories: List[Dict], totals: Dict[int, Dict]) -> List[Dict]:
     """
     Gather information about cases (category id, category name, total amount of cases, sum of
     initial time, sum of additional time, sum of form fill time) for each category and its
-    subcategories within a given time range. Function is called recursively for subcategories.
+    subcategories from the totals per category id. The totals of subcategories are added to their
+    parent category. Function is called recursively for subcategories.
     """
     result = []
     for category in categories:
-        time_fields = {"customer_time": 0, "additional_time": 0, "form_fill_time": 0}
-
         stat = {"category_id": category["id"], "category_name": category["name"]}
 
-        cases = Case.objects.filter(created_at__gte=start_time, created_at__lte=end_time,
-                                    category_id=category["id"])
-
-        stat["count"] = cases.count()
-
-        for key in time_fields:
-            time_sum = cases.aggregate(sum=Sum(key))['sum']
-            if time_sum is not None:
-                time_fields[key] += time_sum.total_seconds()
-
-            stat[key] = time_fields[key]
+        total = totals.get(category["id"], {})
+        stat["count"] = total.get("count", 0)
+        for key in TIME_FIELDS:
+            stat[key] = total.get(key, 0)
 
         if category.get("subcategories") is not None:
-            stat["subcategories"] = gather_stats_per_category(category["subcategories"],
-                                                              start_time, end_time)
+            stat["subcategories"] = gather_stats_per_category(category["subcategories"], totals)
             for substat in stat["subcategories"]:
                 stat["count"] += substat["count"]
-                for key in time_fields:
-                    time_fields[key] += substat.get(key)
-                    stat[key] = time_fields[key]
+                for key in TIME_FIELDS:
+                    stat[key] += substat[key]
 
         result.append(stat)
 
@@ -68,17 +190,183 @@ def gather_stats_per_category(categories: List[Dict], start_time: datetime,
 def get_stats_per_period(start_time: datetime, delta: timedelta, time_periods: int) -> Dict:
     """
     Get the count of cases for each time period in the given interval. The length of the time period
-    is decided by delta, and the amount of periods to be checked is decided time_periods.
+    is decided by delta, and the amount of periods to be checked is decided time_periods. Raises
+    ValueError if delta is zero or if there are more than MAX_TIME_PERIODS periods.
+    """
+    counts = get_counts_per_period(start_time, delta, time_periods)
+    return stats_per_period(start_time, delta, time_periods, counts)
+
+
+async def aget_stats_per_period(start_time: datetime, delta: timedelta, time_periods: int) -> Dict:
+    """
+    Async version of get_stats_per_period().
+    """
+    counts = await aget_counts_per_period(start_time, delta, time_periods)
+    return stats_per_period(start_time, delta, time_periods, counts)
+
+
+def stats_per_period(start_time: datetime, delta: timedelta, time_periods: int,
+                     counts: List[int]) -> List[Dict]:
+    """
+    Lists the start, end and count of cases of each time period.
     """
     dates = []
     for i in range(time_periods):
         start = start_time + delta*i
         end = start + delta
-        if delta.seconds < 0:
-            num_cases = Case.objects.filter(created_at__gte=end, created_at__lte=start).count()
-        else:
-            num_cases = Case.objects.filter(created_at__gte=start, created_at__lte=end).count()
-        stat = {"start": start.isoformat(), "end": end.isoformat(), "count": num_cases}
+        stat = {"start": start.isoformat(), "end": end.isoformat(), "count": counts[i]}
         dates.append(stat)
 
     return dates
+
+
+def get_counts_per_period(start_time: datetime, delta: timedelta, time_periods: int) -> List[int]:
+    """
+    Get the count of cases for each time period. Both the start and the end of each period are
+    inclusive, so a case created exactly on the boundary between two periods is counted in both.
+    A negative delta gives periods that end at start_time. Periods of whole days are counted from
+    the daily totals, other periods with a single grouped query over the cases.
+    """
+    check_periods(delta, time_periods)
+    if time_periods <= 0:
+        return []
+
+    start_time = as_utc(start_time)
+    if is_whole_days(start_time, delta):
+        boundaries = period_boundaries(start_time, delta, time_periods)
+        days_query, boundaries_query = whole_days_queries(boundaries)
+        return count_whole_days_periods(boundaries, dict(days_query), dict(boundaries_query))
+
+    rows = periods_query(start_time, delta, time_periods)
+    return count_periods(list(rows), time_periods)
+
+
+async def aget_counts_per_period(start_time: datetime, delta: timedelta,
+                                 time_periods: int) -> List[int]:
+    """
+    Async version of get_counts_per_period(), which runs its queries concurrently.
+    """
+    check_periods(delta, time_periods)
+    if time_periods <= 0:
+        return []
+
+    start_time = as_utc(start_time)
+    if is_whole_days(start_time, delta):
+        boundaries = period_boundaries(start_time, delta, time_periods)
+        days_rows, boundaries_rows = await asyncio.gather(
+            *(alist(query) for query in whole_days_queries(boundaries)))
+        return count_whole_days_periods(boundaries, dict(days_rows), dict(boundaries_rows))
+
+    rows = await alist(periods_query(start_time, delta, time_periods))
+    return count_periods(rows, time_periods)
+
+
+def check_periods(delta: timedelta, time_periods: int) -> None:
+    """
+    Raises ValueError if delta is zero or if there are more than MAX_TIME_PERIODS periods.
+    """
+    if delta == timedelta(0):
+        raise ValueError("Delta can not be 0.")
+    if time_periods > MAX_TIME_PERIODS:
+        raise ValueError(f"Too many intervals, at most {MAX_TIME_PERIODS} are allowed.")
+
+
+def is_whole_days(start_time: datetime, delta: timedelta) -> bool:
+    """
+    Returns True if periods with the given (UTC) start and length start and end at midnight.
+    """
+    return start_time.time() == time() and delta % timedelta(days=1) == timedelta(0)
+
+
+def periods_query(start_time: datetime, delta: timedelta, time_periods: int) -> QuerySet:
+    """
+    Returns a query for the number of cases per period and whether they were created exactly on
+    the start of the period.
+    """
+    end_time = start_time + delta * time_periods
+
+    start_us = (start_time - EPOCH) // timedelta(microseconds=1)
+    length_us = abs(delta) // timedelta(microseconds=1)
+
+    # The offset is the distance from start_time in the direction of delta, so it is never
+    # negative for the cases within the interval.
+    if delta > timedelta(0):
+        cases = Case.objects.filter(created_at__gte=start_time, created_at__lte=end_time)
+        offset = EpochMicroseconds("created_at") - Value(start_us)
+    else:
+        cases = Case.objects.filter(created_at__gte=end_time, created_at__lte=start_time)
+        offset = Value(start_us) - EpochMicroseconds("created_at")
+
+    return cases.order_by().alias(
+        offset=ExpressionWrapper(offset, output_field=BigIntegerField()),
+        remainder=Mod("offset", length_us),
+    ).values(
+        period=ExpressionWrapper(F("offset") / length_us, output_field=BigIntegerField()),
+        on_boundary=ExpressionWrapper(Q(offset__gt=0, remainder=0), output_field=BooleanField()),
+    ).annotate(count=Count("id"))
+
+
+def count_periods(rows: List[Dict], time_periods: int) -> List[int]:
+    """
+    Adds up the rows returned by periods_query() per period.
+    """
+    counts = [0] * time_periods
+    for row in rows:
+        period = row["period"]
+        if period < time_periods:
+            counts[period] += row["count"]
+        # Cases on the start of a period are also on the end of the previous period
+        if row["on_boundary"]:
+            counts[period - 1] += row["count"]
+
+    return counts
+
+
+def period_boundaries(start_time: datetime, delta: timedelta, time_periods: int) -> List[datetime]:
+    """
+    Returns the start of every period and the end of the last one.
+    """
+    return [start_time + delta * i for i in range(time_periods + 1)]
+
+
+def whole_days_queries(boundaries: List[datetime]) -> Tuple[QuerySet, QuerySet]:
+    """
+    Returns the queries for periods that start and end at midnight (UTC): the number of cases per
+    day from the daily totals, and the number of cases created exactly at midnight between the
+    first and last boundary, which includes those created exactly on each boundary. The
+    boundaries are not sent as a list, since there can be up to MAX_TIME_PERIODS of them.
+    """
+    first, last = min(boundaries[0], boundaries[-1]), max(boundaries[0], boundaries[-1])
+    first_day, last_day = first.date(), last.date()
+
+    days_query = (
+        DailyCaseStats.objects.filter(day__gte=first_day, day__lt=last_day).order_by()
+        .values("day").annotate(total=Sum("count")).values_list("day", "total")
+    )
+    boundaries_query = (
+        Case.objects.filter(created_at__gte=first, created_at__lte=last).order_by()
+        .alias(time_of_day=Mod(EpochMicroseconds("created_at"), MICROSECONDS_PER_DAY))
+        .filter(time_of_day=0)
+        .values("created_at").annotate(total=Count("id")).values_list("created_at", "total")
+    )
+    return days_query, boundaries_query
+
+
+def count_whole_days_periods(boundaries: List[datetime], count_per_day: Dict[date, int],
+                             count_per_boundary: Dict[datetime, int]) -> List[int]:
+    """
+    Get the count of cases for each time period, for periods that start and end at midnight
+    (UTC), from the count of cases per day and the cases created exactly at the end of a period
+    (which are counted under the next day).
+    """
+    counts = []
+    for i in range(len(boundaries) - 1):
+        period_start, period_end = sorted((boundaries[i], boundaries[i + 1]))
+        count = count_per_boundary.get(period_end, 0)
+        day = period_start.date()
+        while day < period_end.date():
+            count += count_per_day.get(day, 0)
+            day += timedelta(days=1)
+        counts.append(count)
+
+    return counts
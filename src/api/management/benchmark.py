@@ -0,0 +1,15 @@
+from typing import Callable, List
+
+# Statistics are not cached during benchmarks and performance tests, so every request runs its
+# queries
+NO_CACHE = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+def capture_sql(statements: List) -> Callable:
+    """
+    Returns an execute wrapper that appends the SQL and parameters of every query to statements.
+    """
+    def wrapper(execute, sql, params, many, context):
+        statements.append((sql, params))
+        return execute(sql, params, many, context)
+    return wrapper
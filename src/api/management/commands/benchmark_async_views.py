@@ -0,0 +1,135 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from types import ModuleType
+from typing import List
+from urllib.parse import quote
+import asyncio
+import time
+from asgiref.sync import ThreadSensitiveContext
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings, setup_test_environment
+from django.urls import path
+from api import async_views, views
+from api.management.benchmark import NO_CACHE
+
+
+class Command(BaseCommand):
+    help = ("Compares the throughput of the statistics and case endpoints served by a pool of "
+            "threads, as under WSGI, and by an event loop, as under ASGI, with the same number of "
+            "requests running at a time. Under ASGI both the views in api.views and those in "
+            "api.async_views (see ASYNC_VIEWS) are measured. Run it against a database with "
+            "cases, for example one seeded by benchmark_case_indexes.")
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--requests", type=int, default=200,
+                            help="Number of requests per endpoint and server type.")
+        parser.add_argument("--concurrency", type=int, default=8,
+                            help="Number of requests running at a time (WSGI threads or ASGI "
+                                 "tasks).")
+        parser.add_argument("--username",
+                            help="User to log in as, to also benchmark GET /api/case.")
+        parser.add_argument("--days", type=int, default=30,
+                            help="Number of days of statistics to request.")
+
+    def handle(self, *args, **options) -> None:
+        setup_test_environment()
+
+        end = datetime.now(timezone.utc)
+        start = quote((end - timedelta(days=options["days"])).isoformat())
+        end = quote(end.isoformat())
+        urls = [
+            f"/api/stats/medium?start-time={start}&end-time={end}",
+            f"/api/stats/category?start-time={start}&end-time={end}",
+            f"/api/stats/periods?start-time={start}&delta=3600&intervals={options['days'] * 24}",
+        ]
+
+        cookies = None
+        if options["username"]:
+            try:
+                user = User.objects.get(username=options["username"])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['username']} does not exist.")
+            client = Client()
+            client.force_login(user)
+            cookies = client.cookies
+            urls.append("/api/case?per-page=100")
+
+        requests, concurrency = options["requests"], options["concurrency"]
+        for url in urls:
+            with override_settings(CACHES=NO_CACHE, ROOT_URLCONF=read_urls(views)):
+                wsgi = requests / run_wsgi(url, requests, concurrency, cookies)
+                asgi_sync = requests / asyncio.run(run_asgi(url, requests, concurrency, cookies))
+            with override_settings(CACHES=NO_CACHE, ROOT_URLCONF=read_urls(async_views)):
+                asgi = requests / asyncio.run(run_asgi(url, requests, concurrency, cookies))
+            self.stdout.write(f"{url.split('?')[0]}: WSGI {wsgi:.1f} requests/s, "
+                              f"ASGI {asgi_sync:.1f} requests/s, "
+                              f"ASGI with async views {asgi:.1f} requests/s")
+
+
+def read_urls(views_module: ModuleType) -> ModuleType:
+    """
+    Returns a URL configuration for the benchmarked endpoints served by the given views.
+    """
+    urlconf = ModuleType(f"{views_module.__name__}_benchmark_urls")
+    urlconf.urlpatterns = [
+        path("api/case", views_module.case),
+        path("api/stats/medium", views_module.stats_per_medium),
+        path("api/stats/category", views_module.stats_per_category),
+        path("api/stats/periods", views_module.stats_per_period),
+    ]
+    return urlconf
+
+
+def split_requests(requests: int, concurrency: int) -> List[int]:
+    """
+    Returns the number of requests each of the workers makes.
+    """
+    return [requests // concurrency + (1 if i < requests % concurrency else 0)
+            for i in range(concurrency)]
+
+
+def run_wsgi(path: str, requests: int, concurrency: int, cookies) -> float:
+    """
+    Makes the given number of requests from a pool of threads and returns the time it took.
+    """
+    def worker(count: int) -> None:
+        client = Client()
+        if cookies is not None:
+            client.cookies = cookies
+        try:
+            for _ in range(count):
+                check(client.get(path), path)
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, split_requests(requests, concurrency)))
+    return time.perf_counter() - start
+
+
+async def run_asgi(path: str, requests: int, concurrency: int, cookies) -> float:
+    """
+    Makes the given number of requests from concurrent tasks and returns the time it took.
+    """
+    client = AsyncClient()
+    if cookies is not None:
+        client.cookies = cookies
+
+    async def worker(count: int) -> None:
+        for _ in range(count):
+            # Like the ASGI handler, so each request gets its own thread for database access
+            async with ThreadSensitiveContext():
+                check(await client.get(path), path)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(count) for count in split_requests(requests, concurrency)))
+    return time.perf_counter() - start
+
+
+def check(response, path: str) -> None:
+    if response.status_code != 200:
+        raise CommandError(f"{path} responded with {response.status_code}.")
@@ -0,0 +1,134 @@
+from datetime import timedelta
+from statistics import median
+from typing import Callable, Dict, List, Tuple
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models
+from django.db.models import Max, Min
+from api.interfaces.cases import cursor_query, encode_cursor
+from api.management.benchmark import capture_sql
+from api.management.seed import seed_cases, seed_categories
+from api.models import Case
+
+# The index the category foreign key had before it was replaced by case_category_created_at_idx
+OLD_CATEGORY_INDEX = models.Index(fields=["category"], name="case_category_bench_idx")
+
+
+class Command(BaseCommand):
+    help = ("Seeds the database with cases and compares the query plans and timings of the main "
+            "case queries without and with the indexes of the Case model. The indexes are dropped "
+            "and added again, so do not run this against a database that is in use.")
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--cases", type=int, default=1000000,
+                            help="Number of cases to seed the database up to.")
+        parser.add_argument("--repeat", type=int, default=5,
+                            help="Number of times each query is timed.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed for the generated cases.")
+        parser.add_argument("--noinput", "--no-input", action="store_false", dest="interactive",
+                            help="Do not ask for confirmation.")
+
+    def handle(self, *args, **options) -> None:
+        if options["interactive"]:
+            answer = input(f"This adds cases to and drops indexes in the database "
+                           f"'{connection.settings_dict['NAME']}'. Type 'yes' to continue: ")
+            if answer != "yes":
+                raise CommandError("Benchmark cancelled.")
+
+        # The cases are seeded without the indexes, which is also much faster
+        with connection.schema_editor() as editor:
+            for index in Case._meta.indexes:
+                editor.remove_index(Case, index)
+            editor.add_index(Case, OLD_CATEGORY_INDEX)
+        try:
+            existing = Case.objects.count()
+            if existing < options["cases"]:
+                self.stdout.write(f"Seeding {options['cases'] - existing} cases...")
+                seed_categories()
+                seed_cases(options["cases"] - existing, random.Random(options["seed"]))
+
+            queries = benchmark_queries()
+            analyze()
+            before = run_queries(queries, options["repeat"])
+        finally:
+            with connection.schema_editor() as editor:
+                editor.remove_index(Case, OLD_CATEGORY_INDEX)
+                for index in Case._meta.indexes:
+                    editor.add_index(Case, index)
+        analyze()
+        after = run_queries(queries, options["repeat"])
+
+        for name, _ in queries:
+            before_time, before_plan = before[name]
+            after_time, after_plan = after[name]
+            self.stdout.write(f"\n{name}: {before_time:.2f} ms -> {after_time:.2f} ms")
+            self.stdout.write(f"  before: {before_plan}")
+            self.stdout.write(f"  after:  {after_plan}")
+
+
+def benchmark_queries() -> List[Tuple[str, Callable]]:
+    """
+    Returns the benchmarked queries by name, each as a function that runs it. These follow what
+    the API does: listing cases, counting statistics over a day and clearing old notes.
+    """
+    bounds = Case.objects.aggregate(first=Min("created_at"), last=Max("created_at"),
+                                    first_edit=Min("edited_at"))
+    middle = bounds["first"] + (bounds["last"] - bounds["first"]) / 2
+    day = (middle - timedelta(days=1), middle)
+    category_id = Case.objects.exclude(category=None).values_list("category_id", flat=True).first()
+    case_id = Case.objects.values_list("case_id", flat=True).first()
+
+    return [
+        ("first page of cases", lambda: list(Case.objects.values("id")[:100])),
+        ("page of cases by cursor", lambda: list(Case.objects.filter(
+            cursor_query(encode_cursor({"created_at": middle, "id": 0}))).values("id")[:100])),
+        ("count per medium for a day", lambda: Case.objects.filter(
+            created_at__range=day, medium="phone").count()),
+        ("count per category for a day", lambda: Case.objects.filter(
+            created_at__range=day, category_id=category_id).count()),
+        ("notes to clear", lambda: Case.objects.filter(
+            edited_at__lt=bounds["first_edit"] + timedelta(days=1),
+            notes__isnull=False).count()),
+        ("case by case_id", lambda: list(Case.objects.filter(case_id=case_id).values("id"))),
+    ]
+
+
+def run_queries(queries: List[Tuple[str, Callable]], repeat: int) -> Dict[str, Tuple[float, str]]:
+    """
+    Runs every query the given number of times and returns its median time in milliseconds and
+    the plan of its SQL.
+    """
+    results = {}
+    for name, query in queries:
+        statements = []
+        with connection.execute_wrapper(capture_sql(statements)):
+            query()
+
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            query()
+            times.append((time.perf_counter() - start) * 1000)
+
+        results[name] = (median(times), explain(*statements[-1]))
+    return results
+
+
+def explain(sql: str, params) -> str:
+    """
+    Returns the plan of the given SQL statement on one line.
+    """
+    prefix = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        return " | ".join(str(row[-1]) for row in cursor.fetchall())
+
+
+def analyze() -> None:
+    """
+    Updates the planner statistics, so the plans reflect the current indexes.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE" if connection.vendor == "sqlite" else
+                       f"ANALYZE {Case._meta.db_table}")
@@ -0,0 +1,85 @@
+from statistics import median
+from typing import Callable
+import json
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import F
+from api.interfaces.cases import encode_cursor, format_case, get_cases_json
+from api.models import Case
+from api.management.seed import seed_cases, seed_categories
+
+
+class Command(BaseCommand):
+    help = ("Compares how many cases per second GET /api/case turns into JSON when durations and "
+            "timestamps are converted and each case is encoded in Python, as it used to be done, "
+            "and when the cases are read as JSON computed by the database, as it is done now.")
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--cases", type=int, default=100000,
+                            help="Number of cases to seed the database up to.")
+        parser.add_argument("--repeat", type=int, default=5,
+                            help="Number of times each page is timed.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed for the generated cases.")
+        parser.add_argument("--noinput", "--no-input", action="store_false", dest="interactive",
+                            help="Do not ask for confirmation before adding cases.")
+
+    def handle(self, *args, **options) -> None:
+        existing = Case.objects.count()
+        if existing < options["cases"]:
+            if options["interactive"]:
+                answer = input(f"This adds {options['cases'] - existing} cases to the database "
+                               f"'{connection.settings_dict['NAME']}'. Type 'yes' to continue: ")
+                if answer != "yes":
+                    raise CommandError("Benchmark cancelled.")
+            self.stdout.write(f"Seeding {options['cases'] - existing} cases...")
+            seed_categories()
+            seed_cases(options["cases"] - existing, random.Random(options["seed"]))
+
+        for per_page in [100, 1000, 10000, 0]:
+            parameters = {"per-page": str(per_page)}
+            rows = per_page or Case.objects.count()
+            before = time_page(lambda: python_page(parameters), options["repeat"])
+            after = time_page(lambda: get_cases_json(parameters), options["repeat"])
+            self.stdout.write(f"per-page={per_page}: {rows / before:.0f} -> {rows / after:.0f} "
+                              f"cases/s ({before * 1000:.1f} ms -> {after * 1000:.1f} ms)")
+
+
+def python_page(parameters) -> str:
+    """
+    Returns the first page of cases as GET /api/case did before the cases were read as JSON:
+    durations converted to seconds and the page encoded with DjangoJSONEncoder, case by case.
+    """
+    per_page = int(parameters["per-page"])
+    query = Case.objects.annotate(category_name=F("category__name"),
+                                  parent_category_name=F("category__parent__name"))
+    if per_page != 0:
+        query = query[:per_page + 1]
+
+    result = list(query.values())
+    for case in result:
+        format_case(case)
+
+    has_more = per_page != 0 and len(result) == per_page + 1
+    if has_more:
+        result = result[:-1]
+    return json.dumps({
+        "result_count": len(result),
+        "has_more": has_more,
+        "next_cursor": encode_cursor(result[-1]) if has_more else None,
+        "cases": result,
+    }, cls=DjangoJSONEncoder)
+
+
+def time_page(page: Callable[[], str], repeat: int) -> float:
+    """
+    Returns the median number of seconds it took to get the page the given number of times.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        page()
+        times.append(time.perf_counter() - start)
+    return median(times)
@@ -0,0 +1,265 @@
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import quote
+import json
+import logging
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max
+from django.http import HttpResponse
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment
+from api import timing, urls
+from api.interfaces import rollup
+from api.interfaces.cases import encode_cursor
+from api.management.benchmark import NO_CACHE, capture_sql
+from api.models import Case, Category
+from api.management.seed import seed_cases, seed_categories
+from api.metrics import get_collector
+
+BENCHMARK_USERNAME = "benchmark"
+BULK_SIZE = 100
+PERCENTILES = [50, 90, 95, 99]
+
+# The request to time, which is prepared without being timed, given the number of the repetition
+Endpoint = Tuple[str, Callable[[int], Callable[[], HttpResponse]]]
+
+
+class Command(BaseCommand):
+    help = ("Seeds the database with cases up to each of the given sizes and times every endpoint "
+            "in api/urls.py at each size, through the test client with representative parameters. "
+            "Writes a JSON report with the latency percentiles, number of queries and peak "
+            "memory of every endpoint per size, to compare runs over time. Cases are only added, "
+            "so do not run this against a database that is in use.")
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000],
+                            help="Numbers of cases to seed the database up to and benchmark at.")
+        parser.add_argument("--requests", type=int, default=50,
+                            help="Number of timed requests per endpoint and size.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed for the generated cases.")
+        parser.add_argument("--output", default="benchmark_endpoints.json",
+                            help="File to write the JSON report to.")
+        parser.add_argument("--noinput", "--no-input", action="store_false", dest="interactive",
+                            help="Do not ask for confirmation before adding cases.")
+
+    def handle(self, *args, **options) -> None:
+        if options["requests"] < 1:
+            raise CommandError("--requests must be at least 1.")
+        if options["interactive"]:
+            answer = input(f"This adds up to {max(options['sizes'])} cases to the database "
+                           f"'{connection.settings_dict['NAME']}'. Type 'yes' to continue: ")
+            if answer != "yes":
+                raise CommandError("Benchmark cancelled.")
+
+        setup_test_environment()
+        # The timings of every request would otherwise be logged
+        timing.logger.setLevel(logging.WARNING)
+        rng = random.Random(options["seed"])
+        user = benchmark_user()
+        report = {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "requests": options["requests"],
+            "sizes": [],
+        }
+
+        for size in sorted(set(options["sizes"])):
+            existing = Case.objects.count()
+            if existing > size:
+                self.stdout.write(f"Skipping {size} cases, the database already has {existing}.")
+                continue
+            if existing < size:
+                self.stdout.write(f"Seeding {size - existing} cases...")
+                seed_categories()
+                seed_cases(size - existing, rng)
+                rollup.rebuild()
+
+            self.stdout.write(f"\n{size} cases:")
+            # Statistics are not cached and metrics are written to a file of their own, so every
+            # request does its full work without touching the metrics of a running server
+            with tempfile.TemporaryDirectory() as directory, override_settings(
+                    CACHES=NO_CACHE, METRICS=True,
+                    METRICS_DATABASE=Path(directory) / "metrics.sqlite3"):
+                client = Client()
+                client.force_login(user)
+                results = {}
+                for name, prepare in endpoints(client, user):
+                    results[name] = benchmark_endpoint(prepare, options["requests"])
+                    self.stdout.write(
+                        f"  {name}: p50 {results[name]['p50_ms']:.2f} ms, "
+                        f"p99 {results[name]['p99_ms']:.2f} ms, "
+                        f"{results[name]['queries']} queries, "
+                        f"{results[name]['peak_memory_kb']:.0f} KiB")
+                # Before its database is removed
+                get_collector().stop()
+            report["sizes"].append({"cases": size, "endpoints": results})
+
+        with open(options["output"], "w") as file:
+            json.dump(report, file, indent=2)
+        self.stdout.write(f"\nWrote {options['output']}")
+
+
+def benchmark_user() -> User:
+    """
+    Returns the user that the requests are made as, created with an empty password the first
+    time, which POST /api/login logs in with.
+    """
+    user, created = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+    if created:
+        user.set_password("")
+        user.save()
+    return user
+
+
+def endpoints(client: Client, user: User) -> List[Endpoint]:
+    """
+    Returns every endpoint in api/urls.py with the requests to benchmark it with, following how
+    the frontend uses them. The cases created by the requests are deleted by the requests that
+    follow, so the number of cases stays the same. Raises CommandError if an endpoint is missing.
+    """
+    now = datetime.now(timezone.utc)
+    month_ago = quote((now - timedelta(days=30)).isoformat())
+    day_ago = quote((now - timedelta(days=1)).isoformat())
+    month = f"start-time={month_ago}&end-time={quote(now.isoformat())}"
+    day = f"time-start={day_ago}&time-end={quote(now.isoformat())}"
+    category_id = Category.objects.order_by("id").values_list("id", flat=True).first()
+    # A page from the middle of the cases seeded over the last two years
+    last = Case.objects.aggregate(last=Max("created_at"))["last"] or now
+    cursor = quote(encode_cursor({"created_at": last - timedelta(days=365), "id": 0}))
+    new_case = {"medium": "phone", "customer_time": 120, "additional_time": 30,
+                "form_fill_time": 60, "category_id": category_id}
+
+    def own_case_ids(count: int) -> List[int]:
+        return list(Case.objects.filter(created_by=user).order_by("id")
+                    .values_list("id", flat=True)[:count])
+
+    def get(url: str) -> Callable[[int], Callable[[], HttpResponse]]:
+        return lambda _: lambda: client.get(url)
+
+    def send(method: str, url: str, body: Callable[[], object]):
+        def prepare(_: int) -> Callable[[], HttpResponse]:
+            data = json.dumps(body())
+            return lambda: client.generic(method, url, data, "application/json")
+        return prepare
+
+    def login(_: int) -> Callable[[], HttpResponse]:
+        client.logout()
+        return lambda: client.post("/api/login", {"username": BENCHMARK_USERNAME},
+                                   "application/json")
+
+    def logout(_: int) -> Callable[[], HttpResponse]:
+        client.force_login(user)
+        return lambda: client.post("/api/logout")
+
+    def check(_: int) -> Callable[[], HttpResponse]:
+        client.force_login(user)
+        return lambda: client.get("/api/check")
+
+    def patch_case(index: int) -> Callable[[], HttpResponse]:
+        id = own_case_ids(1)[0]
+        data = json.dumps({"notes": f"Edited {index}"})
+        return lambda: client.patch(f"/api/case/{id}", data, "application/json")
+
+    def delete_case(_: int) -> Callable[[], HttpResponse]:
+        id = own_case_ids(1)[0]
+        return lambda: client.delete(f"/api/case/{id}")
+
+    result = [
+        ("POST /api/login", login),
+        ("POST /api/logout", logout),
+        ("GET /api/check", check),
+        ("GET /api/case", get("/api/case?per-page=100")),
+        ("GET /api/case (cursor)", get(f"/api/case?per-page=100&cursor={cursor}")),
+        ("GET /api/case (category)", get(f"/api/case?per-page=100&category-id={category_id}")),
+        ("GET /api/case (stream)", get("/api/case?per-page=1000&stream=true")),
+        ("GET /api/case/export", get(f"/api/case/export?{day}")),
+        ("GET /api/case/export (csv)", get(f"/api/case/export?{day}&format=csv")),
+        ("GET /api/case/categories", get("/api/case/categories")),
+        ("POST /api/case", send("POST", "/api/case", lambda: new_case)),
+        ("POST /api/case/bulk", send("POST", "/api/case/bulk", lambda: [new_case] * BULK_SIZE)),
+        ("PATCH /api/case/<int:id>", patch_case),
+        ("PATCH /api/case/bulk", send("PATCH", "/api/case/bulk", lambda: {
+            "ids": own_case_ids(BULK_SIZE), "changes": {"notes": "Edited in bulk"}})),
+        ("DELETE /api/case/<int:id>", delete_case),
+        ("DELETE /api/case/bulk", send("DELETE", "/api/case/bulk", lambda: {
+            "ids": own_case_ids(BULK_SIZE)})),
+        ("GET /api/stats/medium", get(f"/api/stats/medium?{month}")),
+        ("GET /api/stats/category", get(f"/api/stats/category?{month}")),
+        ("GET /api/stats/periods (days)", get(
+            f"/api/stats/periods?start-time={month_ago}&delta=86400&intervals=30")),
+        ("GET /api/stats/periods (hours)", get(
+            f"/api/stats/periods?start-time={day_ago}&delta=3600&intervals=24")),
+        ("GET /api/status", get("/api/status")),
+        ("GET /api/metrics", get("/api/metrics")),
+    ]
+
+    covered = {name.split(" ")[1] for name, _ in result}
+    missing = {"/api/" + str(pattern.pattern) for pattern in urls.urlpatterns} - covered
+    if missing:
+        raise CommandError(f"No requests to benchmark {', '.join(sorted(missing))} with.")
+    return result
+
+
+def benchmark_endpoint(prepare: Callable[[int], Callable[[], HttpResponse]],
+                       requests: int) -> Dict:
+    """
+    Times the given number of requests, after one request that is not timed, and returns the
+    latency percentiles in milliseconds. The number of queries and the peak memory allocated
+    by Python are measured with the request that is not timed, since measuring them slows down
+    the request.
+    """
+    request = prepare(0)
+    statements: List = []
+    tracemalloc.start()
+    try:
+        with connection.execute_wrapper(capture_sql(statements)):
+            response = run(request)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    if response.status_code >= 400:
+        raise CommandError(f"{response.status_code} response to {response.request['PATH_INFO']}: "
+                           f"{response.content.decode()}")
+
+    times = []
+    for index in range(1, requests + 1):
+        request = prepare(index)
+        start = time.perf_counter()
+        run(request)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+
+    result = {f"p{percentile}_ms": round(nearest_rank(times, percentile), 3)
+              for percentile in PERCENTILES}
+    result["max_ms"] = round(times[-1], 3)
+    result["mean_ms"] = round(sum(times) / len(times), 3)
+    result["queries"] = len(statements)
+    result["peak_memory_kb"] = round(peak / 1024, 1)
+    return result
+
+
+def run(request: Callable[[], HttpResponse]) -> HttpResponse:
+    """
+    Makes the request and reads the whole response, also when it is streamed.
+    """
+    response = request()
+    if response.streaming:
+        b"".join(response.streaming_content)
+    return response
+
+
+def nearest_rank(sorted_values: List[float], percentile: float) -> float:
+    """
+    Returns the given percentile of the sorted values with the nearest-rank method.
+    """
+    rank = max(1, -(-len(sorted_values) * percentile // 100))
+    return sorted_values[int(rank) - 1]
@@ -0,0 +1,93 @@
+from pathlib import Path
+from typing import Callable, Dict
+import gzip
+import mimetypes
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from backend.static import ENCODINGS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Files smaller than this are not worth compressing
+MIN_SIZE = 256
+# Types that compress well, besides text/*
+COMPRESSIBLE_TYPES = {"application/javascript", "application/json", "application/manifest+json",
+                      "application/wasm", "application/xml", "image/svg+xml", "image/x-icon"}
+COMPRESSIBLE_SUFFIXES = {".map", ".mjs", ".webmanifest"}
+
+
+class Command(BaseCommand):
+    help = ("Writes gzip (.gz) and, if the brotli package is installed, brotli (.br) versions of "
+            "the frontend files in FRONTEND_DIR next to them, which static_files serves to "
+            "clients that accept them. Run it after deploying the frontend. Only files that "
+            "have changed since they were last compressed are compressed again.")
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--force", action="store_true",
+                            help="Compress every file, also those that have not changed.")
+
+    def handle(self, *args, **options) -> None:
+        root = Path(settings.FRONTEND_DIR)
+        if not root.is_dir():
+            raise CommandError(f"The frontend directory {root} does not exist.")
+
+        compressors: Dict[str, Callable[[bytes], bytes]] = {
+            ".gz": lambda data: gzip.compress(data, compresslevel=9, mtime=0),
+        }
+        if brotli is not None:
+            compressors[".br"] = lambda data: brotli.compress(data, quality=11)
+        else:
+            self.stdout.write("The brotli package is not installed, only writing .gz files.")
+
+        written = skipped = 0
+        saved = 0
+        for directory, _, names in os.walk(root):
+            for name in sorted(names):
+                path = Path(directory) / name
+                if not is_compressible(path):
+                    continue
+                data = None
+                for suffix, compress in compressors.items():
+                    target = path.with_name(name + suffix)
+                    if not options["force"] and is_up_to_date(target, path):
+                        skipped += 1
+                        continue
+                    if data is None:
+                        data = path.read_bytes()
+                    compressed = compress(data)
+                    if len(compressed) >= len(data):
+                        # Not worth sending, and an old version must not be served instead
+                        target.unlink(missing_ok=True)
+                        continue
+                    target.write_bytes(compressed)
+                    written += 1
+                    saved += len(data) - len(compressed)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} compressed files, saving {saved / 1024:.0f} KiB, and skipped "
+            f"{skipped} that were up to date."))
+
+
+def is_compressible(path: Path) -> bool:
+    """
+    Returns whether the given file is worth compressing: text of at least MIN_SIZE bytes, which
+    is not itself a compressed version of another file.
+    """
+    if path.suffix in {suffix for _, suffix in ENCODINGS}:
+        return False
+    if path.stat().st_size < MIN_SIZE:
+        return False
+    file_type = mimetypes.guess_type(path.name)[0] or ""
+    return (file_type.startswith("text/") or file_type in COMPRESSIBLE_TYPES
+            or path.suffix in COMPRESSIBLE_SUFFIXES)
+
+
+def is_up_to_date(target: Path, source: Path) -> bool:
+    try:
+        return target.stat().st_mtime_ns >= source.stat().st_mtime_ns
+    except FileNotFoundError:
+        return False
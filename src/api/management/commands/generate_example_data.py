@@ -0,0 +1,95 @@
+from typing import List
+import random
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection
+from api.interfaces import rollup
+from api.interfaces.cases import clear_category_cache
+from api.management.seed import SEED_BATCH_SIZE, seed_cases, seed_categories
+from api.models import Case, Category, DailyCaseStats
+
+
+class Command(BaseCommand):
+    help = ("Fills the configured database with example categories, users and cases for "
+            "development and testing. By default all cases and categories are deleted first. "
+            "Users example1, example2, ... are created with an empty password, so they can log "
+            "in with just their username.")
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--cases", type=int, default=10000, help="Number of cases to add.")
+        parser.add_argument("--days", type=int, default=100,
+                            help="Number of days up to now that the cases are created over.")
+        parser.add_argument("--users", type=int, default=5,
+                            help="Number of users that create and edit the cases.")
+        parser.add_argument("--seed", type=int, default=0,
+                            help="Seed for the generated cases, the same seed gives the same "
+                                 "cases.")
+        parser.add_argument("--batch-size", type=int, default=SEED_BATCH_SIZE,
+                            help="Number of cases inserted per query.")
+        parser.add_argument("--append", action="store_true",
+                            help="Keep the existing cases and categories.")
+        parser.add_argument("--noinput", "--no-input", action="store_false", dest="interactive",
+                            help="Do not ask for confirmation.")
+
+    def handle(self, *args, **options) -> None:
+        if (options["cases"] < 0 or options["users"] < 0 or options["days"] < 1
+                or options["batch_size"] < 1):
+            raise CommandError("--cases and --users can not be negative, and --days and "
+                               "--batch-size must be at least 1.")
+        if options["interactive"]:
+            action = "adds" if options["append"] else "deletes all cases and categories in and adds"
+            answer = input(f"This {action} {options['cases']} cases to the database "
+                           f"'{connection.settings_dict['NAME']}'. Type 'yes' to continue: ")
+            if answer != "yes":
+                raise CommandError("Cancelled.")
+
+        if not options["append"]:
+            self.stdout.write("Deleting cases and categories...")
+            delete_cases_and_categories()
+        seed_categories()
+        clear_category_cache()
+        user_ids = example_users(options["users"])
+
+        start = time.perf_counter()
+        total = options["cases"]
+
+        def progress(done: int) -> None:
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{done}/{total} cases ({done / elapsed:.0f} cases/s)")
+
+        seed_cases(total, random.Random(options["seed"]), days=options["days"],
+                   user_ids=user_ids, batch_size=options["batch_size"], progress=progress)
+
+        self.stdout.write("Computing the daily totals...")
+        rollup.rebuild()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {total} cases in {elapsed:.1f} s ({total / elapsed:.0f} cases/s)."))
+
+
+def delete_cases_and_categories() -> None:
+    """
+    Empties the tables of cases, categories and daily totals, which is much faster than deleting
+    the rows one by one through the ORM.
+    """
+    models = [Case.edited_by.through, DailyCaseStats, Case, Category]
+    tables = [model._meta.db_table for model in models]
+    connection.ops.execute_sql_flush(
+        connection.ops.sql_flush(no_style(), tables, reset_sequences=True))
+
+
+def example_users(count: int) -> List[int]:
+    """
+    Returns the ids of the users example1 to example<count>, creating those that do not exist
+    with an empty password.
+    """
+    user_ids = []
+    for number in range(1, count + 1):
+        user, created = User.objects.get_or_create(username=f"example{number}")
+        if created:
+            user.set_password("")
+            user.save()
+        user_ids.append(user.id)
+    return user_ids
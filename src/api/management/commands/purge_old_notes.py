@@ -0,0 +1,42 @@
+import time
+from django.core.management.base import BaseCommand
+from api.interfaces import retention
+
+
+class Command(BaseCommand):
+    help = ("Removes notes from cases that have not been edited in 90 days. It is done at most "
+            "once per day across all servers, so it can be scheduled on every server, for "
+            "example hourly with cron, or kept running with --every.")
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--every", type=int, metavar="SECONDS",
+                            help="Keep running and try again every SECONDS seconds.")
+        parser.add_argument("--force", action="store_true",
+                            help="Remove old notes even if that has already been done today.")
+        parser.add_argument("--batch-size", type=int,
+                            help="Number of cases per batch (default NOTES_PURGE_BATCH_SIZE).")
+        parser.add_argument("--pause", type=float,
+                            help="Seconds to wait between batches (default NOTES_PURGE_PAUSE).")
+
+    def handle(self, *args, **options) -> None:
+        while True:
+            try:
+                cleared_count = retention.run_notes_retention(
+                    force=options["force"], batch_size=options["batch_size"],
+                    pause=options["pause"], on_batch=self.report_batch)
+            except retention.LeaseLostError as error:
+                self.stderr.write(str(error))
+            else:
+                if cleared_count is None:
+                    self.stdout.write("Old notes have already been removed today, or are being "
+                                      "removed by another process.")
+                else:
+                    self.stdout.write(f"Removed the notes of {cleared_count} cases.")
+
+            if options["every"] is None:
+                break
+            time.sleep(options["every"])
+
+    def report_batch(self, last_id: int, cleared_count: int, seconds: float) -> None:
+        self.stdout.write(f"Removed the notes of {cleared_count} cases up to id {last_id} "
+                          f"in {seconds * 1000:.0f} ms.")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from api.interfaces import rollup
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the daily case statistics from all cases. Needed after cases have been "
+            "added or changed without the API, for example when importing data.")
+
+    def handle(self, *args, **options) -> None:
+        row_count = rollup.rebuild()
+        self.stdout.write(f"Rebuilt daily case statistics ({row_count} rows).")
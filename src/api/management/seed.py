@@ -0,0 +1,152 @@
+from datetime import datetime, time, timedelta, timezone
+from itertools import accumulate
+from typing import Callable, List, Optional, Sequence
+from zoneinfo import ZoneInfo
+import random
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from api.models import Case, Category
+
+SEED_BATCH_SIZE = 10000
+SEED_FIELDS = ["notes", "medium", "customer_time", "additional_time", "form_fill_time",
+               "created_at", "edited_at", "case_id", "category", "created_by"]
+SEED_DAYS = 2 * 365
+# Roughly how cases are spread in production: most are phone calls, a few categories get most of
+# the cases and some cases are never categorized
+SEED_MEDIUMS = {"phone": 0.65, "email": 0.35}
+SEED_UNCATEGORIZED = 0.05
+# Cases are created during office hours in Sweden, most of them in the morning, and only a few
+# on weekends. The weights are relative, by hour of the day and by day of the week (Monday first).
+SEED_TIME_ZONE = ZoneInfo("Europe/Stockholm")
+SEED_HOUR_WEIGHTS = [0, 0, 0, 0, 0, 0, 1, 3, 8, 10, 10, 8, 5, 8, 9, 8, 6, 3, 2, 1, 1, 0, 0, 0]
+SEED_DAY_WEIGHTS = [10, 10, 9, 9, 8, 2, 1]
+# Share of the cases that are edited again later, by a user that is often the one who created it
+SEED_EDITED = 0.3
+SEED_EDITED_BY_CREATOR = 0.7
+# Categories added by seed_categories() when there are none, by parent
+SEED_CATEGORIES = {
+    "Konto": ["Skapa nytt konto", "Ta bort konto", "Glömt lösenord"],
+    "Betalning": ["Faktura", "Återbetalning", "Autogiro"],
+    "Leverans": ["Försenad", "Skadad", "Fel vara"],
+    "Teknisk support": ["Inloggning", "Appen", "Webbplatsen"],
+    "Övrigt": [],
+}
+
+
+def seed_cases(count: int, rng: random.Random, days: int = SEED_DAYS,
+               user_ids: Sequence[int] = (), batch_size: int = SEED_BATCH_SIZE,
+               progress: Optional[Callable[[int], None]] = None) -> None:
+    """
+    Inserts the given number of random cases, created over the given number of days up to now
+    by the given users, if any. Mediums follow SEED_MEDIUMS, categories a Zipf distribution, so
+    the first categories get most of the cases, and creation times SEED_HOUR_WEIGHTS and
+    SEED_DAY_WEIGHTS. The cases are inserted with plain executemany() calls of batch_size cases,
+    since bulk_create() would replace their creation and edit times with the current time, and
+    progress is called with the number of inserted cases after each one. The daily totals are not
+    updated, see rollup.rebuild().
+    """
+    fields = [Case._meta.get_field(name) for name in SEED_FIELDS]
+    sql = insert_sql(Case._meta.db_table, [field.column for field in fields])
+    EditedBy = Case.edited_by.through
+    edited_by_sql = insert_sql(EditedBy._meta.db_table, ["case_id", "user_id"])
+
+    # The weights are added up once, which random.choices() would otherwise do for every case
+    category_ids = list(Category.objects.order_by("id").values_list("id", flat=True))
+    category_weights = list(accumulate(1 / rank for rank in range(1, len(category_ids) + 1)))
+    mediums, medium_weights = list(SEED_MEDIUMS), list(accumulate(SEED_MEDIUMS.values()))
+    now = datetime.now(timezone.utc)
+    created_times = CreationTimes(rng, now, days)
+    # The connection itself rather than django.db.connection, which looks it up on every use
+    database = connections[DEFAULT_DB_ALIAS]
+
+    with connection.cursor() as cursor:
+        for start in range(0, count, batch_size):
+            rows = []
+            editors: List[Optional[int]] = []
+            for _ in range(min(batch_size, count - start)):
+                created_at = created_times.next()
+                form_fill_time = timedelta(seconds=rng.randrange(30, 300))
+                created_by = rng.choice(user_ids) if user_ids else None
+                edited = rng.random() < SEED_EDITED
+                if edited:
+                    edited_at = min(now, created_at + timedelta(
+                        seconds=rng.randrange(600, 2 * 24 * 3600)))
+                    editors.append(created_by if rng.random() < SEED_EDITED_BY_CREATOR
+                                   else rng.choice(user_ids) if user_ids else None)
+                else:
+                    edited_at = min(now, created_at + form_fill_time)
+                    editors.append(None)
+                values = [
+                    "Example notes" if rng.random() < 0.5 else None,
+                    rng.choices(mediums, cum_weights=medium_weights)[0],
+                    timedelta(seconds=rng.randrange(60, 1800)),
+                    timedelta(seconds=rng.randrange(0, 600)),
+                    form_fill_time,
+                    created_at,
+                    edited_at,
+                    rng.randrange(1, 10 ** 9),
+                    (rng.choices(category_ids, cum_weights=category_weights)[0]
+                     if category_ids and rng.random() >= SEED_UNCATEGORIZED else None),
+                    created_by,
+                ]
+                rows.append([field.get_db_prep_save(value, database)
+                             for field, value in zip(fields, values)])
+
+            # One transaction per batch, rather than one per case in autocommit mode
+            with transaction.atomic():
+                last_id = Case.objects.order_by("-id").values_list("id", flat=True).first() or 0
+                cursor.executemany(sql, rows)
+                if any(editors):
+                    # The ids of the inserted cases are not returned by executemany(), but they
+                    # follow the last id in the order the cases were inserted
+                    ids = Case.objects.filter(id__gt=last_id).order_by("id").values_list(
+                        "id", flat=True)
+                    cursor.executemany(edited_by_sql, [
+                        [id, editor] for id, editor in zip(ids, editors) if editor is not None])
+            if progress is not None:
+                progress(start + len(rows))
+
+
+def seed_categories() -> None:
+    """
+    Adds the categories in SEED_CATEGORIES if there are no categories.
+    """
+    if Category.objects.exists():
+        return
+    for name, subcategories in SEED_CATEGORIES.items():
+        parent = Category.objects.create(name=name)
+        for subcategory in subcategories:
+            Category.objects.create(name=subcategory, parent=parent)
+
+
+class CreationTimes():
+    """
+    Random creation times of cases over the given number of days up to now, spread over the hours
+    of the day and days of the week like SEED_HOUR_WEIGHTS and SEED_DAY_WEIGHTS.
+    """
+
+    def __init__(self, rng: random.Random, now: datetime, days: int) -> None:
+        self.rng = rng
+        self.now = now
+        today = now.astimezone(SEED_TIME_ZONE).date()
+        self.dates = [today - timedelta(days=offset) for offset in range(days)]
+        self.date_weights = list(accumulate(SEED_DAY_WEIGHTS[date.weekday()]
+                                            for date in self.dates))
+        self.hour_weights = list(accumulate(SEED_HOUR_WEIGHTS))
+
+    def next(self) -> datetime:
+        # Times later today are drawn again, a few times in case the only day is today
+        for _ in range(100):
+            date = self.rng.choices(self.dates, cum_weights=self.date_weights)[0]
+            hour = self.rng.choices(range(24), cum_weights=self.hour_weights)[0]
+            local = datetime.combine(date, time(hour), tzinfo=SEED_TIME_ZONE) + timedelta(
+                seconds=self.rng.randrange(3600), microseconds=self.rng.randrange(1000000))
+            created_at = local.astimezone(timezone.utc)
+            if created_at <= self.now:
+                return created_at
+        return self.now - timedelta(seconds=self.rng.random() * 3600)
+
+
+def insert_sql(table: str, columns: List[str]) -> str:
+    quoted = ", ".join(connection.ops.quote_name(column) for column in columns)
+    placeholders = ", ".join(["%s"] * len(columns))
+    return f"INSERT INTO {connection.ops.quote_name(table)} ({quoted}) VALUES ({placeholders})"
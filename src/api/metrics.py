@@ -0,0 +1,330 @@
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import atexit
+import json
+import logging
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from backend.db.pool import get_pool_stats
+
+# Upper bounds of the histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# The metrics by name, with their type and description
+FAMILIES = {
+    "api_requests_total": (
+        "counter", "Number of requests, by URL pattern, method and status code."),
+    "api_request_duration_seconds": (
+        "histogram", "Time spent on requests, by URL pattern and method."),
+    "api_response_size_bytes": (
+        "histogram", "Size of responses that are not streamed, by URL pattern and method."),
+    "api_db_queries": (
+        "histogram", "Number of database queries per request, by URL pattern and method."),
+    "api_db_duration_seconds_total": (
+        "counter", "Time spent in database queries, by URL pattern and method."),
+    "api_stats_cache_requests_total": (
+        "counter", "Number of statistics requests served from the cache (hit) or computed (miss)."),
+    "api_db_pool_acquired_total": (
+        "counter", "Number of connections taken from the database connection pools."),
+    "api_db_pool_waits_total": (
+        "counter", "Number of times a request waited for a free connection in the pools."),
+    "api_db_pool_wait_seconds_total": (
+        "counter", "Time requests spent waiting for a free connection in the pools."),
+    "api_db_pool_timeouts_total": (
+        "counter", "Number of requests that gave up waiting for a free connection in the pools."),
+    "api_db_pool_connections": (
+        "gauge", "Number of open connections in the pools of the running processes, by state."),
+}
+
+# How the pool statistics of a process (see backend.db.pool) are reported
+POOL_COUNTERS = {
+    "acquired": ("api_db_pool_acquired_total", 1),
+    "waited": ("api_db_pool_waits_total", 1),
+    "wait_time_ms": ("api_db_pool_wait_seconds_total", 0.001),
+    "timeouts": ("api_db_pool_timeouts_total", 1),
+}
+POOL_GAUGES = ["in_use", "idle"]
+
+# Gauges of processes that have not written their metrics for this many seconds are left out,
+# since the process has most likely stopped
+PROCESS_TIMEOUT = 600
+
+# Number of seconds to wait for another process that is writing to the shared database
+DATABASE_TIMEOUT = 2
+
+logger = logging.getLogger("api.metrics")
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class MetricsCollector():
+    """
+    Collects the metrics of the current process in memory and adds them to an SQLite database
+    shared by all processes of the server every flush_interval seconds, so /api/metrics reports
+    the totals of all processes no matter which process serves it. The database is written to by
+    a thread of its own once start() is called, so requests never wait for it.
+    """
+
+    def __init__(self, path: str, flush_interval: float) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self.process = f"{socket.gethostname()}:{self.pid}:{time.time()}"
+        self.lock = threading.Lock()
+        # Counter increments and pool statistics not yet written to the database
+        self.pending: Dict[Tuple[str, Labels], float] = {}
+        self.pool_counters: Dict[Tuple[str, Labels], float] = {}
+        self.created = False
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """
+        Starts the thread that writes the metrics to the shared database.
+        """
+        self.thread = threading.Thread(target=self.run, name="metrics-flush", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as error:
+                logger.warning("Could not write the metrics to %s: %s", self.path, error)
+
+    def increment(self, name: str, labels: Labels, amount: float = 1) -> None:
+        with self.lock:
+            key = (name, labels)
+            self.pending[key] = self.pending.get(key, 0) + amount
+
+    def observe(self, name: str, labels: Labels, value: float, buckets: Sequence[float]) -> None:
+        """
+        Adds a value to a histogram, stored as cumulative bucket counters like Prometheus does.
+        Buckets the value is above are added 0 to, so that every bucket is reported.
+        """
+        with self.lock:
+            for bound in (*buckets, math.inf):
+                key = (name + "_bucket", labels + (("le", format_value(bound)),))
+                self.pending[key] = self.pending.get(key, 0) + (value <= bound)
+            for suffix, amount in [("_sum", value), ("_count", 1)]:
+                key = (name + suffix, labels)
+                self.pending[key] = self.pending.get(key, 0) + amount
+
+    def flush(self) -> None:
+        """
+        Adds the pending counter increments to the shared database and replaces the gauges of
+        this process there. If the database can not be written to, the increments are kept for
+        the next flush and sqlite3.Error is raised.
+        """
+        pools = get_pool_stats()
+        # Only the swap is done under the lock, so recording metrics never waits for the database
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            for alias, stats in pools.items():
+                for key, (name, scale) in POOL_COUNTERS.items():
+                    # The pools count from when they were created, so only the change since the
+                    # last flush is added, or everything if the pool has been replaced since
+                    counter = (name, (("database", alias),))
+                    value = stats[key] * scale
+                    previous = self.pool_counters.get(counter, 0)
+                    change = value - previous if value >= previous else value
+                    pending[counter] = pending.get(counter, 0) + change
+                    self.pool_counters[counter] = value
+
+        gauges = [("api_db_pool_connections", encode_labels((("database", alias), ("state", key))),
+                   stats[key]) for alias, stats in pools.items() for key in POOL_GAUGES]
+
+        try:
+            with self.database() as db:
+                db.executemany(
+                    "INSERT INTO counters (name, labels, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value",
+                    [(name, encode_labels(labels), value)
+                     for (name, labels), value in pending.items()])
+                db.execute("DELETE FROM gauges WHERE process = ?", [self.process])
+                db.executemany(
+                    "INSERT INTO gauges (process, name, labels, value, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(self.process, name, labels, value, time.time())
+                     for name, labels, value in gauges])
+        except sqlite3.Error:
+            with self.lock:
+                for key, value in pending.items():
+                    self.pending[key] = self.pending.get(key, 0) + value
+            raise
+
+    def remove_process(self) -> None:
+        """
+        Writes the pending metrics and removes the gauges of this process, when it exits.
+        """
+        self.stop()
+        try:
+            self.flush()
+            with self.database() as db:
+                db.execute("DELETE FROM gauges WHERE process = ?", [self.process])
+        except sqlite3.Error:
+            # Nothing can be done about it while exiting, the gauges expire after PROCESS_TIMEOUT
+            pass
+
+    def render(self) -> str:
+        """
+        Returns the metrics of all processes in the Prometheus text format.
+        """
+        try:
+            self.flush()
+        except sqlite3.Error as error:
+            # Those of this process are then left out until the next flush
+            logger.warning("Could not write the metrics to %s: %s", self.path, error)
+        with self.database() as db:
+            samples = db.execute("SELECT name, labels, value FROM counters").fetchall()
+            samples += db.execute(
+                "SELECT name, labels, SUM(value) FROM gauges WHERE updated_at > ? "
+                "GROUP BY name, labels", [time.time() - PROCESS_TIMEOUT]).fetchall()
+
+        by_family: Dict[str, List[Tuple[str, str, float]]] = {}
+        for name, labels, value in samples:
+            by_family.setdefault(family_of(name), []).append((name, labels, value))
+
+        lines = []
+        for family, (metric_type, description) in FAMILIES.items():
+            lines.append(f"# HELP {family} {description}")
+            lines.append(f"# TYPE {family} {metric_type}")
+            for name, labels, value in sorted(by_family.get(family, []), key=sample_order):
+                lines.append(f"{name}{format_labels(json.loads(labels))} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    @contextmanager
+    def database(self) -> Iterator[sqlite3.Connection]:
+        """
+        Opens the shared database, with the tables created if they do not exist, and commits
+        what is done in the with block in one transaction.
+        """
+        db = sqlite3.connect(self.path, timeout=DATABASE_TIMEOUT)
+        try:
+            with db:
+                if not self.created:
+                    db.execute("PRAGMA journal_mode=WAL")
+                    db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT, labels TEXT, "
+                               "value REAL, PRIMARY KEY (name, labels))")
+                    db.execute("CREATE TABLE IF NOT EXISTS gauges (process TEXT, name TEXT, "
+                               "labels TEXT, value REAL, updated_at REAL)")
+                    self.created = True
+                yield db
+        finally:
+            db.close()
+
+
+collector: Optional[MetricsCollector] = None
+collector_lock = threading.Lock()
+
+
+def get_collector() -> MetricsCollector:
+    """
+    Returns the collector of this process, for the database in the METRICS_DATABASE setting. A
+    process forked from one that had a collector gets a new one, since the thread that writes the
+    metrics is not copied.
+    """
+    global collector
+    with collector_lock:
+        if (collector is None or collector.path != str(settings.METRICS_DATABASE)
+                or collector.pid != os.getpid()):
+            if collector is not None:
+                atexit.unregister(collector.remove_process)
+                if collector.pid == os.getpid():
+                    collector.stop()
+            collector = MetricsCollector(str(settings.METRICS_DATABASE),
+                                         settings.METRICS_FLUSH_INTERVAL)
+            collector.start()
+            atexit.register(collector.remove_process)
+        return collector
+
+
+def record_request(request: HttpRequest, response: HttpResponse, seconds: float, db_seconds: float,
+                   queries: int) -> None:
+    """
+    Adds a request to the metrics, labelled with the URL pattern it matched.
+    """
+    if not settings.METRICS:
+        return
+
+    labels = (("route", route_of(request)), ("method", request.method))
+    metrics = get_collector()
+    metrics.increment("api_requests_total",
+                      labels + (("status", str(response.status_code)),))
+    metrics.observe("api_request_duration_seconds", labels, seconds, DURATION_BUCKETS)
+    if not response.streaming:
+        metrics.observe("api_response_size_bytes", labels, len(response.content), SIZE_BUCKETS)
+    metrics.observe("api_db_queries", labels, queries, QUERY_BUCKETS)
+    metrics.increment("api_db_duration_seconds_total", labels, db_seconds)
+
+
+def record_stats_cache(hit: bool) -> None:
+    """
+    Counts a statistics request served from the cache or computed.
+    """
+    if settings.METRICS:
+        get_collector().increment("api_stats_cache_requests_total",
+                                  (("result", "hit" if hit else "miss"),))
+
+
+def route_of(request: HttpRequest) -> str:
+    """
+    Returns the URL pattern in api/urls.py that the request matched, or "other".
+    """
+    match = request.resolver_match
+    if match is None or not match.route.startswith("api/"):
+        return "other"
+    return "/" + match.route
+
+
+def family_of(name: str) -> str:
+    for suffix in ["_bucket", "_sum", "_count"]:
+        if name.endswith(suffix) and name[:-len(suffix)] in FAMILIES:
+            return name[:-len(suffix)]
+    return name
+
+
+def sample_order(sample: Tuple[str, str, float]) -> Tuple:
+    """
+    Orders the samples of a family by labels, with the buckets of a histogram in increasing order
+    followed by its sum and count.
+    """
+    name, labels, _ = sample
+    label_dict = json.loads(labels)
+    le = float(label_dict.pop("le", "inf"))
+    return (json.dumps(label_dict), name.endswith("_count"), name.endswith("_sum"), le)
+
+
+def encode_labels(labels: Labels) -> str:
+    return json.dumps(dict(labels), sort_keys=True)
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = [
+        key + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in labels.items()
+    ]
+    return "{" + ",".join(escaped) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
@@ -0,0 +1,72 @@
+# Generated by Django 4.2 on 2026-10-18 17:50
+
+import datetime
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def build_daily_case_stats(apps, schema_editor):
+    """
+    Fills the new table with the totals of the existing cases.
+    """
+    Case = apps.get_model('api', 'Case')
+    DailyCaseStats = apps.get_model('api', 'DailyCaseStats')
+    time_fields = ['customer_time', 'additional_time', 'form_fill_time']
+
+    rows = Case.objects.order_by().values(
+        'category_id', 'medium', day=TruncDate('created_at', tzinfo=datetime.timezone.utc),
+    ).annotate(total_count=Count('id'), **{key + '_total': Sum(key) for key in time_fields})
+
+    DailyCaseStats.objects.bulk_create([
+        DailyCaseStats(
+            day=row['day'], category_id=row['category_id'], medium=row['medium'],
+            count=row['total_count'],
+            **{key: row[key + '_total'] or datetime.timedelta(0) for key in time_fields},
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_remove_case_category_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCaseStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('medium', models.CharField(max_length=50, null=True)),
+                ('count', models.IntegerField(default=0)),
+                ('customer_time', models.DurationField(default=datetime.timedelta(0))),
+                ('additional_time', models.DurationField(default=datetime.timedelta(0))),
+                ('form_fill_time', models.DurationField(default=datetime.timedelta(0))),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='api.category')),
+            ],
+            options={
+                'verbose_name_plural': 'daily case stats',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailycasestats',
+            constraint=models.UniqueConstraint(fields=('day', 'category', 'medium'), name='daily_stats_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycasestats',
+            constraint=models.UniqueConstraint(condition=models.Q(('category', None)), fields=('day', 'medium'), name='daily_stats_unique_no_category'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycasestats',
+            constraint=models.UniqueConstraint(condition=models.Q(('medium', None)), fields=('day', 'category'), name='daily_stats_unique_no_medium'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycasestats',
+            constraint=models.UniqueConstraint(condition=models.Q(('category', None), ('medium', None)), fields=('day',), name='daily_stats_unique_no_category_medium'),
+        ),
+        migrations.RunPython(build_daily_case_stats, migrations.RunPython.noop),
+    ]
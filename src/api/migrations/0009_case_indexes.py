@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-18 17:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_dailycasestats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='case',
+            name='category',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.category'),
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(fields=['created_at', 'id'], name='case_created_at_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(fields=['category', 'created_at'], name='case_category_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(fields=['medium', 'created_at'], name='case_medium_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(fields=['edited_at'], name='case_edited_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(fields=['case_id'], name='case_case_id_idx'),
+        ),
+    ]
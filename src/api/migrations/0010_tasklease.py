@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-18 18:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_case_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_run', models.DateField(null=True)),
+                ('locked_until', models.DateTimeField(null=True)),
+                ('holder', models.CharField(blank=True, default='', max_length=100)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 18:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_tasklease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tasklease',
+            name='progress',
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
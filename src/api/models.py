@@ -1,4 +1,6 @@
+from datetime import timedelta
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
 
 
@@ -38,8 +40,9 @@ class Case(models.Model):
     edited_at = models.DateTimeField(auto_now=True)
 
     case_id = models.BigIntegerField(null=True)
+    # Indexed by case_category_created_at_idx instead of an index of its own
     category = models.ForeignKey(
-        Category, on_delete=models.SET_NULL, null=True)
+        Category, on_delete=models.SET_NULL, null=True, db_index=False)
     created_by = models.ForeignKey(
         User, on_delete=models.SET_NULL, null=True, related_name="created_cases")
     edited_by = models.ManyToManyField(
@@ -48,3 +51,58 @@ class Case(models.Model):
     class Meta:
         ordering = ['-created_at', '-id']
         verbose_name_plural = "cases"
+        # Matches how cases are read: listed by (-created_at, -id), counted for statistics by
+        # created_at range together with category or medium, cleared of notes by edited_at and
+        # looked up by case_id.
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='case_created_at_id_idx'),
+            models.Index(fields=['category', 'created_at'], name='case_category_created_at_idx'),
+            models.Index(fields=['medium', 'created_at'], name='case_medium_created_at_idx'),
+            models.Index(fields=['edited_at'], name='case_edited_at_idx'),
+            models.Index(fields=['case_id'], name='case_case_id_idx'),
+        ]
+
+
+class DailyCaseStats(models.Model):
+    """
+    The number of cases and the sum of their times per day, category and medium. Kept up to date
+    when cases are created, updated and deleted through api.interfaces.cases, so statistics for
+    whole days do not have to read every case.
+    """
+    day = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True)
+    medium = models.CharField(max_length=50, null=True)
+
+    count = models.IntegerField(default=0)
+    customer_time = models.DurationField(default=timedelta(0))
+    additional_time = models.DurationField(default=timedelta(0))
+    form_fill_time = models.DurationField(default=timedelta(0))
+
+    class Meta:
+        # NULL values are distinct in unique constraints, so each combination of NULL fields
+        # needs its own constraint.
+        constraints = [
+            models.UniqueConstraint(fields=["day", "category", "medium"],
+                                    name="daily_stats_unique"),
+            models.UniqueConstraint(fields=["day", "medium"], condition=Q(category=None),
+                                    name="daily_stats_unique_no_category"),
+            models.UniqueConstraint(fields=["day", "category"], condition=Q(medium=None),
+                                    name="daily_stats_unique_no_medium"),
+            models.UniqueConstraint(fields=["day"], condition=Q(category=None, medium=None),
+                                    name="daily_stats_unique_no_category_medium"),
+        ]
+        verbose_name_plural = "daily case stats"
+
+
+class TaskLease(models.Model):
+    """
+    Coordinates a scheduled task between processes and servers, so it runs once per day even if
+    several of them try to run it. A process may only run the task while it holds the lease,
+    that is while holder is its name and locked_until has not passed. Tasks that are done in
+    batches save their progress, so they can continue where they stopped if interrupted.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_run = models.DateField(null=True)
+    locked_until = models.DateTimeField(null=True)
+    holder = models.CharField(max_length=100, blank=True, default="")
+    progress = models.BigIntegerField(null=True)
@@ -0,0 +1,36 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from api.models import Category
+from api.interfaces import cases, rollup
+from api.interfaces.cache import bump_data_version
+from api.timing import record_query
+
+
+@receiver(pre_delete, sender=Category)
+def category_pre_delete(sender, instance: Category, **kwargs) -> None:
+    """
+    Moves the daily totals of a category that is being deleted to the totals without category.
+    """
+    rollup.remove_category(instance)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance: Category, **kwargs) -> None:
+    """
+    Clears the cached categories, and changes the case data version since cached statistics
+    include category names.
+    """
+    cases.clear_category_cache()
+    bump_data_version()
+
+
+@receiver(connection_created)
+def add_query_timing(sender, connection, **kwargs) -> None:
+    """
+    Times the queries of every database connection for the request they are made for. The
+    wrapper is kept when the same connection object connects again, so it is only added once.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
@@ -1,8 +1,19 @@
 from datetime import timedelta, datetime, timezone
-from django.test import TestCase
-from api.models import Category, Case
-from api import views
-from django.contrib.auth.models import User
+from django.test import AsyncRequestFactory, TestCase
+from django.http import HttpResponse
+from django.core.management import call_command
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.db.models import Q
+from django.core.serializers.json import DjangoJSONEncoder
+from api.models import Category, Case, DailyCaseStats, TaskLease
+from api import async_views
+from api.interfaces import cases, retention, rollup
+from django.contrib.auth.models import AnonymousUser, User
+from asgiref.sync import sync_to_async
+from unittest import mock
+import csv
+import io
 import json
 
 CASE_PATH = "/api/case"
@@ -104,6 +115,155 @@ class CasesTests(TestCase):
 
         self.assertEqual(response.status_code, 400)
 
+    def test_create_cases_bulk(self) -> None:
+        """
+        Tests that several cases are created at once, with a constant number of queries.
+        """
+        dictionaries = [{"notes": f"Bulk note {i}", "medium": "email" if i % 2 else "phone",
+                         "customer_time": i, "category_id": (i % 5) + 1, "case_id": 5000 + i}
+                        for i in range(20)]
+        cases.get_case_categories()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(CASE_PATH + "/bulk", dictionaries,
+                                        content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(response.status_code, 201)
+
+        ids = json.loads(response.content)["ids"]
+        self.assertEqual(len(ids), 20)
+        created = Case.objects.filter(id__in=ids).order_by("case_id")
+        self.assertEqual([case.case_id for case in created], list(range(5000, 5020)))
+        self.assertTrue(all(case.created_by.username == "user1" for case in created))
+        self.assertEqual(created[3].category_id, 4)
+        self.assertEqual(created[3].customer_time, timedelta(seconds=3))
+
+        # Session, user and one insert, then an update and maybe an insert of the daily totals
+        # of each of the 10 combinations of category and medium
+        statements = [query["sql"] for query in queries.captured_queries
+                      if "SAVEPOINT" not in query["sql"]]
+        rollup_statements = [sql for sql in statements if "api_dailycasestats" in sql]
+        self.assertEqual(len(statements) - len(rollup_statements), 3)
+        self.assertLessEqual(len(rollup_statements), 2 * 10)
+
+    def test_create_cases_bulk_invalid(self) -> None:
+        """
+        Tests that no cases are created if any of them is invalid, and that the errors of every
+        invalid case are returned.
+        """
+        dictionaries = [{"medium": "phone"}, {"medium": "tiktok"}, {"category_id": 945},
+                        {"unknown": 1}, "case", {"case_id": "abc"}, {"category_id": "abc"}]
+        response = self.client.post(CASE_PATH + "/bulk", dictionaries,
+                                    content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(response.status_code, 400)
+        errors = json.loads(response.content)["errors"]
+        self.assertEqual([error["index"] for error in errors], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(Case.objects.count(), 5)
+
+        response = self.client.post(CASE_PATH + "/bulk", {"medium": "phone"},
+                                    content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(response.status_code, 400)
+
+    def test_update_and_delete_cases_bulk(self) -> None:
+        """
+        Tests that cases selected by ids or by a filter are updated and deleted at once, and that
+        the daily statistics are kept up to date.
+        """
+        rollup.rebuild()
+        response = self.client.patch(CASE_PATH + "/bulk",
+                                     {"ids": [1, 2, 3], "changes": {"category_id": 2,
+                                                                    "form_fill_time": 4}},
+                                     content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {"updated": 3})
+        self.assertEqual(Case.objects.filter(category_id=2, form_fill_time=timedelta(seconds=4))
+                         .count(), 3)
+        self.assertEqual(Case.objects.filter(edited_by__username="user1").count(), 3)
+
+        # Cases already edited by the user are not recorded twice
+        user = User.objects.get(username="user1")
+        with CaptureQueriesContext(connection) as queries:
+            updated_count = cases.update_cases({"filter": {"medium": "email"},
+                                                "changes": {"medium": "phone"}}, user)
+        self.assertEqual(updated_count, 2)
+        self.assertEqual(Case.edited_by.through.objects.count(), 4)
+        statements = [query["sql"] for query in queries.captured_queries
+                      if "SAVEPOINT" not in query["sql"] and "dailycasestats" not in query["sql"]]
+        self.assertEqual(len(statements), 4)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(CASE_PATH + "/bulk", {"filter": {"category-id": 2}},
+                                          content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(response.status_code, 200)
+        # The session and the user, the ids and the totals of the cases, and for the one batch
+        # the cases to delete and a DELETE each of edited_by and the cases
+        statements = [query["sql"] for query in queries.captured_queries
+                      if "SAVEPOINT" not in query["sql"] and "dailycasestats" not in query["sql"]]
+        self.assertEqual(len(statements), 7, statements)
+        self.assertEqual(json.loads(response.content), {"deleted": 3})
+        self.assertEqual(Case.objects.count(), 2)
+        self.assertEqual(Case.edited_by.through.objects.count(), 1)
+
+        fields = ["day", "category_id", "medium", "count", "customer_time", "additional_time",
+                  "form_fill_time"]
+        maintained = sorted(DailyCaseStats.objects.filter(count__gt=0).values(*fields), key=str)
+        rollup.rebuild()
+        rebuilt = sorted(DailyCaseStats.objects.values(*fields), key=str)
+        self.assertEqual(maintained, rebuilt)
+
+    def test_update_and_delete_cases_bulk_concurrent(self) -> None:
+        """
+        Tests that a case added after the daily totals are changed by a bulk update or delete,
+        but before the cases are, is left alone, so the totals still match the cases.
+        """
+        rollup.rebuild()
+        fields = ["day", "category_id", "medium", "count", "customer_time", "additional_time",
+                  "form_fill_time"]
+
+        def add_case_after(function):
+            def wrapper(*args, **kwargs):
+                function(*args, **kwargs)
+                cases.create_case({"medium": "email"})
+            return wrapper
+
+        for name, change in [
+            ("change_selected", lambda: cases.update_cases(
+                {"filter": {"medium": "email"}, "changes": {"medium": "phone"}})),
+            ("add_selected", lambda: cases.delete_cases({"filter": {"medium": "email"}})),
+        ]:
+            email_count = Case.objects.filter(medium="email").count()
+            with mock.patch.object(rollup, name, add_case_after(getattr(rollup, name))):
+                self.assertEqual(change(), email_count)
+            self.assertEqual(Case.objects.filter(medium="email").count(), 1)
+
+            maintained = sorted(DailyCaseStats.objects.filter(count__gt=0).values(*fields),
+                                key=str)
+            rollup.rebuild()
+            self.assertEqual(maintained, sorted(DailyCaseStats.objects.values(*fields), key=str))
+
+    def test_update_and_delete_cases_bulk_invalid(self) -> None:
+        """
+        Tests that bulk updates and deletes without a valid selection or changes are rejected.
+        """
+        requests = [
+            {"changes": {"medium": "phone"}},
+            {"ids": [1], "filter": {"medium": "phone"}, "changes": {"medium": "phone"}},
+            {"filter": {}, "changes": {"medium": "phone"}},
+            {"filter": {"page": 1}, "changes": {"medium": "phone"}},
+            {"filter": {"time-start": "yesterday"}, "changes": {"medium": "phone"}},
+            {"ids": ["1"], "changes": {"medium": "phone"}},
+            {"ids": [1], "changes": {"medium": "tiktok"}},
+            {"ids": [1], "changes": {}},
+            {"ids": [1], "changes": {"medium": "phone"}, "other": 1},
+        ]
+        for request in requests:
+            response = self.client.patch(CASE_PATH + "/bulk", request,
+                                         content_type=CONTENT_TYPE_JSON)
+            self.assertEqual(response.status_code, 400, request)
+
+        response = self.client.delete(CASE_PATH + "/bulk", {"filter": {}},
+                                      content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Case.objects.count(), 5)
+
     def test_get_case_without_parameters(self) -> None:
         """
         Tests that cases are returned and in the correct order with correct status code.
@@ -173,6 +333,171 @@ class CasesTests(TestCase):
         data = json.loads(content)
         self.assertEqual(data["cases"][0]["parent_category_name"], "category5")
 
+    def test_get_case_query_count(self) -> None:
+        """
+        Tests that the number of queries needed to get cases does not grow with the number of
+        cases returned, i.e. that category names are not looked up once per case.
+        """
+        for i in range(20):
+            Case.objects.create(medium="phone", category_id=(i % 7) + 1)
+
+        query_counts = []
+        for per_page in [1, 10, 0]:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(CASE_PATH + f"?per-page={per_page}")
+            self.assertEqual(response.status_code, 200)
+            query_counts.append(len(context.captured_queries))
+
+        self.assertEqual(len(set(query_counts)), 1)
+
+    def test_get_case_json_format(self) -> None:
+        """
+        Tests that the cases computed as JSON by the database are the same as when the durations
+        are converted and the cases encoded with DjangoJSONEncoder in Python.
+        """
+        for microsecond in [0, 123, 500000, 999999]:
+            case = Case.objects.create(medium="phone", category_id=6,
+                                       customer_time=timedelta(seconds=3, microseconds=microsecond),
+                                       form_fill_time=timedelta(days=2, microseconds=1))
+            Case.objects.filter(id=case.id).update(
+                created_at=datetime(2023, 4, 24, 10, 26, 0, microsecond, tzinfo=timezone.utc))
+
+        expected = [
+            json.loads(json.dumps(cases.format_case(case), cls=DjangoJSONEncoder))
+            for case in cases.cases_with_category_names(Q()).values()
+        ]
+        data = json.loads(self.client.get(CASE_PATH + "?per-page=0").content.decode())
+        self.assertEqual(data["cases"], expected)
+        self.assertEqual(list(data["cases"][0]), list(expected[0]))
+        created_at = [case["created_at"] for case in data["cases"]]
+        self.assertIn("2023-04-24T10:26:00Z", created_at)
+        self.assertIn("2023-04-24T10:26:00.000Z", created_at)
+
+    def test_get_case_with_cursor(self) -> None:
+        """
+        Tests that paging through cases with cursors returns every case exactly once and in the
+        same order as when pages are disabled, and that invalid cursors are rejected.
+        """
+        for i in range(6):
+            Case.objects.create(medium="email", category_id=(i % 7) + 1)
+
+        response = self.client.get(CASE_PATH + "?per-page=0")
+        expected_ids = [case["id"] for case in json.loads(response.content.decode())["cases"]]
+
+        ids = []
+        cursor = ""
+        while True:
+            response = self.client.get(CASE_PATH, {"per-page": 3, "cursor": cursor})
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.content.decode())
+            ids += [case["id"] for case in data["cases"]]
+            if not data["has_more"]:
+                self.assertIsNone(data["next_cursor"])
+                break
+            cursor = data["next_cursor"]
+
+        self.assertEqual(ids, expected_ids)
+
+        response = self.client.get(CASE_PATH, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(CASE_PATH, {"cursor": "", "page": 2})
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_case_streamed(self) -> None:
+        """
+        Tests that streamed responses contain the same cases as regular responses, both with and
+        without pages, and that invalid parameters still return status 400.
+        """
+        for params in ["?per-page=0", "?per-page=2", "?per-page=2&page=2", "?medium=email"]:
+            response = self.client.get(CASE_PATH + params)
+            expected = json.loads(response.content.decode())
+
+            response = self.client.get(CASE_PATH + params + "&stream=true")
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            data = json.loads(b"".join(response.streaming_content).decode())
+            self.assertEqual(data, expected)
+
+        for chunk_size in [1, 2, 5]:
+            chunks = cases.stream_cases({"per-page": "0"}, chunk_size=chunk_size)
+            data = json.loads("".join(chunks))
+            self.assertEqual(data["result_count"], 5)
+
+        response = self.client.get(CASE_PATH + "?stream=true&invalid-param=abc")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(CASE_PATH + "?stream=maybe")
+        self.assertEqual(response.status_code, 400)
+
+    async def test_get_case_async(self) -> None:
+        """
+        Tests that the async view lists, streams and creates cases the same way as the view used
+        under WSGI.
+        """
+        user = await User.objects.aget(username="user1")
+        factory = AsyncRequestFactory()
+
+        async def get(params: str) -> HttpResponse:
+            request = factory.get(CASE_PATH + params)
+            request.user = user
+            return await async_views.case(request)
+
+        for params in ["", "?per-page=2", "?per-page=2&cursor=", "?category-id=3",
+                       "?category-id=945", "?wrong=1"]:
+            async_response = await get(params)
+            sync_response = await sync_to_async(self.client.get)(CASE_PATH + params)
+            self.assertEqual(async_response.status_code, sync_response.status_code)
+            self.assertEqual(async_response.content, sync_response.content)
+
+        async_response = await get("?per-page=3&stream=true")
+        streamed = b"".join([chunk async for chunk in async_response.streaming_content])
+        sync_response = await sync_to_async(self.client.get)(CASE_PATH + "?per-page=3")
+        self.assertEqual(json.loads(streamed), json.loads(sync_response.content))
+
+        request = factory.post(CASE_PATH, {"medium": "phone", "case_id": 6001},
+                               content_type=CONTENT_TYPE_JSON)
+        request.user = user
+        response = await async_views.case(request)
+        self.assertEqual(response.status_code, 201)
+        case = await Case.objects.select_related("created_by").aget(case_id=6001)
+        self.assertEqual(case.created_by.username, "user1")
+
+        request = factory.get(CASE_PATH)
+        request.user = AnonymousUser()
+        response = await async_views.case(request)
+        self.assertEqual(response.status_code, 401)
+        request = factory.delete(CASE_PATH)
+        request.user = user
+        response = await async_views.case(request)
+        self.assertEqual(response.status_code, 405)
+
+    def test_export_cases(self) -> None:
+        """
+        Tests that cases can be exported as NDJSON and CSV with durations in seconds and category
+        names included, that filters are applied and that invalid parameters return status 400.
+        """
+        response = self.client.get(CASE_PATH + "/export?medium=phone")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        exported = [json.loads(line) for line in lines]
+        self.assertEqual(len(exported), 2)
+        self.assertEqual(exported[0]["customer_time"], 90)
+        self.assertEqual(exported[0]["category_name"], "subcategory51")
+        self.assertEqual(exported[0]["parent_category_name"], "category5")
+
+        response = self.client.get(CASE_PATH + "/export?format=csv&category-id=3")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        rows = list(csv.DictReader(lines))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(float(rows[0]["additional_time"]), 20)
+        self.assertEqual(rows[0]["category_name"], "category3")
+
+        for params in ["?format=xml", "?per-page=10", "?category-id=12"]:
+            response = self.client.get(CASE_PATH + "/export" + params)
+            self.assertEqual(response.status_code, 400)
+
     def test_patch_case(self) -> None:
         """
         Test the ability to update a case using PATCH request. Tests that the endpoint returns 204
@@ -200,6 +525,45 @@ class CasesTests(TestCase):
                                      content_type=CONTENT_TYPE_JSON)
         self.assertEqual(response.status_code, 400)
 
+    def test_write_query_count(self) -> None:
+        """
+        Tests that creating a case is a single INSERT, and that updating a case is a SELECT, an
+        UPDATE of the given fields and one INSERT recording who edited it, apart from the session,
+        the user and the daily totals.
+        """
+        cases.get_case_categories()
+
+        def case_statements(queries: CaptureQueriesContext) -> list:
+            return [query["sql"] for query in queries.captured_queries
+                    if "SAVEPOINT" not in query["sql"] and "dailycasestats" not in query["sql"]]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(CASE_PATH, {"notes": "notes", "medium": "phone",
+                                                    "category_id": 2, "customer_time": 3},
+                                        content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(response.status_code, 201)
+        statements = case_statements(queries)
+        self.assertEqual(len(statements), 3)
+        self.assertTrue(statements[2].startswith('INSERT INTO "api_case"'))
+        created = Case.objects.get(notes="notes")
+        self.assertEqual(created.created_by.username, "user1")
+
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.patch(CASE_PATH + f"/{created.id}", {"medium": "email"},
+                                             content_type=CONTENT_TYPE_JSON)
+            self.assertEqual(response.status_code, 204)
+            statements = case_statements(queries)
+            self.assertEqual(len(statements), 5)
+            self.assertIn('SET "medium" = ', statements[3])
+            self.assertNotIn('"notes"', statements[3])
+
+        created.refresh_from_db()
+        self.assertEqual(created.medium, "email")
+        self.assertEqual(created.notes, "notes")
+        self.assertGreater(created.edited_at, created.created_at)
+        self.assertEqual(list(created.edited_by.values_list("username", flat=True)), ["user1"])
+
     def test_nested_categories(self) -> None:
         """
         Tests nested categories by sending a GET request to the "/api/case/categories" endpoint
@@ -226,6 +590,28 @@ class CasesTests(TestCase):
 
         self.assertEqual(count, 7)
 
+    def test_categories_cached_with_etag(self) -> None:
+        """
+        Tests that categories are read from the database only after they change, and that the
+        categories endpoint responds with 304 when the categories match the given ETag.
+        """
+        response = self.client.get("/api/case/categories")
+        etag = response["ETag"]
+
+        with self.assertNumQueries(0):
+            cases.get_case_categories()
+            cases.get_category_names()
+
+        response = self.client.get("/api/case/categories", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Category.objects.create(name="category6")
+
+        response = self.client.get("/api/case/categories", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(json.loads(response.content.decode())[-1]["name"], "category6")
+
     def test_delete_case_correct_id(self) -> None:
         """
         Tests that the check endpoint returns a 204 status code when a case is found
@@ -300,6 +686,30 @@ class CasesTests(TestCase):
         self.assertEqual(len(edited_by), 1)
         self.assertEqual(edited_by_username, "user2")
 
+    def test_daily_stats_kept_up_to_date(self) -> None:
+        """
+        Tests that the daily case statistics are updated when cases are created, updated and
+        deleted, by comparing them to statistics rebuilt from all cases.
+        """
+        rollup.rebuild()
+
+        dictionary = {"medium": "phone", "customer_time": 30, "category_id": 2}
+        self.client.post(CASE_PATH, dictionary, content_type=CONTENT_TYPE_JSON)
+        self.client.post(CASE_PATH, {"medium": "email"}, content_type=CONTENT_TYPE_JSON)
+        self.client.patch(CASE_PATH + "/3", {"category_id": 4, "customer_time": 10},
+                          content_type=CONTENT_TYPE_JSON)
+        self.client.patch(CASE_PATH + "/4", {"form_fill_time": 7},
+                          content_type=CONTENT_TYPE_JSON)
+        self.client.delete(CASE_PATH + "/5")
+
+        fields = ["day", "category_id", "medium", "count", "customer_time", "additional_time",
+                  "form_fill_time"]
+        maintained = DailyCaseStats.objects.filter(count__gt=0).values(*fields)
+        maintained = sorted(maintained, key=str)
+        rollup.rebuild()
+        rebuilt = sorted(DailyCaseStats.objects.values(*fields), key=str)
+        self.assertEqual(maintained, rebuilt)
+
     def test_GDPR_clean(self) -> None:
         """
         Tests that the GDPR clean method works as intended.
@@ -323,10 +733,89 @@ class CasesTests(TestCase):
         Case.objects.filter(case_id=4201).update(edited_at=time1)
         Case.objects.filter(case_id=4202).update(edited_at=time2)
 
-        views.set_cleaned_for_testing()     # Sets
-        self.client.get(CASE_PATH + "?case_id=4201")
+        self.assertEqual(retention.run_notes_retention(), 1)
 
         case1 = Case.objects.get(case_id=4201)
         case2 = Case.objects.get(case_id=4202)
         self.assertEqual(case1.notes, None)
         self.assertEqual(case2.notes, "This note should not be cleared")
+
+    def test_notes_retention_in_batches(self) -> None:
+        """
+        Tests that old notes are removed in batches, and that an interrupted run is continued
+        after the last finished batch.
+        """
+        old = datetime.now(timezone.utc) - timedelta(days=100)
+        old_ids = [Case.objects.create(notes=f"Old note {i}").id for i in range(5)]
+        Case.objects.filter(id__in=old_ids).update(edited_at=old)
+        Case.objects.filter(id=old_ids[2]).update(notes=None)
+
+        batches = []
+
+        def interrupt(last_id: int, cleared_count: int, seconds: float) -> None:
+            batches.append((last_id, cleared_count))
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            retention.run_notes_retention(batch_size=2, pause=0, on_batch=interrupt)
+        self.assertEqual(batches, [(old_ids[1], 2)])
+        self.assertEqual(TaskLease.objects.get(name=retention.NOTES_TASK).progress, old_ids[1])
+
+        # Notes already removed are skipped
+        batches.clear()
+        cleared_count = retention.run_notes_retention(
+            batch_size=2, pause=0, on_batch=lambda *batch: batches.append(batch[:2]))
+        self.assertEqual(cleared_count, 2)
+        self.assertEqual(batches, [(old_ids[4], 2)])
+        self.assertIsNone(TaskLease.objects.get(name=retention.NOTES_TASK).progress)
+        self.assertFalse(Case.objects.filter(id__in=old_ids, notes__isnull=False).exists())
+        self.assertEqual(Case.objects.filter(notes__isnull=False).count(), 3)
+
+    def test_notes_retention_runs_once_per_day(self) -> None:
+        """
+        Tests that old notes are removed once per day, by only one process at a time.
+        """
+        today = datetime.now(timezone.utc).date()
+        self.assertTrue(retention.acquire_lease("task", "process1", today))
+        self.assertFalse(retention.acquire_lease("task", "process2", today))
+        self.assertFalse(retention.acquire_lease("task", "process2", today, force=True))
+
+        # Not completed, so another process may run it today
+        retention.release_lease("task", "process1")
+        self.assertTrue(retention.acquire_lease("task", "process2", today))
+        retention.release_lease("task", "process2", completed_on=today)
+        self.assertFalse(retention.acquire_lease("task", "process1", today))
+        self.assertTrue(retention.acquire_lease("task", "process1", today + timedelta(days=1)))
+        retention.release_lease("task", "process1")
+
+        # A lease that has expired can be taken over
+        self.assertTrue(retention.acquire_lease("task", "process1", today, force=True))
+        TaskLease.objects.filter(name="task").update(
+            locked_until=datetime.now(timezone.utc) - timedelta(seconds=1))
+        self.assertTrue(retention.acquire_lease("task", "process2", today, force=True))
+
+        self.assertEqual(retention.run_notes_retention(), 0)
+        self.assertIsNone(retention.run_notes_retention())
+        self.assertEqual(retention.run_notes_retention(force=True), 0)
+
+    def test_generate_example_data(self) -> None:
+        """
+        Tests that the example data replaces the cases and categories, is the same for the same
+        seed, and comes with users and daily totals.
+        """
+        def generate() -> list:
+            call_command("generate_example_data", "--cases", "250", "--days", "10",
+                         "--batch-size", "100", "--noinput", stdout=io.StringIO())
+            return list(Case.objects.order_by("id").values_list(
+                "case_id", "medium", "category__name", "created_by__username"))
+
+        first = generate()
+        self.assertEqual(Case.objects.count(), 250)
+        self.assertFalse(Category.objects.filter(name="category1").exists())
+        self.assertEqual(User.objects.filter(username__startswith="example").count(), 5)
+        self.assertTrue(Case.edited_by.through.objects.exists())
+        self.assertEqual(sum(DailyCaseStats.objects.values_list("count", flat=True)), 250)
+        oldest = datetime.now(timezone.utc) - timedelta(days=11)
+        self.assertFalse(Case.objects.filter(created_at__lt=oldest).exists())
+
+        self.assertEqual(generate(), first)
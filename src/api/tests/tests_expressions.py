@@ -0,0 +1,114 @@
+from datetime import timedelta, datetime, timezone
+from django.test import TestCase
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, NotSupportedError
+from django.db.models import Expression
+from api.models import Category, Case
+from api.expressions import DurationSeconds, EpochMicroseconds, IsoTimestamp, JSONText
+from api.interfaces import cases
+from unittest import skipIf
+import json
+
+try:
+    from django.db.backends.postgresql.base import DatabaseWrapper as PostgreSQLDatabaseWrapper
+except ImproperlyConfigured:
+    # psycopg is only installed where PostgreSQL is used
+    PostgreSQLDatabaseWrapper = None
+
+# The SQL of IsoTimestamp for PostgreSQL, with {0} in place of the datetime
+ISO_TIMESTAMP_SQL = ("(TO_CHAR({0} AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS')"
+                     " || CASE WHEN TO_CHAR({0}, 'US') = '000000'"
+                     " THEN '' ELSE TO_CHAR({0} AT TIME ZONE 'UTC', '.MS') END || 'Z')")
+
+
+class ExpressionsTests(TestCase):
+
+    def setUp(self) -> None:
+        self.case = Case.objects.create(
+            category=Category.objects.create(name="category1"),
+            customer_time=timedelta(minutes=1, microseconds=500000))
+        Case.objects.filter(id=self.case.id).update(
+            created_at=datetime(2023, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc),
+            edited_at=datetime(2023, 1, 2, 3, 4, 5, tzinfo=timezone.utc))
+
+    def test_expressions_sqlite(self) -> None:
+        """
+        Tests the values of the expressions on the test database.
+        """
+        queryset = Case.objects.filter(id=self.case.id).annotate(
+            epoch=EpochMicroseconds("created_at"), seconds=DurationSeconds("customer_time"),
+            created=IsoTimestamp("created_at"), edited=IsoTimestamp("edited_at"),
+            json=JSONText(id="id", created_at=IsoTimestamp("created_at")))
+        values = queryset.values("epoch", "seconds", "created", "edited", "json").get()
+
+        created_at = datetime(2023, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc)
+        self.assertEqual(values["epoch"], int(created_at.timestamp()) * 1000000 + 678901)
+        self.assertEqual(values["seconds"], 60.5)
+        self.assertEqual(values["created"], "2023-01-02T03:04:05.678Z")
+        self.assertEqual(values["edited"], "2023-01-02T03:04:05Z")
+        self.assertEqual(values["json"],
+                         json.dumps({"id": self.case.id, "created_at": values["created"]},
+                                    separators=(",", ":")))
+
+    def test_expressions_not_supported(self) -> None:
+        """
+        Tests that the expressions fail on databases other than SQLite and PostgreSQL.
+        """
+        compiler = Case.objects.all().query.get_compiler(connection=connection)
+        for expression in (EpochMicroseconds("created_at"), DurationSeconds("customer_time"),
+                           IsoTimestamp("created_at")):
+            with self.assertRaises(NotSupportedError):
+                expression.resolve_expression(compiler.query).as_sql(compiler, connection)
+
+
+@skipIf(PostgreSQLDatabaseWrapper is None, "psycopg is not installed")
+class PostgreSQLExpressionsTests(TestCase):
+    """
+    The expressions compiled for PostgreSQL, which the tests do not run on. Compiling a query does
+    not connect to the database.
+    """
+
+    def setUp(self) -> None:
+        self.connection = PostgreSQLDatabaseWrapper({
+            **connection.settings_dict, "ENGINE": "django.db.backends.postgresql",
+            "NAME": "expressions",
+        })
+
+    def compile(self, expression: Expression):
+        """
+        Returns the SQL and the parameters of a query that selects an expression for all cases.
+        """
+        query = Case.objects.order_by().annotate(value=expression).values("value").query
+        return query.get_compiler(connection=self.connection).as_sql()
+
+    def test_epoch_microseconds_postgresql(self) -> None:
+        sql, params = self.compile(EpochMicroseconds("created_at"))
+        self.assertEqual(sql, 'SELECT CAST(ROUND(EXTRACT(EPOCH FROM "api_case"."created_at")'
+                              ' * 1000000) AS BIGINT) AS "value" FROM "api_case"')
+        self.assertEqual(params, ())
+
+    def test_duration_seconds_postgresql(self) -> None:
+        sql, params = self.compile(DurationSeconds("customer_time"))
+        self.assertEqual(sql, 'SELECT CAST(EXTRACT(EPOCH FROM "api_case"."customer_time")'
+                              ' AS DOUBLE PRECISION) AS "value" FROM "api_case"')
+        self.assertEqual(params, ())
+
+    def test_iso_timestamp_postgresql(self) -> None:
+        sql, params = self.compile(IsoTimestamp("created_at"))
+        self.assertEqual(sql, "SELECT " + ISO_TIMESTAMP_SQL.format('"api_case"."created_at"')
+                         + ' AS "value" FROM "api_case"')
+        self.assertEqual(params, ())
+
+    def test_json_text_postgresql(self) -> None:
+        """
+        Tests that JSONText builds JSON text with JSON_BUILD_OBJECT, which keeps the order of the
+        keys, instead of JSONB_BUILD_OBJECT.
+        """
+        sql, params = self.compile(cases.case_json(["id", "customer_time", "created_at"]))
+        self.assertEqual(
+            sql, 'SELECT CAST(JSON_BUILD_OBJECT((%s)::text, "api_case"."id", (%s)::text,'
+                 ' CAST(EXTRACT(EPOCH FROM "api_case"."customer_time") AS DOUBLE PRECISION),'
+                 ' (%s)::text, ' + ISO_TIMESTAMP_SQL.format('"api_case"."created_at"')
+                 + ') AS TEXT) AS "value" FROM "api_case"')
+        self.assertEqual(params, ("id", "customer_time", "created_at"))
+        self.assertNotIn("JSONB", sql)
@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta, timezone
+from statistics import median
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import quote
+import json
+import random
+import time
+from django.contrib.auth.models import User
+from django.db import connection
+from django.http import HttpResponse
+from django.test import TestCase
+from django.test.utils import override_settings
+from api.interfaces import rollup
+from api.management.benchmark import NO_CACHE
+from api.management.seed import seed_cases, seed_categories
+from api.models import Case, Category
+
+SMALL_SIZE = 10
+LARGE_SIZE = 10000
+REPEAT = 5
+
+# A request that does not depend on the number of cases may be at most this many times slower
+# with LARGE_SIZE cases than with SMALL_SIZE. Loose enough for slow test machines, but far below
+# the ratio of the sizes, which work per case would come close to.
+MAX_TIME_RATIO = 5
+
+
+@override_settings(CACHES=NO_CACHE)
+class PerformanceTests(TestCase):
+    """
+    Tests that the number of queries of every endpoint stays within its budget and does not
+    grow with the number of cases, and that requests which should not depend on the number of
+    cases do not get much slower as it grows. Catches per-case and per-category queries (N+1)
+    and full table scans.
+    """
+
+    def setUp(self) -> None:
+        seed_categories()
+        self.user = User.objects.create(username="performance")
+        self.client.force_login(self.user)
+        self.category_id = Category.objects.order_by("id").values_list("id", flat=True).first()
+
+    def endpoints(self) -> List[Tuple[str, int, bool, Callable[[], HttpResponse]]]:
+        """
+        Returns the requests to test by name, each with its query budget, whether its time should
+        not depend on the number of cases, and a function that makes it.
+        """
+        now = datetime.now(timezone.utc)
+        month = (f"start-time={quote((now - timedelta(days=30)).isoformat())}"
+                 f"&end-time={quote(now.isoformat())}")
+        own_case = Case.objects.filter(created_by=self.user).values_list("id", flat=True).first()
+        new_case = {"medium": "phone", "customer_time": 60, "category_id": self.category_id}
+
+        def get(url: str) -> Callable[[], HttpResponse]:
+            return lambda: self.client.get(url)
+
+        def send(method: str, url: str, body: object) -> Callable[[], HttpResponse]:
+            return lambda: self.client.generic(method, url, json.dumps(body), "application/json")
+
+        # The session and the user are read by every request that needs a login
+        return [
+            ("GET /api/case", 3, True, get("/api/case?per-page=100")),
+            ("GET /api/case by category", 3, True,
+             get(f"/api/case?per-page=100&category-id={self.category_id}")),
+            ("GET /api/case streamed", 3, True, get("/api/case?per-page=100&stream=true")),
+            ("GET /api/case/export", 3, False, get("/api/case/export?format=csv")),
+            ("GET /api/case/categories", 0, True, get("/api/case/categories")),
+            ("GET /api/stats/medium", 2, True, get(f"/api/stats/medium?{month}")),
+            ("GET /api/stats/category", 2, True, get(f"/api/stats/category?{month}")),
+            ("GET /api/stats/periods", 1, True, get(
+                f"/api/stats/periods?start-time={quote((now - timedelta(days=30)).isoformat())}"
+                f"&delta=86400&intervals=30")),
+            ("POST /api/case", 4, True, send("POST", "/api/case", new_case)),
+            ("POST /api/case/bulk", 4, True, send("POST", "/api/case/bulk", [new_case] * 20)),
+            ("PATCH /api/case/<int:id>", 5, True,
+             send("PATCH", f"/api/case/{own_case}", {"notes": "Edited"})),
+            ("GET /api/status", 0, True, get("/api/status")),
+        ]
+
+    def measure(self) -> Dict[str, Tuple[int, float]]:
+        """
+        Makes every request, after one request that warms up the caches of the process, and
+        returns its number of queries and median time in seconds.
+        """
+        results = {}
+        for name, budget, _, request in self.endpoints():
+            request()
+            queries: List[str] = []
+
+            def count(execute, sql, params, many, context):
+                # Savepoints only come from the transaction each test runs in
+                if "SAVEPOINT" not in sql:
+                    queries.append(sql)
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count):
+                response = read(request())
+            self.assertLess(response.status_code, 400, name)
+            self.assertLessEqual(len(queries), budget, f"{name}: {queries}")
+
+            times = []
+            for _ in range(REPEAT):
+                start = time.perf_counter()
+                read(request())
+                times.append(time.perf_counter() - start)
+            results[name] = (len(queries), median(times))
+        return results
+
+    def test_query_budgets_and_scaling(self) -> None:
+        """
+        Tests that every endpoint makes the same number of queries, within its budget, with
+        SMALL_SIZE and LARGE_SIZE cases, and that those that should not depend on the number of
+        cases are at most MAX_TIME_RATIO times slower with LARGE_SIZE cases.
+        """
+        rng = random.Random(0)
+        seed_cases(SMALL_SIZE, rng)
+        # The first page of cases is a full page, also with few cases
+        self.client.post("/api/case/bulk", [{"medium": "email"}] * 100,
+                         content_type="application/json")
+        rollup.rebuild()
+        small = self.measure()
+
+        seed_cases(LARGE_SIZE - Case.objects.count(), rng)
+        rollup.rebuild()
+        large = self.measure()
+
+        for name, _, constant_time, _ in self.endpoints():
+            self.assertEqual(large[name][0], small[name][0], f"Queries of {name}")
+            if constant_time:
+                self.assertLess(large[name][1], small[name][1] * MAX_TIME_RATIO,
+                                f"Time of {name}")
+
+
+def read(response: HttpResponse) -> HttpResponse:
+    """
+    Reads the whole response, also when it is streamed.
+    """
+    if response.streaming:
+        b"".join(response.streaming_content)
+    return response
@@ -1,13 +1,26 @@
 from datetime import timedelta
-from django.test import TestCase
+from django.test import AsyncRequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.db import connection
 from api.models import Category, Case
-from datetime import datetime, timezone
+from api import async_views
+from api.metrics import MetricsCollector, get_collector
+from api.interfaces import cases, rollup, stats
+from django.core.cache import cache
+from datetime import datetime, time, timezone
+from asgiref.sync import sync_to_async
+from pathlib import Path
+from time import sleep
 import json
+import sqlite3
+import tempfile
 
 
 class StatsTests(TestCase):
 
     def setUp(self) -> None:
+        cache.clear()
+
         Category.objects.create(name="stat_category1")
         Category.objects.create(name="stat_category2")
         p = Category.objects.create(name="stat_category3")
@@ -29,6 +42,9 @@ class StatsTests(TestCase):
                             customer_time=timedelta(seconds=160),
                             category_id=5)
 
+        # The cases above are not created through the API, so the daily totals are rebuilt
+        rollup.rebuild()
+
     def test_count_medium(self) -> None:
         """
         Tests the API endpoint /api/stats/medium by making various requests with different
@@ -81,6 +97,37 @@ class StatsTests(TestCase):
         self.assertEqual(data[2]["subcategories"][1]["customer_time"], 160)
         self.assertEqual(response.status_code, 200)
 
+    def test_stats_per_category_query_count(self) -> None:
+        """
+        Tests that the number of queries needed for /api/stats/category does not grow with the
+        number of categories, and that subcategory totals are added to their parent category.
+        """
+        end = (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+        start = (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
+        url = ("/api/stats/category?start-time=" + start + "&end-time=" + end).replace("+", "%2B")
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        query_count = len(context.captured_queries)
+
+        for i in range(10):
+            parent = Category.objects.create(name=f"parent{i}")
+            child = Category.objects.create(name=f"child{i}", parent=parent)
+            Case.objects.create(medium="email", customer_time=timedelta(seconds=i),
+                                category=child)
+        rollup.rebuild()
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(len(context.captured_queries), query_count)
+
+        data = json.loads(response.content.decode())
+        self.assertEqual(len(data), 13)
+        self.assertEqual(data[2]["count"], 2)
+        self.assertEqual(data[-1]["count"], 1)
+        self.assertEqual(data[-1]["customer_time"], 9)
+        self.assertEqual(data[-1]["subcategories"][0]["customer_time"], 9)
+
     def test_stats_per_day(self) -> None:
         """
         Tests the API endpoint /api/stats/day by making various requests with different
@@ -103,3 +150,286 @@ class StatsTests(TestCase):
         for url in urls:
             response = self.client.get(url.replace("+", "%2B"))
             self.assertEqual(response.status_code, urls[url])
+
+    def test_stats_per_period_buckets(self) -> None:
+        """
+        Tests that /api/stats/periods counts cases on the boundary between two periods in both
+        periods, for positive and negative deltas, and that the counts are computed with the same
+        number of queries regardless of the number of intervals.
+        """
+        start = datetime(2023, 1, 1, tzinfo=timezone.utc)
+        for hours in [0, 1, 1.5, 2, 3.999, 5, 24, -1, -1.5]:
+            case = Case.objects.create(medium="email")
+            Case.objects.filter(id=case.id).update(created_at=start + timedelta(hours=hours))
+
+        url = "/api/stats/periods?start-time=" + start.isoformat().replace("+", "%2B")
+
+        response = self.client.get(url + "&delta=3600&intervals=6")
+        self.assertEqual(response.status_code, 200)
+        counts = [period["count"] for period in json.loads(response.content.decode())]
+        self.assertEqual(counts, [2, 3, 1, 1, 1, 1])
+
+        response = self.client.get(url + "&delta=-3600&intervals=3")
+        counts = [period["count"] for period in json.loads(response.content.decode())]
+        self.assertEqual(counts, [2, 2, 0])
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url + "&delta=3600&intervals=24")
+        query_count = len(context.captured_queries)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url + "&delta=3600&intervals=720")
+        self.assertEqual(len(context.captured_queries), query_count)
+        self.assertEqual(len(json.loads(response.content.decode())), 720)
+
+        response = self.client.get(url + "&delta=0&intervals=24")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url + "&delta=3600&intervals=10001")
+        self.assertEqual(response.status_code, 400)
+
+    def test_stats_from_daily_totals(self) -> None:
+        """
+        Tests that statistics combining daily totals for whole days with cases on partial days give
+        the same result as counting the cases directly.
+        """
+        day = datetime(2023, 3, 1, tzinfo=timezone.utc)
+        for hours in [0, 5, 24, 30.5, 47.99, 48, 60, 72, 100]:
+            for medium, category_id in [("phone", 2), ("email", 4)]:
+                case = Case.objects.create(medium=medium, category_id=category_id,
+                                           customer_time=timedelta(seconds=10))
+                Case.objects.filter(id=case.id).update(created_at=day + timedelta(hours=hours))
+        rollup.rebuild()
+
+        ranges = [(day, day + timedelta(days=3)),
+                  (day + timedelta(hours=5), day + timedelta(hours=60)),
+                  (day + timedelta(hours=6), day + timedelta(hours=30)),
+                  (day - timedelta(days=1), day + timedelta(days=10))]
+        for start, end in ranges:
+            cases = Case.objects.filter(created_at__gte=start, created_at__lte=end)
+            medium_count = stats.get_medium_count(start, end)
+            self.assertEqual(medium_count["phone"], cases.filter(medium="phone").count())
+            self.assertEqual(medium_count["email"], cases.filter(medium="email").count())
+
+            category_stats = stats.get_stats_per_category(start, end)
+            self.assertEqual(category_stats[1]["count"], cases.filter(category_id=2).count())
+            self.assertEqual(category_stats[2]["count"], cases.filter(category_id=4).count())
+            self.assertEqual(category_stats[2]["customer_time"],
+                             10 * cases.filter(category_id=4).count())
+
+        for delta in [timedelta(days=1), timedelta(days=-1), timedelta(days=2)]:
+            periods = stats.get_stats_per_period(day + timedelta(days=1), delta, 3)
+            for period in periods:
+                start, end = sorted([datetime.fromisoformat(period["start"]),
+                                     datetime.fromisoformat(period["end"])])
+                expected = Case.objects.filter(created_at__gte=start, created_at__lte=end).count()
+                self.assertEqual(period["count"], expected)
+
+        # As many periods as allowed, with the cases at midnight counted in two periods each
+        periods = stats.get_stats_per_period(day - timedelta(days=5000), timedelta(days=1),
+                                             stats.MAX_TIME_PERIODS)
+        self.assertEqual(len(periods), stats.MAX_TIME_PERIODS)
+        self.assertEqual(sum(period["count"] for period in periods), Case.objects.count() + 8)
+
+    @override_settings(STATS_CACHE_TIMEOUT=300)
+    def test_stats_cache(self) -> None:
+        """
+        Tests that repeated statistics requests are served from the cache, and that the cache is
+        not used once cases have changed.
+        """
+        end = (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+        start = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
+        url = ("/api/stats/medium?start-time=" + start + "&end-time=" + end).replace("+", "%2B")
+
+        first = json.loads(self.client.get(url).content.decode())
+        second = json.loads(self.client.get(url).content.decode())
+        self.assertEqual(first, second)
+        status = json.loads(self.client.get("/api/status").content.decode())
+        self.assertEqual(status["stats_cache"]["hits"], 1)
+        self.assertEqual(status["stats_cache"]["misses"], 1)
+
+        cases.create_case({"medium": "phone"})
+        third = json.loads(self.client.get(url).content.decode())
+        self.assertEqual(third["phone"], first["phone"] + 1)
+        status = json.loads(self.client.get("/api/status").content.decode())
+        self.assertEqual(status["stats_cache"]["misses"], 2)
+        # Connections are only pooled with PostgreSQL
+        self.assertEqual(status["database_pools"], {})
+
+        # Not cached at all without a timeout
+        with override_settings(STATS_CACHE_TIMEOUT=0):
+            self.client.get(url)
+            self.client.get(url)
+        status = json.loads(self.client.get("/api/status").content.decode())
+        self.assertEqual(status["stats_cache"]["misses"], 4)
+
+    @override_settings(STATS_CACHE_TIMEOUT=300)
+    def test_stats_cache_time_zones(self) -> None:
+        """
+        Tests that requests for the same periods in different time zones are cached apart, so
+        each gets the period starts in the time zone it was given in.
+        """
+        for start in ["2023-01-01T00:00:00+00:00", "2023-01-01T01:00:00+01:00"]:
+            url = ("/api/stats/periods?start-time=" + start + "&delta=86400&intervals=2")
+            periods = json.loads(self.client.get(url.replace("+", "%2B")).content.decode())
+            self.assertEqual(periods[0]["start"], start)
+            self.assertEqual(periods[1]["start"], start.replace("-01T", "-02T"))
+
+    def test_request_timing(self) -> None:
+        """
+        Tests that the time, database queries and phases of a request are sent in the
+        Server-Timing header and logged together with the view.
+        """
+        end = (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+        start = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
+        url = ("/api/stats/category?start-time=" + start + "&end-time=" + end).replace("+", "%2B")
+
+        with self.assertLogs("api.timing", "INFO") as logs:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        metrics = [metric.split(";")[0] for metric in response["Server-Timing"].split(", ")]
+        self.assertEqual(metrics, ["total", "db", "query", "serialize"])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["view"], "api.views.stats_per_category")
+        self.assertEqual(record["status"], 200)
+        self.assertEqual(record["queries"], len(context.captured_queries))
+        self.assertGreater(record["queries"], 0)
+        self.assertLessEqual(record["db_ms"], record["total_ms"])
+        self.assertEqual(set(record["phases_ms"]), {"query", "serialize"})
+
+    async def test_request_timing_async(self) -> None:
+        """
+        Tests that queries made in other threads during async requests are counted.
+        """
+        end = (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+        start = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
+        url = ("/api/stats/medium?start-time=" + start + "&end-time=" + end).replace("+", "%2B")
+
+        with self.assertLogs("api.timing", "INFO") as logs:
+            response = await self.async_client.get(url)
+        self.assertIn("Server-Timing", response)
+        self.assertGreater(json.loads(logs.records[0].getMessage())["queries"], 0)
+
+    def test_metrics(self) -> None:
+        """
+        Tests that requests, statistics cache hits and misses and database queries are counted per
+        URL pattern in /api/metrics.
+        """
+        end = (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+        start = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
+        url = ("/api/stats/medium?start-time=" + start + "&end-time=" + end).replace("+", "%2B")
+
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(METRICS=True, METRICS_DATABASE=Path(directory) / "metrics",
+                                   STATS_CACHE_TIMEOUT=300):
+                self.client.get(url)
+                self.client.get(url)
+                self.client.get("/api/case/12345")
+                response = self.client.get("/api/metrics")
+                get_collector().stop()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4")
+
+        lines = response.content.decode().splitlines()
+        route = 'method="GET",route="/api/stats/medium"'
+        self.assertIn("# TYPE api_request_duration_seconds histogram", lines)
+        self.assertIn('api_requests_total{' + route + ',status="200"} 2', lines)
+        self.assertIn('api_requests_total{method="GET",route="/api/case/<int:id>",status="401"} 1',
+                      lines)
+        self.assertIn('api_request_duration_seconds_bucket{le="+Inf",' + route + '} 2', lines)
+        self.assertIn('api_request_duration_seconds_count{' + route + '} 2', lines)
+        self.assertIn('api_stats_cache_requests_total{result="hit"} 1', lines)
+        self.assertIn('api_stats_cache_requests_total{result="miss"} 1', lines)
+        # The miss queries the database, the hit does not
+        self.assertIn('api_db_queries_bucket{le="0",' + route + '} 1', lines)
+
+    def test_metrics_disabled(self) -> None:
+        """
+        Tests that /api/metrics is not found when metrics are disabled.
+        """
+        with override_settings(METRICS=False):
+            self.assertEqual(self.client.get("/api/metrics").status_code, 404)
+
+    def test_metrics_processes(self) -> None:
+        """
+        Tests that the metrics of several processes sharing the metrics database are added up.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = str(Path(directory) / "metrics")
+            first, second = MetricsCollector(path, 60), MetricsCollector(path, 60)
+            labels = (("route", "/api/case"), ("method", "GET"))
+            first.observe("api_db_queries", labels, 1, [1, 2])
+            second.observe("api_db_queries", labels, 2, [1, 2])
+            second.flush()
+            second.observe("api_db_queries", labels, 3, [1, 2])
+            # Pending metrics of other processes are only seen once they are flushed
+            self.assertIn('api_db_queries_count{method="GET",route="/api/case"} 2',
+                          second.render())
+            lines = first.render().splitlines()
+        self.assertIn('api_db_queries_bucket{le="1",method="GET",route="/api/case"} 1', lines)
+        self.assertIn('api_db_queries_bucket{le="2",method="GET",route="/api/case"} 2', lines)
+        self.assertIn('api_db_queries_bucket{le="+Inf",method="GET",route="/api/case"} 3', lines)
+        self.assertIn('api_db_queries_sum{method="GET",route="/api/case"} 6', lines)
+
+    def test_metrics_flush(self) -> None:
+        """
+        Tests that metrics are written by the thread of the collector, and that metrics that could
+        not be written are kept for the next flush.
+        """
+        labels = (("route", "/api/case"), ("method", "GET"))
+        line = 'api_db_queries_count{method="GET",route="/api/case"} '
+        with tempfile.TemporaryDirectory() as directory:
+            path = str(Path(directory) / "metrics")
+            # A directory can not be opened as a database
+            failing = MetricsCollector(directory, 60)
+            failing.observe("api_db_queries", labels, 1, [1])
+            with self.assertRaises(sqlite3.Error):
+                failing.flush()
+            failing.path = path
+            failing.flush()
+            self.assertIn(line + "1", MetricsCollector(path, 60).render().splitlines())
+
+            collector = MetricsCollector(path, 0.01)
+            collector.start()
+            collector.observe("api_db_queries", labels, 1, [1])
+            for _ in range(500):
+                lines = MetricsCollector(path, 60).render().splitlines()
+                if line + "2" in lines:
+                    break
+                sleep(0.01)
+            collector.stop()
+        self.assertIn(line + "2", lines)
+
+    async def test_async_stats(self) -> None:
+        """
+        Tests that the async statistics views give the same responses as the views used under
+        WSGI.
+        """
+        now = datetime.now(timezone.utc)
+        start = (now - timedelta(days=7)).isoformat()
+        end = (now + timedelta(days=1)).isoformat()
+        midnight = datetime.combine(now.date(), time(), tzinfo=timezone.utc) - timedelta(days=2)
+        requests = [
+            (async_views.stats_per_medium, f"/api/stats/medium?start-time={start}&end-time={end}"),
+            (async_views.stats_per_category,
+             f"/api/stats/category?start-time={start}&end-time={end}"),
+            (async_views.stats_per_period,
+             f"/api/stats/periods?start-time={start}&delta=3600&intervals=200"),
+            (async_views.stats_per_period,
+             f"/api/stats/periods?start-time={midnight.isoformat()}&delta=86400&intervals=4"),
+            (async_views.stats_per_period,
+             "/api/stats/periods?start-time=incorrect&delta=1&intervals=1"),
+            (async_views.stats_per_medium, f"/api/stats/medium?start-time={start}"),
+        ]
+        factory = AsyncRequestFactory()
+        for view, url in requests:
+            url = url.replace("+", "%2B")
+            async_response = await view(factory.get(url))
+            await sync_to_async(cache.clear)()
+            sync_response = await sync_to_async(self.client.get)(url)
+            self.assertEqual(async_response.status_code, sync_response.status_code)
+            self.assertEqual(async_response.content, sync_response.content)
+
+        url = requests[0][1].replace("+", "%2B")
+        response = await async_views.stats_per_medium(factory.get(url))
+        self.assertEqual(json.loads(response.content), {"phone": 4, "email": 0})
@@ -0,0 +1,145 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+import json
+import logging
+import time
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpRequest, HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+from api import metrics
+
+logger = logging.getLogger("api.timing")
+
+
+class RequestTimings():
+    """
+    The time spent on a request: in total, in database queries, and in named phases such as
+    "query" and "serialize".
+    """
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.db_time = 0.0
+        self.queries = 0
+        self.phases: Dict[str, float] = {}
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def server_timing(self, total: float) -> str:
+        """
+        Returns the timings in milliseconds as the value of a Server-Timing header.
+        """
+        metrics = [f"total;dur={total * 1000:.2f}",
+                   f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries"']
+        metrics += [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.phases.items()]
+        return ", ".join(metrics)
+
+    def log_record(self, request: HttpRequest, response: HttpResponse,
+                   total: float) -> Dict[str, Any]:
+        """
+        Returns the timings in milliseconds together with what was requested, to be logged.
+        """
+        match = request.resolver_match
+        return {
+            "view": match.view_name if match is not None else None,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total * 1000, 2),
+            "db_ms": round(self.db_time * 1000, 2),
+            "queries": self.queries,
+            "phases_ms": {name: round(seconds * 1000, 2) for name, seconds in self.phases.items()},
+        }
+
+
+# The timings of the request being served. Context variables are copied to the threads that
+# sync_to_async() runs code in, so queries made there are counted for the request too.
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("current_timings",
+                                                                   default=None)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """
+    Adds the time spent in the with block to the phase with the given name of the current
+    request, if any.
+    """
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_phase(name, time.perf_counter() - start)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper that adds the time of every query to the current request, if any.
+    Installed on every connection, see api/signals.py.
+    """
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_time += time.perf_counter() - start
+        timings.queries += 1
+
+
+@sync_and_async_middleware
+def request_timing_middleware(get_response):
+    """
+    Measures the total time, database time, number of queries and phases of every request. They
+    are sent in a Server-Timing header and logged as JSON to the api.timing logger, unless
+    REQUEST_TIMING=False, and added to the metrics at /api/metrics, unless METRICS=False. Streamed
+    responses are measured until the view returns, before the body is read.
+    """
+    if not settings.REQUEST_TIMING and not settings.METRICS:
+        raise MiddlewareNotUsed()
+
+    if iscoroutinefunction(get_response):
+        async def async_middleware(request: HttpRequest) -> HttpResponse:
+            timings = RequestTimings()
+            token = current_timings.set(timings)
+            try:
+                response = await get_response(request)
+            finally:
+                current_timings.reset(token)
+            return finish(request, response, timings)
+        return async_middleware
+
+    def middleware(request: HttpRequest) -> HttpResponse:
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            response = get_response(request)
+        finally:
+            current_timings.reset(token)
+        return finish(request, response, timings)
+    return middleware
+
+
+def finish(request: HttpRequest, response: HttpResponse, timings: RequestTimings) -> HttpResponse:
+    """
+    Adds the Server-Timing header to the response, logs the timings of the request and adds them
+    to the metrics.
+    """
+    total = time.perf_counter() - timings.start
+    if settings.REQUEST_TIMING:
+        response["Server-Timing"] = timings.server_timing(total)
+        if logger.isEnabledFor(logging.INFO):
+            record = timings.log_record(request, response, total)
+            logger.info(json.dumps(record), extra={"timing": record})
+    metrics.record_request(request, response, total, timings.db_time, timings.queries)
+    return response
@@ -1,14 +1,23 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Under ASGI, cases and statistics can be read without holding a thread while waiting for the
+# database, see ASYNC_VIEWS in the settings
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     path('login', views.login),
     path('logout', views.logout),
     path('check', views.check),
-    path('case', views.case),
+    path('case', read_views.case),
     path('case/<int:id>', views.case_id),
+    path('case/bulk', views.case_bulk),
+    path('case/export', views.case_export),
     path('case/categories', views.case_categories),
-    path('stats/medium', views.stats_per_medium),
-    path('stats/category', views.stats_per_category),
-    path('stats/periods', views.stats_per_period)
+    path('stats/medium', read_views.stats_per_medium),
+    path('stats/category', read_views.stats_per_category),
+    path('stats/periods', read_views.stats_per_period),
+    path('status', views.status),
+    path('metrics', views.metrics),
 ]
@@ -1,40 +1,22 @@
-from django.http import HttpResponse, HttpRequest
-from django.views.decorators.http import require_http_methods
-from django.core.serializers.json import DjangoJSONEncoder
+from django.conf import settings
+from django.http import HttpResponse, HttpRequest, StreamingHttpResponse
+from django.views.decorators.http import etag, require_http_methods
 import json
 from json.decoder import JSONDecodeError
 from .decorators import authentication_required
+from .metrics import get_collector
+from .timing import phase
 from api.models import Case
-from .interfaces import cases, auth, stats
+from .interfaces import cases, auth, stats, cache
+from backend.db import pool
 from datetime import datetime, timedelta
-
-last_cleaned = datetime.today() - timedelta(days=1)
-
-
-def set_cleaned_for_testing() -> None:
-    """
-    Sets the last_cleaned variable to a date in the past,
-    makes clean_case_notes() run on the next API call for testing.
-    """
-    global last_cleaned
-    last_cleaned = datetime.today() - timedelta(days=2)
-
-
-def clean_case_notes() -> None:
-    """
-    Removes notes from cases older than 90 days.
-    """
-    global last_cleaned
-    if datetime.today() > last_cleaned:
-        cases.remove_old_notes()
-        last_cleaned = datetime.today()
+from typing import Dict, Tuple
 
 
 def login(request: HttpRequest) -> HttpResponse:
     """
     Attempts to log in the user with the given username and password.
     """
-    clean_case_notes()
     try:
         success = auth.login_user(request)
     except ValueError as error:
@@ -53,7 +35,6 @@ def logout(request: HttpRequest) -> HttpResponse:
     """
     Logs out the current user.
     """
-    clean_case_notes()
     if request.user.is_authenticated:
         auth.logout_user(request)
         return HttpResponse(status=204)
@@ -66,7 +47,6 @@ def check(request: HttpRequest) -> HttpResponse:
     """
     Checks if the user is logged in.
     """
-    clean_case_notes()
     if request.user.is_authenticated:
         return HttpResponse(status=204)
     else:
@@ -78,32 +58,113 @@ def check(request: HttpRequest) -> HttpResponse:
 @require_http_methods({"GET", "POST"})
 def case(request: HttpRequest) -> HttpResponse:
     """
-    GET: Returns all cases that match the query parameters.
+    GET: Returns all cases that match the query parameters. With stream=true the response is
+    streamed while the cases are read from the database.
     POST: Creates a new case based on data passed in the request body.
     """
-    clean_case_notes()
     if request.method == "GET":
+        params = request.GET.dict()
         try:
-            matching_cases = cases.get_cases(request.GET.dict())
+            if pop_stream(params):
+                cases_json_chunks = cases.stream_cases(params)
+                return StreamingHttpResponse(cases_json_chunks, content_type="application/json",
+                                             status=200)
+
+            cases_json = cases.get_cases_json(params)
         except ValueError as error:
             return HttpResponse(status=400, content=str(error))
 
-        cases_json = json.dumps(matching_cases, cls=DjangoJSONEncoder)
         return HttpResponse(cases_json, content_type="application/json", status=200)
 
     elif request.method == "POST":
-        try:
-            json_string = request.body.decode()
-            dictionary = json.loads(json_string)
+        return post_case(request)
 
-            new_case = cases.create_case(dictionary)
-            new_case.created_by = request.user
-            new_case.save()
 
-        except (JSONDecodeError, UnicodeDecodeError, ValueError, TypeError) as error:
-            return HttpResponse(status=400, content=str(error))
+def pop_stream(params: Dict[str, str]) -> bool:
+    """
+    Removes the stream parameter from the given query parameters of GET /api/case and returns
+    whether the response should be streamed. Raises ValueError if the value is invalid.
+    """
+    stream = params.pop("stream", "false")
+    if stream not in {"true", "false"}:
+        raise ValueError(f"Invalid value for stream: {stream}.")
+    return stream == "true"
+
+
+def post_case(request: HttpRequest) -> HttpResponse:
+    """
+    Creates a new case based on data passed in the request body.
+    """
+    try:
+        json_string = request.body.decode()
+        dictionary = json.loads(json_string)
+
+        cases.create_case(dictionary, request.user)
+
+    except (JSONDecodeError, UnicodeDecodeError, ValueError, TypeError) as error:
+        return HttpResponse(status=400, content=str(error))
+
+    return HttpResponse(status=201)
+
+
+@authentication_required
+@require_http_methods({"POST", "PATCH", "DELETE"})
+def case_bulk(request: HttpRequest) -> HttpResponse:
+    """
+    POST: Creates the cases in the JSON array passed in the request body, either all of them or
+    none of them. Returns the ids of the new cases, or the errors of the invalid cases.
+    PATCH: Updates the cases selected by ids or filter in the request body with the changes in
+    the request body. Returns the number of updated cases.
+    DELETE: Deletes the cases selected by ids or filter in the request body. Returns the number
+    of deleted cases.
+    """
+    try:
+        json_string = request.body.decode()
+        dictionary = json.loads(json_string)
+
+        if request.method == "POST":
+            new_cases = cases.create_cases(dictionary, request.user)
+            result = {"ids": [new_case.id for new_case in new_cases]}
+            status = 201
+        elif request.method == "PATCH":
+            result = {"updated": cases.update_cases(dictionary, request.user)}
+            status = 200
+        else:
+            result = {"deleted": cases.delete_cases(dictionary)}
+            status = 200
+
+    except cases.BulkCaseError as error:
+        errors = [{"index": index, "error": message} for index, message in error.errors.items()]
+        errors_json = json.dumps({"errors": errors})
+        return HttpResponse(errors_json, content_type="application/json", status=400)
+    except (JSONDecodeError, UnicodeDecodeError, ValueError, TypeError) as error:
+        return HttpResponse(status=400, content=str(error))
+
+    return HttpResponse(json.dumps(result), content_type="application/json", status=status)
+
+
+@authentication_required
+@require_http_methods({"GET"})
+def case_export(request: HttpRequest) -> HttpResponse:
+    """
+    Streams all cases that match the query parameters as NDJSON or CSV.
+    """
+    params = request.GET.dict()
+    try:
+        lines = cases.export_cases(params)
+    except ValueError as error:
+        return HttpResponse(status=400, content=str(error))
 
-        return HttpResponse(status=201)
+    if params.get("format") == "csv":
+        content_type = "text/csv"
+        filename = "cases.csv"
+    else:
+        content_type = "application/x-ndjson"
+        filename = "cases.ndjson"
+
+    response = StreamingHttpResponse(lines, content_type=content_type, status=200)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
 
 
 @authentication_required
@@ -113,15 +174,12 @@ def case_id(request: HttpRequest, id: int) -> HttpResponse:
     PATCH: Updates the case with the given ID based on data passed in the request body.
     DELETE: Deletes the case with the given ID.
     """
-    clean_case_notes()
     if request.method == "PATCH":
         try:
             json_string = request.body.decode()
             dictionary = json.loads(json_string)
 
-            updated_case = cases.update_case(id, dictionary)
-            updated_case.edited_by.add(request.user)
-            updated_case.save()
+            cases.update_case(id, dictionary, request.user)
 
         except (JSONDecodeError, UnicodeDecodeError, ValueError, TypeError) as error:
             return HttpResponse(status=400, content=str(error))
@@ -141,11 +199,12 @@ def case_id(request: HttpRequest, id: int) -> HttpResponse:
 
 
 @require_http_methods({"GET"})
+@etag(lambda request: cases.get_categories_etag())
 def case_categories(request: HttpRequest) -> HttpResponse:
     """
-    Returns all case categories as a JSON array.
+    Returns all case categories as a JSON array. Responds with 304 if the categories have not
+    changed since the ETag given in If-None-Match.
     """
-    clean_case_notes()
     categories_json = json.dumps(cases.get_case_categories())
     return HttpResponse(categories_json, content_type="application/json", status=200)
 
@@ -155,13 +214,9 @@ def stats_per_medium(request: HttpRequest) -> HttpResponse:
     """
     Returns the number of cases per medium for a given time range as a JSON array.
     """
-    clean_case_notes()
     params = request.GET.dict()
     try:
-        start_time_iso = params["start-time"]
-        end_time_iso = params["end-time"]
-        start_time = datetime.fromisoformat(start_time_iso)
-        end_time = datetime.fromisoformat(end_time_iso)
+        start_time, end_time = time_range(params)
 
     except KeyError as error:
         return HttpResponse(status=400, content="Key does not exist: " + str(error))
@@ -169,7 +224,12 @@ def stats_per_medium(request: HttpRequest) -> HttpResponse:
     except ValueError as error:
         return HttpResponse(status=400, content=str(error))
 
-    medium_stats = json.dumps(stats.get_medium_count(start_time, end_time))
+    parameters = {"start_time": start_time, "end_time": end_time}
+    with phase("query"):
+        medium_count = cache.cached_stats("medium", parameters,
+                                          lambda: stats.get_medium_count(start_time, end_time))
+    with phase("serialize"):
+        medium_stats = json.dumps(medium_count)
     return HttpResponse(medium_stats, content_type="application/json", status=200)
 
 
@@ -179,13 +239,9 @@ def stats_per_category(request: HttpRequest) -> HttpResponse:
     Returns the statistics for cases per category and subcategory for a given time range a JSON
     array.
     """
-    clean_case_notes()
     params = request.GET.dict()
     try:
-        start_time_iso = params["start-time"]
-        end_time_iso = params["end-time"]
-        start_time = datetime.fromisoformat(start_time_iso)
-        end_time = datetime.fromisoformat(end_time_iso)
+        start_time, end_time = time_range(params)
 
     except KeyError as error:
         return HttpResponse(status=400, content="Key does not exist: " + str(error))
@@ -193,7 +249,12 @@ def stats_per_category(request: HttpRequest) -> HttpResponse:
     except ValueError as error:
         return HttpResponse(status=400, content=str(error))
 
-    stats_per_category = json.dumps(stats.get_stats_per_category(start_time, end_time))
+    parameters = {"start_time": start_time, "end_time": end_time}
+    with phase("query"):
+        category_stats = cache.cached_stats(
+            "category", parameters, lambda: stats.get_stats_per_category(start_time, end_time))
+    with phase("serialize"):
+        stats_per_category = json.dumps(category_stats)
     return HttpResponse(stats_per_category, content_type="application/json", status=200)
 
 
@@ -202,13 +263,14 @@ def stats_per_period(request: HttpRequest) -> HttpResponse:
     """
     Returns the number of cases per time period for a given interval as a JSON array.
     """
-    clean_case_notes()
     params = request.GET.dict()
     try:
-        start_time_iso = params["start-time"]
-        start_time = datetime.fromisoformat(start_time_iso)
-        delta = timedelta(seconds=int(params["delta"]))
-        time_periods = int(params["intervals"])
+        start_time, delta, time_periods = period_parameters(params)
+        parameters = {"start_time": start_time, "delta": delta, "time_periods": time_periods}
+        with phase("query"):
+            periods = cache.cached_stats(
+                "periods", parameters,
+                lambda: stats.get_stats_per_period(start_time, delta, time_periods))
 
     except KeyError as error:
         return HttpResponse(status=400, content="Key does not exist: " + str(error))
@@ -216,5 +278,53 @@ def stats_per_period(request: HttpRequest) -> HttpResponse:
     except ValueError as error:
         return HttpResponse(status=400, content=str(error))
 
-    stats_per_day = json.dumps(stats.get_stats_per_period(start_time, delta, time_periods))
+    with phase("serialize"):
+        stats_per_day = json.dumps(periods)
     return HttpResponse(stats_per_day, content_type="application/json", status=200)
+
+
+def time_range(params: Dict[str, str]) -> Tuple[datetime, datetime]:
+    """
+    Returns the start and end time in the given query parameters of a statistics request. Raises
+    KeyError if either is missing and ValueError if either is invalid.
+    """
+    start_time_iso = params["start-time"]
+    end_time_iso = params["end-time"]
+    return datetime.fromisoformat(start_time_iso), datetime.fromisoformat(end_time_iso)
+
+
+def period_parameters(params: Dict[str, str]) -> Tuple[datetime, timedelta, int]:
+    """
+    Returns the start time, length and number of time periods in the given query parameters of
+    /api/stats/periods. Raises KeyError if any is missing and ValueError if any is invalid.
+    """
+    start_time_iso = params["start-time"]
+    start_time = datetime.fromisoformat(start_time_iso)
+    delta = timedelta(seconds=int(params["delta"]))
+    time_periods = int(params["intervals"])
+    return start_time, delta, time_periods
+
+
+@require_http_methods({"GET"})
+def status(request: HttpRequest) -> HttpResponse:
+    """
+    Returns counters that show how well the server is doing, such as statistics cache hits and the
+    usage of the database connection pool.
+    """
+    status_json = json.dumps({
+        "stats_cache": cache.get_cache_status(),
+        "database_pools": pool.get_pool_stats(),
+    })
+    return HttpResponse(status_json, content_type="application/json", status=200)
+
+
+@require_http_methods({"GET"})
+def metrics(request: HttpRequest) -> HttpResponse:
+    """
+    Returns the request, cache and database pool metrics of all processes of the server in the
+    Prometheus text format.
+    """
+    if not settings.METRICS:
+        return HttpResponse(status=404, content="Metrics are disabled")
+    return HttpResponse(get_collector().render(), content_type="text/plain; version=0.0.4",
+                        status=200)
@@ -0,0 +1,176 @@
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+import threading
+import time
+
+# Pools by database alias, so their usage can be reported
+pools: Dict[str, "ConnectionPool"] = {}
+pools_lock = threading.Lock()
+
+
+class PoolTimeoutError(Exception):
+    """
+    Raised when no connection in a pool became free within its timeout.
+    """
+    pass
+
+
+class ConnectionPool():
+    """
+    A pool of at most max_size open database connections that are shared by the threads of a
+    process. A thread takes a connection with acquire(), which opens one with the given function if
+    none is idle, and gives it back with release(), which keeps it open for the next thread.
+    Connections that have been idle for check_interval seconds are checked with check() before
+    they are handed out again, and are replaced if that fails.
+    """
+
+    def __init__(self, max_size: int, timeout: float, check: Callable[[Any], bool],
+                 check_interval: float = 0) -> None:
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check = check
+        self.check_interval = check_interval
+        # The connection parameters the pool was created for, see get_pool()
+        self.key: Any = None
+
+        # Idle connections with the time they were released, most recently released last
+        self.idle: Deque[Tuple[Any, float]] = deque()
+        self.size = 0
+        self.condition = threading.Condition()
+
+        self.acquired = 0
+        self.waited = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.timeouts = 0
+        self.failed_checks = 0
+
+    def acquire(self, connect: Callable[[], Any]) -> Any:
+        """
+        Returns an idle connection or one opened with connect(), waiting for one to be released
+        if max_size connections are open. Raises PoolTimeoutError if none was released within the
+        timeout.
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self.condition:
+            while not self.idle and self.size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.condition.wait(remaining):
+                    if not self.idle and self.size >= self.max_size:
+                        self.timeouts += 1
+                        raise PoolTimeoutError(
+                            f"No database connection became free within {self.timeout} seconds "
+                            f"({self.max_size} in use).")
+
+            waited = time.monotonic() - start
+            self.acquired += 1
+            if waited > 0.001:
+                self.waited += 1
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+
+            connection = None
+            if self.idle:
+                connection, released_at = self.idle.pop()
+            else:
+                # Counted as open while it is being opened, so the limit holds
+                self.size += 1
+
+        if connection is not None:
+            if time.monotonic() - released_at < self.check_interval or self.check(connection):
+                return connection
+            # Its place in the pool is taken by the new connection
+            with self.condition:
+                self.failed_checks += 1
+            close_quietly(connection)
+
+        try:
+            return connect()
+        except BaseException:
+            self.discard(None)
+            raise
+
+    def release(self, connection: Any) -> None:
+        """
+        Gives back a connection taken with acquire(), to be handed out again.
+        """
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    def discard(self, connection: Optional[Any]) -> None:
+        """
+        Closes a connection taken with acquire() that can not be used again, which makes room for
+        a new one.
+        """
+        if connection is not None:
+            close_quietly(connection)
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def close(self) -> None:
+        """
+        Closes the idle connections. Connections that are in use are closed when they are
+        discarded.
+        """
+        with self.condition:
+            idle, self.idle = self.idle, deque()
+            self.size -= len(idle)
+            self.condition.notify_all()
+        for connection, _ in idle:
+            close_quietly(connection)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Returns the number of connections that are open, in use and idle, and how often and for
+        how long threads waited for a connection.
+        """
+        with self.condition:
+            return {
+                "max_size": self.max_size,
+                "size": self.size,
+                "in_use": self.size - len(self.idle),
+                "idle": len(self.idle),
+                "acquired": self.acquired,
+                "waited": self.waited,
+                "wait_time_ms": round(self.wait_time * 1000, 3),
+                "max_wait_time_ms": round(self.max_wait_time * 1000, 3),
+                "timeouts": self.timeouts,
+                "failed_checks": self.failed_checks,
+            }
+
+
+def get_pool(alias: str, key: Any, create: Callable[[], ConnectionPool]) -> ConnectionPool:
+    """
+    Returns the pool of the database with the given alias, created with create() the first time.
+    key identifies the connection parameters; if they have changed (such as when the test
+    database is set up), the old pool is closed and a new one is created.
+    """
+    with pools_lock:
+        pool = pools.get(alias)
+        if pool is not None and pool.key == key:
+            return pool
+        if pool is not None:
+            pool.close()
+        pool = create()
+        pool.key = key
+        pools[alias] = pool
+        return pool
+
+
+def get_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Returns the usage of the connection pool of every database that has one, by alias.
+    """
+    with pools_lock:
+        return {alias: pool.get_stats() for alias, pool in pools.items()}
+
+
+def close_quietly(connection: Any) -> None:
+    try:
+        connection.close()
+    except Exception:
+        # The connection is being thrown away, most likely because it is already broken
+        pass
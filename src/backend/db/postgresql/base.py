@@ -0,0 +1,82 @@
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+from backend.db.pool import ConnectionPool, PoolTimeoutError, get_pool
+
+# The transaction status of a connection that is not in a transaction, the same in psycopg2 and
+# psycopg 3
+TRANSACTION_STATUS_IDLE = 0
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The PostgreSQL backend, but with the connections kept open in a pool shared by the threads of
+    the process (see backend.db.pool). Closing a connection, which Django does at the end of every
+    request with CONN_MAX_AGE=0, gives it back to the pool instead.
+
+    Configured with the POOL entry of the database settings:
+    - MAX_SIZE: the number of connections the process may have open
+    - TIMEOUT: the number of seconds to wait for a free connection before giving up
+    - CHECK_INTERVAL: connections that have been idle for this many seconds are checked with
+      SELECT 1 before they are used again
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The pool the current connection was taken from
+        self.pool = None
+
+    def get_new_connection(self, conn_params):
+        if self.alias == NO_DB_ALIAS:
+            # Only used to create and drop databases
+            return super().get_new_connection(conn_params)
+
+        options = self.settings_dict["POOL"]
+        pool = get_pool(self.alias, sorted(conn_params.items()), lambda: ConnectionPool(
+            max_size=options["MAX_SIZE"],
+            timeout=options["TIMEOUT"],
+            check=self.is_usable_connection,
+            check_interval=options["CHECK_INTERVAL"],
+        ))
+        try:
+            connection = pool.acquire(lambda: super(DatabaseWrapper, self).get_new_connection(
+                conn_params))
+        except PoolTimeoutError as error:
+            raise self.Database.OperationalError(str(error)) from error
+        self.pool = pool
+        return connection
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+
+        connection, pool, self.pool = self.connection, self.pool, None
+        # Django keeps using a connection that is closed inside a transaction until the
+        # transaction is rolled back, so it can not be given to another thread
+        if self.in_atomic_block or connection.closed or not self.reset_connection(connection):
+            pool.discard(connection)
+        else:
+            pool.release(connection)
+
+    def is_usable_connection(self, connection) -> bool:
+        """
+        Returns whether the given connection from the pool still works.
+        """
+        # Called with connections opened by other threads, so self.connection can not be used
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        except self.Database.Error:
+            return False
+        return True
+
+    def reset_connection(self, connection) -> bool:
+        """
+        Rolls back the transaction left open on the given connection, if any, so the next thread
+        gets it in the same state as a new connection. Returns whether that succeeded.
+        """
+        try:
+            if connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except self.Database.Error:
+            return False
+        return True
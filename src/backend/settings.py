@@ -11,8 +11,10 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv, dotenv_values
 import os
+import sys
 
 # Load .env file and save variables to dictionary "env_var".
 load_dotenv(".env")
@@ -21,6 +23,38 @@ env_var = dotenv_values(".env")
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Whether the tests are being run with manage.py test
+TESTING = sys.argv[1:2] == ['test']
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    """
+    Returns the value of a True/False variable in .env, or default if it is not set.
+    """
+    value = env_var.get(name)
+    if value is None or value.strip() == "":
+        return default
+    if value.strip().lower() in ("true", "1", "yes"):
+        return True
+    if value.strip().lower() in ("false", "0", "no"):
+        return False
+    raise ImproperlyConfigured(f"{name} in .env must be True or False, not {value!r}.")
+
+
+def env_path(name: str, default: Path) -> Path:
+    """
+    Returns the path in a variable in .env, or default if it is not set. A relative path is
+    relative to the working directory, unless it has the form BASE_DIR / 'db.sqlite3' used in
+    earlier .env files, which is relative to BASE_DIR.
+    """
+    value = env_var.get(name)
+    if value is None or value.strip() == "":
+        return default
+    value = value.strip()
+    if value.startswith("BASE_DIR"):
+        return BASE_DIR / value[len("BASE_DIR"):].strip().lstrip("/").strip().strip("'\"")
+    return Path(value)
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.1/howto/deployment/checklist/
@@ -48,6 +82,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so it measures the whole request
+    'api.timing.request_timing_middleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -97,10 +133,10 @@ if (env_var):
 
     test_env = {
         'ENGINE': env_var["DB_TEST_ENGINE"],
-        'NAME': env_var["DB_TEST_NAME"]
+        'NAME': env_path("DB_TEST_NAME", BASE_DIR / 'db.sqlite3')
     }
 
-    if eval(env_var["PRODUCTION_ENV"]):
+    if env_bool("PRODUCTION_ENV"):
         db_env = production_env
     else:
         db_env = test_env
@@ -110,11 +146,108 @@ else:
         'NAME': BASE_DIR / 'db.sqlite3'
     }
 
+# Number of seconds each thread keeps its connection to the database open after a request, so the
+# following requests do not have to connect again. 0 by default, which closes it after every
+# request: every thread that runs queries keeps a connection of its own, which with ASGI or
+# ASYNC_VIEWS is every thread of sync_to_async(), so many processes could use up the connections
+# PostgreSQL allows. With CONN_HEALTH_CHECKS a connection that is kept open is checked before it
+# is used for a request.
+db_env['CONN_MAX_AGE'] = int(env_var.get("DB_CONN_MAX_AGE", 0))
+db_env['CONN_HEALTH_CHECKS'] = env_bool("DB_CONN_HEALTH_CHECKS", True)
+
+# With DB_POOL_SIZE the connections to PostgreSQL are instead kept in a pool shared by the threads
+# of each process, which holds at most that many connections, see backend/db/postgresql/base.py.
+# Connections are then given back to the pool after every request.
+DB_POOL_SIZE = int(env_var.get("DB_POOL_SIZE", 0))
+if DB_POOL_SIZE > 0:
+    if db_env['ENGINE'] != 'django.db.backends.postgresql':
+        raise ImproperlyConfigured("DB_POOL_SIZE in .env is only supported with PostgreSQL.")
+    db_env['ENGINE'] = 'backend.db.postgresql'
+    db_env['CONN_MAX_AGE'] = 0
+    db_env['POOL'] = {
+        'MAX_SIZE': DB_POOL_SIZE,
+        # Number of seconds a request waits for a free connection before it fails
+        'TIMEOUT': float(env_var.get("DB_POOL_TIMEOUT", 10)),
+        # Connections that have been idle for this many seconds are checked before they are used
+        'CHECK_INTERVAL': float(env_var.get("DB_POOL_CHECK_INTERVAL", 30)),
+    }
+
 DATABASES = {
     'default': db_env
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+# Local memory is used by default, which needs no outside services but is not shared between
+# processes. Set CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache and
+# CACHE_LOCATION=<directory> in .env to share the cache between processes.
+CACHE_BACKEND = env_var.get("CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': env_var.get("CACHE_LOCATION", ''),
+    }
+}
+
+# Number of seconds that statistics are cached for (0 to not cache them). Cached statistics are
+# also discarded as soon as cases change, but only in the processes that share the cache with the
+# one that changed them. They are therefore only cached by default if CACHE_BACKEND is set to a
+# backend other than local memory, which each process has its own of.
+STATS_CACHE_TIMEOUT = int(env_var.get(
+    "STATS_CACHE_TIMEOUT",
+    0 if CACHE_BACKEND == 'django.core.cache.backends.locmem.LocMemCache' else 300))
+
+# Number of seconds that each process keeps the categories for. Changes made in another process
+# are seen after at most this long, or right away if the cache backend is shared.
+CATEGORY_CACHE_TIMEOUT = int(env_var.get("CATEGORY_CACHE_TIMEOUT", 60))
+
+# Serve cases and statistics with async views, which is faster when the server is run with ASGI
+# (backend.asgi) but slower with WSGI (backend.wsgi, also used by runserver).
+ASYNC_VIEWS = env_bool("ASYNC_VIEWS")
+
+# Send the time spent on each request, in database queries and in phases such as serializing in
+# a Server-Timing header, and log it as JSON to the api.timing logger.
+REQUEST_TIMING = env_bool("REQUEST_TIMING", True)
+
+# Serve request, cache and database pool metrics at /api/metrics in the Prometheus text format.
+# Each process adds its metrics to the SQLite database METRICS_DATABASE every
+# METRICS_FLUSH_INTERVAL seconds from a thread, so all processes of the server must be able to
+# write to it. Off unless METRICS=True is set in .env, so that test runs and management commands
+# do not create it.
+METRICS = env_bool("METRICS")
+METRICS_DATABASE = env_path("METRICS_DATABASE", BASE_DIR / 'metrics.sqlite3')
+METRICS_FLUSH_INTERVAL = float(env_var.get("METRICS_FLUSH_INTERVAL", 5))
+
+# Old notes are removed from at most this many cases per UPDATE, with a pause of this many seconds
+# between the UPDATEs, so other writes to the cases are not blocked for long.
+NOTES_PURGE_BATCH_SIZE = int(env_var.get("NOTES_PURGE_BATCH_SIZE", 1000))
+NOTES_PURGE_PAUSE = float(env_var.get("NOTES_PURGE_PAUSE", 0.1))
+
+
+# Logging
+# https://docs.djangoproject.com/en/4.1/topics/logging/
+
+# Request timings are logged to the console, with one line per request, except by the tests
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.timing': {
+            'handlers': ['console'],
+            'level': 'WARNING' if TESTING else env_var.get("REQUEST_TIMING_LOG_LEVEL", 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -153,6 +286,22 @@ USE_TZ = True
 STATIC_URL = '/django-static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
+# The built frontend, served by backend.views.static_files. Run the compress_static command after
+# deploying it, so compressed versions of the files are served.
+FRONTEND_DIR = BASE_DIR / 'static'
+
+# Let the web server in front of Django send the frontend files, so that no worker is tied up while
+# they are sent and the web server answers Range requests itself. Django then only resolves the
+# path and checks If-None-Match. "x-sendfile" (Apache with mod_xsendfile, lighttpd) sends the path
+# of the file in an X-Sendfile header. "x-accel-redirect" (nginx) sends its URI under
+# STATIC_SENDFILE_PREFIX in an X-Accel-Redirect header, which must be an internal location that
+# is an alias of FRONTEND_DIR. Not set, Django sends the files.
+STATIC_SENDFILE = env_var.get("STATIC_SENDFILE", "").strip().lower()
+if STATIC_SENDFILE not in ("", "x-sendfile", "x-accel-redirect"):
+    raise ImproperlyConfigured("STATIC_SENDFILE in .env must be x-sendfile or x-accel-redirect, "
+                               f"not {STATIC_SENDFILE!r}.")
+STATIC_SENDFILE_PREFIX = env_var.get("STATIC_SENDFILE_PREFIX", "/frontend-files/")
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -0,0 +1,201 @@
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+from django.conf import settings
+from django.utils.http import http_date
+
+# Files up to this size are kept in memory, larger files are read from disk for every request
+MAX_CACHED_FILE_SIZE = 1024 * 1024
+
+# Precompressed versions of a file, by content coding in order of preference, which are served
+# instead of the file to clients that accept them. See the compress_static command.
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+# The frontend is built with Create React App, which puts its assets in static/js, static/css and
+# static/media with a hex hash of their content in their name, such as static/js/main.3f2a1b9c.js,
+# static/js/787.1a2b3c4d.chunk.js or static/media/logo.6ce24c58023cc2f8fd88.svg. They never change
+# and can be cached for good. Files copied from public/, such as logo-v12345678.png, are left out
+# even if their name looks hashed.
+HASHED_NAME = re.compile(
+    r"static/(?:js|css|media)/[^/]+\.[0-9a-f]{8,32}(?:\.chunk)?\.[0-9a-z]+(?:\.map)?")
+HASHED_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Other files, such as index.html, are checked with the ETag every time they are used
+CACHE_CONTROL = "no-cache"
+
+# A single range of bytes in a Range header: bytes=<first>-<last>, bytes=<first>- or
+# bytes=-<suffix length>. Headers with several ranges are ignored and the whole file is sent.
+BYTE_RANGE = re.compile(r"bytes=([0-9]*)-([0-9]*)")
+# Parts of large files are read from disk in chunks of this size
+CHUNK_SIZE = 64 * 1024
+
+
+class StaticFile():
+    """
+    A file of the frontend as it was when it was last read: its path, modification time and size,
+    a strong ETag computed from its content, and the content itself if it is small enough.
+    """
+
+    def __init__(self, path: Path, file_stat: os.stat_result, etag: str,
+                 content: Optional[bytes]) -> None:
+        self.path = path
+        self.mtime_ns = file_stat.st_mtime_ns
+        self.size = file_stat.st_size
+        self.etag = etag
+        self.content = content
+
+    @property
+    def last_modified(self) -> int:
+        return self.mtime_ns // 1_000_000_000
+
+    def is_current(self, file_stat: os.stat_result) -> bool:
+        return self.mtime_ns == file_stat.st_mtime_ns and self.size == file_stat.st_size
+
+
+# The files read so far by path. Entries are only ever replaced as a whole, so threads can read
+# and update the dictionary without a lock.
+files: Dict[Path, StaticFile] = {}
+
+
+def resolve(relative_path: str) -> Optional[Path]:
+    """
+    Returns the path of the given file in the frontend directory, or None if it is outside it.
+    """
+    root = Path(settings.FRONTEND_DIR).resolve()
+    path = (root / relative_path).resolve()
+    if path != root and root not in path.parents:
+        return None
+    return path
+
+
+def get_file(path: Path) -> Optional[StaticFile]:
+    """
+    Returns the file at the given path, read again only if it has changed since it was last read,
+    or None if there is no such file.
+    """
+    try:
+        file_stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if not stat.S_ISREG(file_stat.st_mode):
+        return None
+
+    cached = files.get(path)
+    if cached is not None and cached.is_current(file_stat):
+        return cached
+
+    digest = hashlib.sha256()
+    content = None
+    with open(path, "rb") as file:
+        if file_stat.st_size <= MAX_CACHED_FILE_SIZE:
+            content = file.read()
+            digest.update(content)
+        else:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(chunk)
+    static_file = StaticFile(path, file_stat, f'"{digest.hexdigest()[:32]}"', content)
+    files[path] = static_file
+    return static_file
+
+
+def get_variants(static_file: StaticFile) -> List[Tuple[str, StaticFile]]:
+    """
+    Returns the precompressed versions of the given file by content coding, in order of
+    preference. Versions older than the file are left out, since they are of an earlier version.
+    """
+    variants = []
+    for encoding, suffix in ENCODINGS:
+        variant = get_file(static_file.path.with_name(static_file.path.name + suffix))
+        if variant is not None and variant.mtime_ns >= static_file.mtime_ns:
+            variants.append((encoding, variant))
+    return variants
+
+
+def accepted_encodings(accept_encoding: str) -> List[str]:
+    """
+    Returns the content codings accepted in the given Accept-Encoding header, leaving out those
+    with q=0.
+    """
+    accepted = []
+    for item in accept_encoding.split(","):
+        coding, *parameters = [part.strip() for part in item.split(";")]
+        if any(parameter.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+               for parameter in parameters):
+            continue
+        accepted.append(coding.lower())
+    return accepted
+
+
+def content_type(path: Path) -> str:
+    return mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+
+def cache_control(path: Path) -> str:
+    relative_path = path.relative_to(Path(settings.FRONTEND_DIR).resolve()).as_posix()
+    return HASHED_CACHE_CONTROL if HASHED_NAME.fullmatch(relative_path) else CACHE_CONTROL
+
+
+def byte_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Returns the first and last byte of the range in the given Range header, limited to a file of
+    the given size, or None if the header should be ignored and the whole file sent: when it is
+    malformed or has several ranges. Raises ValueError if the range is outside the file.
+    """
+    match = BYTE_RANGE.fullmatch(range_header.strip())
+    if match is None or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+
+    if first == "":
+        suffix_length = int(last)
+        if suffix_length == 0 or size == 0:
+            raise ValueError("The range is outside the file.")
+        return max(size - suffix_length, 0), size - 1
+
+    start = int(first)
+    if last != "" and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("The range is outside the file.")
+    end = size - 1 if last == "" else min(int(last), size - 1)
+    return start, end
+
+
+def if_range_matches(if_range: Optional[str], etag: str, last_modified: int) -> bool:
+    """
+    Returns whether a range may be sent given the If-Range header of the request: if there is no
+    such header, or if it has the current ETag or modification date of the file. Otherwise the
+    client has part of an earlier version and needs the whole file.
+    """
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    return if_range == etag or if_range == http_date(last_modified)
+
+
+def read_range(path: Path, start: int, end: int) -> Iterator[bytes]:
+    """
+    Yields the bytes from start to end, inclusive, of the given file in chunks of CHUNK_SIZE.
+    """
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def accel_redirect_uri(path: Path) -> str:
+    """
+    Returns the URI of the given file under STATIC_SENDFILE_PREFIX, for the X-Accel-Redirect
+    header.
+    """
+    relative_path = path.relative_to(Path(settings.FRONTEND_DIR).resolve())
+    return settings.STATIC_SENDFILE_PREFIX.rstrip("/") + "/" + quote(relative_path.as_posix())
@@ -1,6 +1,24 @@
+import gzip
+import io
 import os
 import shutil
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import skipIf
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from backend import static
+from backend.db.pool import ConnectionPool, PoolTimeoutError, pools
+
+try:
+    from backend.db.postgresql.base import DatabaseWrapper as PooledDatabaseWrapper
+except ImproperlyConfigured:
+    # psycopg is only installed where PostgreSQL is used
+    PooledDatabaseWrapper = None
 
 
 class EnvironmentManager():
@@ -119,3 +137,323 @@ class APITests(TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.getvalue().decode(), APITests.TEST_FILES[2])
+
+    def test_conditional_requests(self) -> None:
+        """
+        Tests that files are sent with an ETag and Last-Modified, that the response is 304 if the
+        client already has the file, and that a changed file is read again.
+        """
+        envManager.add_static_file("index.html")
+        self.addCleanup(os.remove, envManager.STATIC_PATH + "/index.html")
+        response = self.client.get("/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/html")
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        self.assertIn("Last-Modified", response)
+        etag = response["ETag"]
+
+        response = self.client.get("/some/route", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+        path = envManager.STATIC_PATH + "/index.html"
+        with open(path, "w") as file:
+            file.write("changed")
+        os.utime(path, ns=(time.time_ns() + 10 ** 9, time.time_ns() + 10 ** 9))
+        response = self.client.get("/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"changed")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_hashed_file_names(self) -> None:
+        """
+        Tests that the assets of the frontend build, with a hash in their name, are cached for
+        good, and that other files are not, even if their name has digits in it.
+        """
+        hashed = ["static/js/main.3f2a1b9c.js", "static/js/787.1a2b3c4d.chunk.js",
+                  "static/css/main.0e5f4a3b.css.map", "static/media/logo.6ce24c58023cc2f8fd88.svg"]
+        not_hashed = ["asset-manifest.json", "logo-v12345678.png", "data.20241231.json",
+                      "static/media/font-2024edition.woff", "static/js/main-3f2a1b9c.js"]
+        for path in hashed + not_hashed:
+            envManager.add_static_file(path)
+        self.addCleanup(shutil.rmtree, envManager.STATIC_PATH + "/static")
+        for path in not_hashed[:3]:
+            self.addCleanup(os.remove, envManager.STATIC_PATH + "/" + path)
+
+        for path in hashed:
+            self.assertEqual(self.client.get("/" + path)["Cache-Control"],
+                             "public, max-age=31536000, immutable", path)
+        for path in not_hashed:
+            self.assertEqual(self.client.get("/" + path)["Cache-Control"], "no-cache", path)
+
+    def test_precompressed_files(self) -> None:
+        """
+        Tests that compress_static writes compressed versions of text files, which are sent to
+        clients that accept them.
+        """
+        content = "const value = 1;\n" * 100
+        with open(envManager.STATIC_PATH + "/bundle.js", "w") as file:
+            file.write(content)
+        for name in ["bundle.js", "bundle.js.gz", "bundle.js.br"]:
+            self.addCleanup(lambda path: os.path.exists(path) and os.remove(path),
+                            envManager.STATIC_PATH + "/" + name)
+        call_command("compress_static", stdout=io.StringIO())
+        self.assertTrue(os.path.isfile(envManager.STATIC_PATH + "/bundle.js.gz"))
+        # Too small to be worth compressing
+        self.assertFalse(os.path.isfile(envManager.STATIC_PATH + "/test_file_1.txt.gz"))
+
+        response = self.client.get("/bundle.js", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(gzip.decompress(response.getvalue()).decode(), content)
+
+        for accept_encoding in ["", "gzip;q=0, deflate"]:
+            response = self.client.get("/bundle.js", HTTP_ACCEPT_ENCODING=accept_encoding)
+            self.assertNotIn("Content-Encoding", response)
+            self.assertIn("Accept-Encoding", response["Vary"])
+            self.assertEqual(response.getvalue().decode(), content)
+
+    def test_range_requests(self) -> None:
+        """
+        Tests that a single range of a file is sent if asked for, that a range outside the file
+        gives 416, and that the whole file is sent if the client has an earlier version.
+        """
+        content = "".join(str(number % 10) for number in range(100))
+        with open(envManager.STATIC_PATH + "/range.txt", "w") as file:
+            file.write(content)
+        self.addCleanup(os.remove, envManager.STATIC_PATH + "/range.txt")
+
+        response = self.client.get("/range.txt")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        etag = response["ETag"]
+
+        ranges = {"bytes=10-19": (10, 19), "bytes=-5": (95, 99), "bytes=95-": (95, 99),
+                  "bytes=90-1000": (90, 99), "bytes=0-0": (0, 0)}
+        for range_header, (start, end) in ranges.items():
+            response = self.client.get("/range.txt", HTTP_RANGE=range_header)
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response["Content-Range"], f"bytes {start}-{end}/100")
+            self.assertEqual(response.getvalue().decode(), content[start:end + 1])
+
+        for range_header in ["bytes=100-", "bytes=-0"]:
+            response = self.client.get("/range.txt", HTTP_RANGE=range_header)
+            self.assertEqual(response.status_code, 416)
+            self.assertEqual(response["Content-Range"], "bytes */100")
+
+        for range_header in ["bytes=0-1, 5-6", "bytes=5-1", "lines=1-2", "bytes=-"]:
+            response = self.client.get("/range.txt", HTTP_RANGE=range_header)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.getvalue().decode(), content)
+
+        response = self.client.get("/range.txt", HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self.client.get("/range.txt", HTTP_RANGE="bytes=10-19",
+                                   HTTP_IF_RANGE='"earlier"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.getvalue().decode(), content)
+
+    def test_range_requests_large_file(self) -> None:
+        """
+        Tests that ranges of files too large to be kept in memory are read from disk.
+        """
+        content = bytes(number % 251 for number in range(static.MAX_CACHED_FILE_SIZE + 100))
+        with open(envManager.STATIC_PATH + "/large.bin", "wb") as file:
+            file.write(content)
+        self.addCleanup(os.remove, envManager.STATIC_PATH + "/large.bin")
+
+        response = self.client.get("/large.bin", HTTP_RANGE="bytes=1000-1048600")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Length"], str(1048600 - 1000 + 1))
+        self.assertEqual(b"".join(response.streaming_content), content[1000:1048601])
+
+    def test_sendfile(self) -> None:
+        """
+        Tests that the web server is told to send the file with STATIC_SENDFILE, after the
+        conditional headers are checked.
+        """
+        path = "test_sub_dir/test_file_2.txt"
+        with self.settings(STATIC_SENDFILE="x-sendfile"):
+            response = self.client.get("/" + path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, b"")
+            self.assertEqual(response["X-Sendfile"],
+                             str((Path(envManager.STATIC_PATH) / path).resolve()))
+            self.assertEqual(self.client.get("/" + path, HTTP_IF_NONE_MATCH=response["ETag"])
+                             .status_code, 304)
+
+        with self.settings(STATIC_SENDFILE="x-accel-redirect",
+                           STATIC_SENDFILE_PREFIX="/internal/"):
+            response = self.client.get("/" + path, HTTP_RANGE="bytes=0-1")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["X-Accel-Redirect"], "/internal/" + path)
+            self.assertNotIn("X-Sendfile", response)
+
+    def test_outside_static_directory(self) -> None:
+        """
+        Tests that files outside the static directory can not be retrieved.
+        """
+        response = self.client.get("/%2E%2E/backend/settings.py")
+        self.assertEqual(response.status_code, 404)
+
+
+class FakeConnection():
+    def __init__(self, **params) -> None:
+        self.usable = True
+        self.closed = False
+        # What psycopg reports of the transaction, 0 when there is none
+        self.info = SimpleNamespace(transaction_status=0)
+
+    def close(self) -> None:
+        self.closed = True
+
+    def rollback(self) -> None:
+        self.info.transaction_status = 0
+
+
+class ConnectionPoolTests(TestCase):
+    def test_reuse_connections(self) -> None:
+        """
+        Tests that released connections are handed out again instead of new ones being opened.
+        """
+        pool = ConnectionPool(max_size=2, timeout=1, check=lambda connection: connection.usable)
+        first = pool.acquire(FakeConnection)
+        pool.release(first)
+        self.assertIs(pool.acquire(FakeConnection), first)
+        second = pool.acquire(FakeConnection)
+        self.assertIsNot(second, first)
+
+        stats = pool.get_stats()
+        self.assertEqual(stats["size"], 2)
+        self.assertEqual(stats["in_use"], 2)
+        self.assertEqual(stats["acquired"], 3)
+
+        pool.release(first)
+        pool.release(second)
+        pool.close()
+        self.assertTrue(first.closed and second.closed)
+        self.assertEqual(pool.get_stats()["size"], 0)
+
+    def test_wait_for_connection(self) -> None:
+        """
+        Tests that a thread waits for a connection when all are in use, and that it gives up after
+        the timeout.
+        """
+        pool = ConnectionPool(max_size=1, timeout=0.05, check=lambda connection: True)
+        connection = pool.acquire(FakeConnection)
+        with self.assertRaises(PoolTimeoutError):
+            pool.acquire(FakeConnection)
+        self.assertEqual(pool.get_stats()["timeouts"], 1)
+
+        pool.timeout = 5
+        timer = threading.Timer(0.05, pool.release, [connection])
+        timer.start()
+        self.assertIs(pool.acquire(FakeConnection), connection)
+        timer.join()
+        stats = pool.get_stats()
+        self.assertEqual(stats["waited"], 1)
+        self.assertGreater(stats["max_wait_time_ms"], 0)
+
+        # A discarded connection makes room for a new one
+        pool.discard(connection)
+        self.assertTrue(connection.closed)
+        self.assertIsNot(pool.acquire(FakeConnection), connection)
+
+    def test_check_connections(self) -> None:
+        """
+        Tests that idle connections are checked before they are used again and replaced if they
+        no longer work.
+        """
+        pool = ConnectionPool(max_size=1, timeout=1, check=lambda connection: connection.usable)
+        connection = pool.acquire(FakeConnection)
+        connection.usable = False
+        pool.release(connection)
+
+        new_connection = pool.acquire(FakeConnection)
+        self.assertIsNot(new_connection, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.get_stats()["failed_checks"], 1)
+        self.assertEqual(pool.get_stats()["size"], 1)
+
+        # Connections that were used recently are not checked
+        pool.check_interval = 60
+        new_connection.usable = False
+        pool.release(new_connection)
+        self.assertIs(pool.acquire(FakeConnection), new_connection)
+
+
+class FakePsycopg():
+    """
+    Takes the place of the psycopg module for PooledDatabaseWrapperTests, so connections can be
+    opened without a PostgreSQL server.
+    """
+    Error = Exception
+    OperationalError = ConnectionError
+    connect = FakeConnection
+
+
+if PooledDatabaseWrapper is not None:
+    class FakePooledDatabaseWrapper(PooledDatabaseWrapper):
+        Database = FakePsycopg
+
+
+@skipIf(PooledDatabaseWrapper is None, "psycopg is not installed")
+class PooledDatabaseWrapperTests(TestCase):
+    ALIAS = "pooled"
+
+    def setUp(self) -> None:
+        self.settings_dict = {
+            **connection.settings_dict, "ENGINE": "backend.db.postgresql", "NAME": "pooled",
+            "OPTIONS": {}, "CONN_MAX_AGE": 0, "AUTOCOMMIT": True,
+            "POOL": {"MAX_SIZE": 1, "TIMEOUT": 0.05, "CHECK_INTERVAL": 60},
+        }
+        self.addCleanup(lambda: pools.pop(self.ALIAS).close())
+
+    def connect(self) -> PooledDatabaseWrapper:
+        """
+        Returns a database wrapper with a connection taken from the pool, like connect() leaves
+        it, without the queries it runs on a new connection.
+        """
+        wrapper = FakePooledDatabaseWrapper(self.settings_dict, self.ALIAS)
+        wrapper.connection = wrapper.get_new_connection({"dbname": "pooled"})
+        wrapper.autocommit = True
+        wrapper.close_at = time.monotonic()
+        return wrapper
+
+    def test_close(self) -> None:
+        """
+        Tests that closing a connection gives it back to the pool, with its transaction rolled
+        back, unless it is closed inside an atomic block.
+        """
+        wrapper = self.connect()
+        pooled_connection = wrapper.connection
+        pooled_connection.info.transaction_status = 2
+        wrapper.close()
+        self.assertIsNone(wrapper.connection)
+        self.assertFalse(pooled_connection.closed)
+        self.assertEqual(pooled_connection.info.transaction_status, 0)
+        self.assertEqual(pools[self.ALIAS].get_stats()["idle"], 1)
+
+        # The pool holds a single connection, so the next wrapper gets the same one
+        wrapper = self.connect()
+        self.assertIs(wrapper.connection, pooled_connection)
+        wrapper.in_atomic_block = True
+        wrapper._close()
+        self.assertTrue(pooled_connection.closed)
+        self.assertEqual(pools[self.ALIAS].get_stats()["size"], 0)
+
+    def test_request_finished(self) -> None:
+        """
+        Tests that the connection of a request is given back to the pool when the request ends,
+        so the next request can have it.
+        """
+        wrapper = self.connect()
+        pooled_connection = wrapper.connection
+        with self.assertRaises(FakePsycopg.OperationalError):
+            self.connect()
+
+        # What close_old_connections(), connected to request_finished, does for each database
+        wrapper.close_if_unusable_or_obsolete()
+        self.assertEqual(pools[self.ALIAS].get_stats()["in_use"], 0)
+        self.assertIs(self.connect().connection, pooled_connection)
@@ -1,10 +1,18 @@
-import mimetypes
-from django.http import FileResponse, HttpRequest, HttpResponse
+from django.conf import settings
+from django.http import FileResponse, HttpRequest, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from . import static
 
 
 def static_files(request: HttpRequest) -> HttpResponse:
     """
-    Returns the static file at the given path, or the index.html file when appropriate.
+    Returns the static file at the given path, or the index.html file when appropriate. Small
+    files are kept in memory until they change. A precompressed version of the file is returned
+    if the client accepts it, and the response is 304 (Not Modified) if the client already has the
+    file, judging by If-None-Match or If-Modified-Since. A single range of the file is returned
+    (206 Partial Content) if the client asks for one with a Range header. With STATIC_SENDFILE the
+    web server in front of Django is told to send the file instead.
     """
     path = request.path
 
@@ -13,14 +21,75 @@ def static_files(request: HttpRequest) -> HttpResponse:
     else:
         relative_path = path[1:]
 
-    try:
-        static_file = open("src/static/" + relative_path, "rb")
-    except FileNotFoundError:
+    file_path = static.resolve(relative_path)
+    static_file = static.get_file(file_path) if file_path is not None else None
+    if static_file is None:
         return HttpResponse(status=404)
 
-    file_type = mimetypes.guess_type(path)[0]
+    served, encoding = static_file, None
+    # With X-Accel-Redirect nginx drops Content-Encoding, so it picks a precompressed version of
+    # the file itself (gzip_static)
+    sendfile = settings.STATIC_SENDFILE
+    variants = static.get_variants(static_file) if sendfile != "x-accel-redirect" else []
+    accepted = static.accepted_encodings(request.headers.get("Accept-Encoding", ""))
+    for variant_encoding, variant in variants:
+        if variant_encoding in accepted:
+            served, encoding = variant, variant_encoding
+            break
 
-    return FileResponse(static_file, content_type=file_type)
+    # The headers are the same for a 304 response, which is returned without reading the file
+    headers = HttpResponse(content_type=static.content_type(static_file.path))
+    headers["ETag"] = served.etag
+    headers["Last-Modified"] = http_date(static_file.last_modified)
+    headers["Cache-Control"] = static.cache_control(static_file.path)
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    if variants:
+        patch_vary_headers(headers, ["Accept-Encoding"])
+
+    conditional = get_conditional_response(request, etag=served.etag,
+                                           last_modified=static_file.last_modified,
+                                           response=headers)
+    if conditional is not headers:
+        return conditional
+
+    # The web server sends the file, and answers Range requests, with the headers set here
+    if sendfile == "x-sendfile":
+        headers["X-Sendfile"] = str(served.path)
+        return headers
+    if sendfile == "x-accel-redirect":
+        headers["X-Accel-Redirect"] = static.accel_redirect_uri(served.path)
+        return headers
+
+    headers["Accept-Ranges"] = "bytes"
+    requested = None
+    range_header = request.headers.get("Range")
+    if (range_header is not None and request.method == "GET"
+            and static.if_range_matches(request.headers.get("If-Range"), served.etag,
+                                        static_file.last_modified)):
+        try:
+            requested = static.byte_range(range_header, served.size)
+        except ValueError:
+            headers.status_code = 416
+            headers["Content-Range"] = f"bytes */{served.size}"
+            return headers
+
+    if requested is not None:
+        start, end = requested
+        if served.content is not None:
+            response = HttpResponse(served.content[start:end + 1], status=206)
+        else:
+            response = StreamingHttpResponse(static.read_range(served.path, start, end),
+                                             status=206)
+            response["Content-Length"] = str(end - start + 1)
+        response["Content-Range"] = f"bytes {start}-{end}/{served.size}"
+    elif served.content is not None:
+        response = HttpResponse(served.content)
+    else:
+        response = FileResponse(open(served.path, "rb"))
+    for header, value in headers.items():
+        response[header] = value
+    return response
 
 
 def should_return_index(path: str) -> bool: